@@ -0,0 +1,189 @@
+"""Background job execution for the SaltCtl shell"""
+
+import io
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+_local = threading.local()
+
+
+class _ThreadRoutedStream:
+    """
+    sys.stdout replacement that sends each capturing thread's output (a
+    background job or a daemon session) to its own stream while every
+    other thread writes to the real stream
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def _target(self):
+        return getattr(_local, 'output', None) or self._stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def isatty(self):
+        if in_background():
+            return False
+        return self._stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def in_background() -> bool:
+    """Whether the current thread's output is captured rather than on a terminal"""
+    return getattr(_local, 'output', None) is not None
+
+
+def _install_stream_router():
+    if not isinstance(sys.stdout, _ThreadRoutedStream):
+        sys.stdout = _ThreadRoutedStream(sys.stdout)
+
+
+@contextmanager
+def captured_output(stream):
+    """Send everything the current thread prints to stream"""
+    _install_stream_router()
+    previous = getattr(_local, 'output', None)
+    _local.output = stream
+    try:
+        yield
+    finally:
+        _local.output = previous
+
+
+class Job:
+    """A command line running (or finished) on the job worker pool"""
+
+    def __init__(self, job_id: int, command_line: str, owner=None, username: str = ''):
+        self.id = job_id
+        self.command_line = command_line
+        self.owner = owner
+        self.username = username
+        self.command_id: Optional[int] = None
+        self.output = io.StringIO()
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.failed = False
+        self.error: Optional[str] = None
+        self.announced = False
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def state(self) -> str:
+        if not self.done:
+            return "Running"
+        return "Failed" if self.failed else "Done"
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished if self.finished is not None else time.time()
+        return end - self.started
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def describe(self) -> str:
+        """One-line summary as shown by 'jobs' and completion notices"""
+        line = f"[{self.id}] {self.state:<8} {self.elapsed:8.1f}s  {self.command_line}"
+        if self.command_id is not None:
+            line += f"  (ID: {self.command_id})"
+        return line
+
+
+class JobManager:
+    """Run command lines on a worker pool and track their state"""
+
+    def __init__(self, workers: int = 4):
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: List[Job] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def submit(self, command_line: str, func: Callable[[Job], bool],
+               owner=None, username: str = '') -> Job:
+        """
+        Run func(job) on the worker pool with its stdout captured in job.output
+
+        func returns True if the command failed.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='saltctl-job'
+                )
+            job = Job(self._next_id, command_line, owner, username)
+            self._next_id += 1
+            self._jobs.append(job)
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func: Callable[[Job], bool]):
+        try:
+            with captured_output(job.output):
+                job.failed = bool(func(job))
+        except Exception as e:
+            job.failed = True
+            job.error = str(e)
+            job.output.write(f"Error: {e}\n")
+        finally:
+            job.finished = time.time()
+            job._done.set()
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def list(self, owner=None) -> List[Job]:
+        """All jobs (optionally only those started by owner), oldest first"""
+        with self._lock:
+            return [job for job in self._jobs if owner is None or job.owner is owner]
+
+    def running(self, owner=None) -> List[Job]:
+        return [job for job in self.list(owner) if not job.done]
+
+    def take_finished(self, owner=None) -> List[Job]:
+        """Finished jobs that haven't been announced yet; marks them announced"""
+        finished = []
+        for job in self.list(owner):
+            if job.done and not job.announced:
+                job.announced = True
+                finished.append(job)
+        return finished
+
+    def forget(self, job: Job):
+        """Drop a finished job from the job table"""
+        with self._lock:
+            if job in self._jobs:
+                self._jobs.remove(job)
+
+    def wait_all(self, owner=None):
+        for job in self.running(owner):
+            job.wait()
+
+    def shutdown(self):
+        """Wait for running jobs and stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,145 @@
+"""Content-addressed file store for large salt outputs"""
+
+import os
+import mmap
+import hashlib
+from typing import Iterator, Optional, Tuple
+
+
+def blob_store_path(db_path: str) -> str:
+    """Blob directory of a database, e.g. ~/.saltctl.blobs beside ~/.saltctl.db"""
+    root, _ext = os.path.splitext(os.path.abspath(db_path))
+    return root + '.blobs'
+
+
+class BlobStore:
+    """
+    Files named by the SHA-256 of their content
+
+    A value is stored once however many rows refer to it, as
+    <root>/<first two hex digits>/<rest of the hash>. Files are written
+    to a temporary name and renamed into place, so a blob is either
+    complete or absent. The directory is only created when the first
+    blob is written.
+
+    The store doesn't know which blobs are in use: the database keeps
+    the references and removes what it no longer needs (see
+    SaltCtlDatabase._collect_blobs()).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:])
+
+    @staticmethod
+    def hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def __contains__(self, blob_hash: str) -> bool:
+        return os.path.exists(self.path(blob_hash))
+
+    def put(self, data: bytes) -> str:
+        """Store a value (unless an identical one already is) and return its hash"""
+        blob_hash = self.hash(data)
+        path = self.path(blob_hash)
+        if os.path.exists(path):
+            return blob_hash
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Temporary names start with '.', which hashes() skips. The file is
+        # created with the umask's permissions, like the database itself,
+        # so shells sharing the database can read each other's blobs
+        temp_path = os.path.join(directory, f'.{os.path.basename(path)}.{os.urandom(4).hex()}')
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return blob_hash
+
+    def read(self, blob_hash: Optional[str]) -> Optional[bytes]:
+        """A stored value, or None if it isn't in the store"""
+        if blob_hash is None:
+            return None
+        try:
+            with open(self.path(blob_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def iter_chunks(self, blob_hash: str, chunk_size: int) -> Iterator[bytes]:
+        """
+        A stored value in chunk_size pieces, read through a memory map
+
+        The pages are read by the kernel as the chunks are taken, and
+        only the chunk being yielded is copied. Yields nothing if the
+        value isn't in the store.
+        """
+        try:
+            f = open(self.path(blob_hash), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap can't map an empty file
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for start in range(0, len(view), chunk_size):
+                    yield view[start:start + chunk_size]
+
+    def copy_from(self, other: 'BlobStore', blob_hash: str) -> bool:
+        """
+        Copy a value from another store, unless this one has it already
+
+        Returns:
+            Whether the value is now in this store
+        """
+        if blob_hash in self:
+            return True
+        data = other.read(blob_hash)
+        if data is None:
+            return False
+        self.put(data)
+        return True
+
+    def remove(self, blob_hash: str) -> bool:
+        """Delete a value; returns whether it was there"""
+        try:
+            os.remove(self.path(blob_hash))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def hashes(self) -> Iterator[str]:
+        """Hashes of every stored value"""
+        if not os.path.isdir(self.root):
+            return
+        for prefix in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.startswith('.'):
+                    yield prefix + name
+
+    def usage(self) -> Tuple[int, int]:
+        """(number of stored values, bytes they take)"""
+        count = size = 0
+        for blob_hash in self.hashes():
+            try:
+                size += os.path.getsize(self.path(blob_hash))
+            except FileNotFoundError:
+                continue
+            count += 1
+        return (count, size)
+
+
+# vim: set ts=4 sw=4 et:
@@ -1,44 +1,179 @@
 """Command registry and loader for SaltCtl shell"""
 
-import os
 import importlib
-import inspect
-from typing import Dict
+from collections.abc import Mapping
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
 from .base import BaseCommand
 
 
-def load_commands() -> Dict[str, BaseCommand]:
+class CommandSpec(NamedTuple):
     """
-    Dynamically load all command classes from the commands directory
+    Where to find a command and how to describe it without importing it
 
-    Returns:
-        Dictionary mapping command names to command instances
+    Fields left as None (as for plugin commands) are read from the
+    command itself once it is loaded.
     """
-    commands = {}
-    current_dir = os.path.dirname(__file__)
+    module: str
+    class_name: str
+    summary: Optional[str] = None
+    subcommands: Optional[Tuple[str, ...]] = None
+    completes_minions: Optional[bool] = None
 
-    # Get all Python files in the commands directory
-    for filename in os.listdir(current_dir):
-        if filename.endswith('.py') and filename not in ['__init__.py', 'base.py']:
-            module_name = filename[:-3]  # Remove .py extension
 
-            # Import the module
-            try:
-                module = importlib.import_module(f'.{module_name}', package='commands')
+# Static manifest of built-in commands: name -> (module, class, first help line,
+# subcommands, whether arguments are minion names).
+# Keep in sync with the command classes; tests/commands/test_registry.py checks it.
+COMMAND_MANIFEST: Dict[str, CommandSpec] = {
+    'db': CommandSpec('commands.db', 'DbCommand', "Maintain the history database",
+                      ('archive', 'import', 'optimize', 'recompress', 'reindex', 'stats', 'vacuum'), False),
+    'fg': CommandSpec('commands.jobs', 'FgCommand', "Wait for a background job and show its console output",
+                      (), False),
+    'help': CommandSpec('commands.help', 'HelpCommand', "Show available commands",
+                        (), False),
+    'history': CommandSpec('commands.history', 'HistoryCommand', "Show command history",
+                           ('export', 'full', 'host', 'month', 'trim'), False),
+    'hosts': CommandSpec('commands.hosts', 'ListCommand', "List all available minions",
+                         ('refresh',), False),
+    'jobs': CommandSpec('commands.jobs', 'JobsCommand', "List background jobs",
+                        (), False),
+    'output': CommandSpec('commands.output', 'OutputCommand', "Show output from executed commands",
+                          ('search',), False),
+    'package': CommandSpec('commands.package', 'PackageCommand', "Manage packages on selected hosts",
+                           ('upgrade', 'install', 'reinstall', 'remove'), False),
+    'ping': CommandSpec('commands.ping', 'PingCommand', "Test connectivity to selected hosts using test.ping",
+                        (), False),
+    'push': CommandSpec('commands.push', 'PushCommand', "Run salt test or apply on selected hosts.",
+                        ('test', 'apply'), False),
+    'qsp': CommandSpec('commands.qsp', 'QspCommand', "Run pkg.upgrade on selected hosts",
+                       (), False),
+    'select': CommandSpec('commands.select', 'SelectCommand', "Select hosts to operate on. Patterns match partial names by default.",
+                          (), True),
+    'stats': CommandSpec('commands.stats', 'StatsCommand', "Show command counts, durations and failure rates",
+                         ('hosts', 'user', 'verb'), False),
+    'status': CommandSpec('commands.status', 'StatusCommand', "Show currently selected hosts",
+                          (), False),
+    'systemctl': CommandSpec('commands.systemctl', 'SystemctlCommand', "Run systemctl commands on selected hosts",
+                             ('restart', 'start', 'stop', 'reload', 'status', 'enable', 'disable'), False),
+    'wait': CommandSpec('commands.jobs', 'WaitCommand', "Wait for all background jobs started in this shell to finish",
+                        (), False),
+}
+
+# Entry point group third-party packages use to register extra commands.
+# Each entry point is named after the command, e.g. "mycmd = mypkg.cmds:MyCommand"
+ENTRY_POINT_GROUP = 'saltctl.commands'
+
+
+def _iter_entry_points(group: str):
+    """Yield installed entry points for a group (empty on Pythons without importlib.metadata)"""
+    try:
+        from importlib import metadata
+    except ImportError:
+        return
+
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        yield from eps.select(group=group)
+    else:
+        yield from eps.get(group, [])
 
-                # Find all classes that inherit from BaseCommand
-                for name, obj in inspect.getmembers(module, inspect.isclass):
-                    if issubclass(obj, BaseCommand) and obj is not BaseCommand:
-                        # Instantiate the command
-                        cmd_instance = obj()
 
-                        # Register command by its name
-                        commands[cmd_instance.name] = cmd_instance
+class CommandRegistry(Mapping):
+    """
+    Mapping of command names to command instances
+
+    Command names and summaries come from the manifest, so listing and
+    prefix matching never import command modules. A command's module is
+    only imported (and the command instantiated) on first lookup.
+    """
 
+    def __init__(self, manifest: Dict[str, CommandSpec], entry_point_group: Optional[str] = None):
+        self._specs: Dict[str, CommandSpec] = dict(manifest)
+        self._instances: Dict[str, BaseCommand] = {}
+        # Reading installed entry points costs more than the rest of startup
+        # combined, so plugins are only looked up once a name isn't built in
+        self._entry_point_group = entry_point_group
+
+    def _load_plugins(self):
+        """Register third-party commands from installed entry points (once)"""
+        group = self._entry_point_group
+        if not group:
+            return
+        self._entry_point_group = None
+        try:
+            for ep in _iter_entry_points(group):
+                module_name, _, class_name = ep.value.partition(':')
+                if ep.name in self._specs:
+                    print(f"Warning: Ignoring plugin command '{ep.name}' (name already in use)")
+                    continue
+                self._specs[ep.name] = CommandSpec(module_name.strip(), class_name.strip())
+        except Exception as e:
+            print(f"Warning: Failed to read plugin commands: {e}")
+
+    def __getitem__(self, name: str) -> BaseCommand:
+        if name not in self._instances:
+            if name not in self._specs:
+                self._load_plugins()
+            spec = self._specs[name]
+            try:
+                module = importlib.import_module(spec.module)
+                self._instances[name] = getattr(module, spec.class_name)()
             except Exception as e:
-                print(f"Warning: Failed to load command module '{module_name}': {e}")
+                print(f"Warning: Failed to load command module '{spec.module}': {e}")
+                raise KeyError(name)
+        return self._instances[name]
 
-    return commands
+    def __contains__(self, name) -> bool:
+        if name not in self._specs:
+            self._load_plugins()
+        return name in self._specs
+
+    def __iter__(self) -> Iterator[str]:
+        self._load_plugins()
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        self._load_plugins()
+        return len(self._specs)
+
+    def summary(self, name: str) -> str:
+        """First line of a command's help text, loading the command only if the manifest lacks it"""
+        spec = self._specs[name]
+        if spec.summary is not None:
+            return spec.summary
+        try:
+            return self[name].help_text.split('\n')[0]
+        except KeyError:
+            return "(failed to load)"
+
+    def subcommands(self, name: str) -> Tuple[str, ...]:
+        """Subcommands accepted as a command's first argument"""
+        spec = self._specs[name]
+        if spec.subcommands is not None:
+            return spec.subcommands
+        try:
+            return tuple(self[name].subcommands)
+        except KeyError:
+            return ()
+
+    def completes_minions(self, name: str) -> bool:
+        """Whether a command's arguments are minion names"""
+        spec = self._specs[name]
+        if spec.completes_minions is not None:
+            return spec.completes_minions
+        try:
+            return self[name].completes_minions
+        except KeyError:
+            return False
+
+
+def load_commands() -> CommandRegistry:
+    """
+    Build the command registry from the built-in manifest and installed plugins
+
+    Returns:
+        Registry mapping command names to (lazily loaded) command instances
+    """
+    return CommandRegistry(COMMAND_MANIFEST, ENTRY_POINT_GROUP)
 
 
 # vim: set ts=4 sw=4 et:
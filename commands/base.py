@@ -1,8 +1,13 @@
 """Base command class for SaltCtl shell commands"""
 
 import os
+import sys
 import subprocess
 from abc import ABC, abstractmethod
+from typing import Iterable, Union
+from timing import timer
+from background import in_background
+from results import parse_salt_output
 
 
 class BaseCommand(ABC):
@@ -25,6 +30,22 @@ class BaseCommand(ABC):
         """Whether this command should be logged in history (default: True)"""
         return True
 
+    @property
+    def can_run_in_background(self) -> bool:
+        """Whether the command may be started as a background job with '&'"""
+        # Commands that run salt are the ones logged in history
+        return self.log_in_history
+
+    @property
+    def subcommands(self) -> tuple:
+        """Subcommands offered by tab completion for the first argument"""
+        return ()
+
+    @property
+    def completes_minions(self) -> bool:
+        """Whether tab completion should offer minion names for arguments"""
+        return False
+
     def require_selected_hosts(self, shell) -> bool:
         """Ensure the current shell has selected hosts"""
         if not shell.selected_hosts:
@@ -36,8 +57,80 @@ class BaseCommand(ABC):
         """Validate command arguments before execution"""
         return True
 
-    def _display_with_pager(self, content: str) -> None:
-        """Display content through a pager if available"""
+    def _run_salt(self, shell, salt_cmd):
+        """
+        Run a salt command to completion, capturing its output
+
+        A non-zero exit status (or salt not being runnable) marks the
+        command as failed on the shell.
+        """
+        with timer.phase('subprocess wait'):
+            try:
+                result = subprocess.run(
+                    salt_cmd,
+                    capture_output=True,
+                    text=True
+                )
+            except Exception:
+                shell.mark_failed()
+                raise
+        if result.returncode != 0:
+            shell.mark_failed()
+        return result
+
+    def _log_salt_result(self, shell, salt_command: str, function: str, result) -> str:
+        """
+        Store a salt run's output, and its per-minion results, against the current command
+
+        Args:
+            salt_command: Label stored with the output (e.g. "apply")
+            function: Salt function that was run, used to interpret each minion's return
+            result: Completed salt process
+
+        Returns:
+            The combined stdout and stderr
+        """
+        output = result.stdout + result.stderr
+        minion_results = parse_salt_output(result.stdout, shell.selected_hosts,
+                                           function, result.returncode)
+        with timer.phase('db writes'):
+            shell.db.log_salt_output(
+                shell.last_command_id,
+                salt_command,
+                output,
+                result.returncode,
+                minion_results
+            )
+        return output
+
+    def _display_with_pager(self, content: Union[str, Iterable[str]]) -> None:
+        """
+        Display content through a pager if available
+
+        content may be a string, or an iterable of text chunks that is
+        written to the pager as it is produced (so a large stored output
+        is never held in memory whole).
+        """
+        chunks = [content] if isinstance(content, str) else content
+        try:
+            # Background jobs capture their output for 'fg' instead
+            if in_background():
+                self._print_chunks(chunks)
+                return
+            with timer.phase('pager'):
+                self._page(chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @staticmethod
+    def _print_chunks(chunks: Iterable[str]) -> None:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        sys.stdout.write('\n')
+
+    def _page(self, chunks: Iterable[str]) -> None:
+        """Pipe content through the configured pager, falling back to print"""
         # Check for SALTCTL_PAGER first, then fall back to PAGER
         pager = os.environ.get('SALTCTL_PAGER')
         if pager is None:
@@ -45,7 +138,7 @@ class BaseCommand(ABC):
 
         # If either is explicitly set to empty string, skip paging
         if pager == '':
-            print(content)
+            self._print_chunks(chunks)
             return
 
         # Use pager if set, otherwise default to 'less -RFX'
@@ -64,11 +157,20 @@ class BaseCommand(ABC):
                 stdout=None,  # Use parent's stdout
                 stderr=None   # Use parent's stderr
             )
-            process.communicate(input=content.encode('utf-8'))
-            process.wait()
         except (OSError, subprocess.SubprocessError):
             # If pager fails, fall back to regular print
-            print(content)
+            self._print_chunks(chunks)
+            return
+
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk.encode('utf-8'))
+            process.stdin.close()
+        except BrokenPipeError:
+            # The user quit the pager before reaching the end
+            pass
+        finally:
+            process.wait()
 
     @abstractmethod
     def execute(self, shell, args: str) -> bool:
@@ -76,4 +178,27 @@ class BaseCommand(ABC):
         pass
 
 
+def progress_printer(verb: str, noun: str = "outputs"):
+    """Progress callback for batched maintenance, printing every 10% rather than every batch"""
+    reported = -1
+
+    def progress(done, total):
+        nonlocal reported
+        percent = done * 100 // total if total else 100
+        if percent // 10 > reported:
+            reported = percent // 10
+            print(f"  {done}/{total} {noun} {verb} ({percent}%)")
+
+    return progress
+
+
+def format_size(size: int) -> str:
+    """Human-readable byte count"""
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
 # vim: set ts=4 sw=4 et:
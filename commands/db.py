@@ -0,0 +1,230 @@
+"""DB command - maintain the history database"""
+
+import os
+import sqlite3
+from datetime import date
+from config import SaltCtlConfig
+from .base import BaseCommand, format_size, progress_printer
+
+
+class DbCommand(BaseCommand):
+    """Maintain the history database"""
+
+    @property
+    def name(self) -> str:
+        return "db"
+
+    @property
+    def help_text(self) -> str:
+        return """Maintain the history database
+Usage: db <archive|import|optimize|recompress|reindex|stats|vacuum>
+    db archive          - Move history older than history.archive_months into monthly archive files
+    db archive 6        - Keep only the last 6 months in the main database
+    db import <path>    - Merge another saltctl database's history and output into this one
+    db optimize         - Refresh query planner statistics and check the database's integrity
+    db optimize --vacuum - Also compact the file while other shells keep working
+    db recompress       - Re-encode stored output with the configured codec (database.output_codec)
+    db recompress lzma  - Re-encode stored output with the given codec ('none' stores plain text)
+    db reindex          - Rebuild the full-text index used by 'output search'
+    db stats            - Show file and page sizes, rows and size per table, indexes and the largest outputs
+    db vacuum           - Rebuild the file, shrinking it and letting 'history trim' free space from then on"""
+
+    @property
+    def subcommands(self) -> tuple:
+        return ('archive', 'import', 'optimize', 'recompress', 'reindex', 'stats', 'vacuum')
+
+    @property
+    def log_in_history(self) -> bool:
+        return False
+
+    @property
+    def can_run_in_background(self) -> bool:
+        # Maintenance over a large history can take a while
+        return True
+
+    def execute(self, shell, args: str) -> bool:
+        words = args.lower().split()
+        subcommand = words[0] if words else ""
+
+        if subcommand == "import":
+            # Keep the path as typed (case and spaces)
+            return self._import(shell, args.split(None, 1)[1].strip() if len(words) > 1 else "")
+        if subcommand == "archive":
+            return self._archive(shell, words[1:])
+        if subcommand == "optimize":
+            return self._optimize(shell, words[1:])
+        if subcommand == "recompress":
+            return self._recompress(shell, words[1:])
+        if subcommand == "reindex":
+            return self._reindex(shell)
+        if subcommand == "stats":
+            return self._stats(shell)
+        if subcommand == "vacuum":
+            return self._vacuum(shell)
+
+        print(self.help_text)
+        if subcommand:
+            shell.mark_failed()
+        return False
+
+    def _archive(self, shell, args) -> bool:
+        """Move old history into monthly archive files"""
+        months = shell.config.history_archive_months
+        if args:
+            months = int(args[0]) if len(args) == 1 and args[0].isdigit() else 0
+        if months < 1:
+            print("Usage: db archive [months to keep]")
+            shell.mark_failed()
+            return False
+
+        # Archives hold whole months: everything before the first day of
+        # the month 'months' back from this one
+        today = date.today()
+        index = today.year * 12 + today.month - 1 - months
+        cutoff = date(index // 12, index % 12 + 1, 1)
+
+        print(f"Archiving history from before {cutoff:%Y-%m}...")
+        moved, outputs, files = shell.db.archive_old_history(
+            cutoff.isoformat(), progress=progress_printer("archived", "commands"))
+        if moved == 0:
+            print("Nothing to archive.")
+            return False
+
+        print(f"Moved {moved} commands and {outputs} outputs into {files} monthly archive files.")
+        return False
+
+    def _import(self, shell, path: str) -> bool:
+        """Merge another history database into this one"""
+        if not path:
+            print("Usage: db import <path>")
+            shell.mark_failed()
+            return False
+
+        path = os.path.expanduser(path)
+        print(f"Importing history from {path}...")
+        try:
+            imported, outputs, skipped = shell.db.import_history(
+                path, progress=progress_printer("checked", "commands"))
+        except (ValueError, sqlite3.Error) as e:
+            print(f"Error: {e}")
+            shell.mark_failed()
+            return False
+
+        print(f"Imported {imported} commands and {outputs} outputs ({skipped} already present).")
+        return False
+
+    def _optimize(self, shell, args) -> bool:
+        """Analyze, check and optionally compact the database"""
+        if args not in ([], ['--vacuum']):
+            print("Usage: db optimize [--vacuum]")
+            shell.mark_failed()
+            return False
+
+        vacuum = bool(args)
+        print("Analyzing and checking the history database...")
+        try:
+            problems, before, after = shell.db.optimize(vacuum=vacuum)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            shell.mark_failed()
+            return False
+
+        if problems:
+            print("Integrity check FAILED:")
+            for problem in problems:
+                print(f"  {problem}")
+            if vacuum:
+                print("The database was not compacted.")
+            shell.mark_failed()
+            return False
+
+        print("Statistics updated; integrity check passed.")
+        if vacuum:
+            print(f"Database size: {format_size(before)} -> {format_size(after)}.")
+        return False
+
+    def _recompress(self, shell, args) -> bool:
+        """Re-encode every stored output with a codec"""
+        codecs = SaltCtlConfig.OUTPUT_CODECS
+        codec = args[0] if args else shell.config.db_output_codec
+        if len(args) > 1 or codec not in codecs:
+            print(f"Usage: db recompress [{'|'.join(codecs)}]")
+            shell.mark_failed()
+            return False
+
+        print(f"Recompressing stored output with '{codec}'...")
+        converted, before, after = shell.db.recompress(codec, progress=progress_printer("checked"))
+        if converted == 0:
+            print("All stored output already uses this codec.")
+            return False
+
+        print(f"Converted {converted} outputs: {format_size(before)} -> {format_size(after)}.")
+        return False
+
+    def _reindex(self, shell) -> bool:
+        """Rebuild the output search index"""
+        print("Rebuilding the output search index...")
+        try:
+            count = shell.db.reindex_outputs(progress=progress_printer("indexed"))
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            shell.mark_failed()
+            return False
+
+        print(f"Indexed {count} outputs.")
+        return False
+
+
+    def _stats(self, shell) -> bool:
+        """Show the database's size and layout"""
+        stats = shell.db.database_stats()
+        lines = [
+            f"Database: {stats.path} (schema v{stats.schema_version}, journal {stats.journal_mode}, "
+            f"auto_vacuum {stats.auto_vacuum})",
+            f"File size: {format_size(stats.file_size)}"
+            + (f" (+ {format_size(stats.wal_size)} write-ahead log)" if stats.wal_size else ""),
+            f"Pages: {stats.page_count} of {stats.page_size} bytes, {stats.freelist_count} free "
+            f"({format_size(stats.freelist_count * stats.page_size)} reclaimable)",
+            "",
+            "Tables:",
+        ]
+        width = max(len(name) for name, _rows, _size in stats.tables)
+        for name, rows, size in stats.tables:
+            lines.append(f"  {name:<{width}}  {rows:>10} rows  {_optional_size(size):>10}")
+        if stats.search_index_size is not None:
+            lines.append(f"  {'(search index)':<{width}}  {'':>15}  {format_size(stats.search_index_size):>10}")
+        if stats.blob_count:
+            lines.append(f"  {'(blob store)':<{width}}  {stats.blob_count:>10} files  "
+                         f"{format_size(stats.blob_size):>9}")
+
+        lines.extend(["", "Indexes:"])
+        width = max(len(name) for name, *_ in stats.indexes)
+        for name, table, size, per_key in stats.indexes:
+            selectivity = f"{per_key} rows/key" if per_key is not None else "not analyzed"
+            lines.append(f"  {name:<{width}}  {_optional_size(size):>10}  {selectivity}")
+        if any(per_key is None for *_, per_key in stats.indexes):
+            lines.append("  (Run 'db optimize' to gather index statistics.)")
+
+        if stats.largest_outputs:
+            lines.extend(["", "Largest outputs:"])
+            for command_id, command, size, codec in stats.largest_outputs:
+                lines.append(f"  [ID: {command_id}] {format_size(size):>10} ({codec or 'plain'})  {command or ''}")
+
+        self._display_with_pager('\n'.join(lines))
+        return False
+
+    def _vacuum(self, shell) -> bool:
+        """Rebuild the database file with incremental auto_vacuum"""
+        print("Rebuilding the history database (other shells wait until this finishes)...")
+        before, after = shell.db.vacuum()
+        print(f"Database size: {format_size(before)} -> {format_size(after)}.")
+        return False
+
+
+
+def _optional_size(size) -> str:
+    """Size from dbstat, which not every SQLite has"""
+    return format_size(size) if size is not None else "-"
+
+
+# vim: set ts=4 sw=4 et:
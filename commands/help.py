@@ -34,10 +34,9 @@ Usage: help [command]"""
             # Show all commands
             print("\nAvailable commands:")
             for cmd_name in sorted(shell.commands.keys()):
-                cmd = shell.commands[cmd_name]
-
-                # Get first line of help text
-                first_line = cmd.help_text.split('\n')[0]
+                # First line of help text comes from the manifest, so
+                # listing commands doesn't import them
+                first_line = shell.commands.summary(cmd_name)
                 print(f"  {cmd_name:<15} - {first_line}")
 
             # Add built-in commands
@@ -1,8 +1,23 @@
 """History command - show command history"""
 
-import json
+import os
 from datetime import datetime, timedelta
-from .base import BaseCommand
+from typing import Iterator
+from export import FORMATS, export_history, open_export
+from .base import BaseCommand, format_size, progress_printer
+
+# Browsing filters: option -> iter_command_history() keyword
+_FILTER_OPTIONS = {
+    '--user': 'username',
+    '--command': 'verb',
+    '--since': 'since',
+    '--until': 'until',
+    '--before': 'before',
+    '--after': 'after',
+}
+
+# Accepted --since/--until formats (local time)
+_DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S')
 
 
 class HistoryCommand(BaseCommand):
@@ -15,21 +30,63 @@ class HistoryCommand(BaseCommand):
     @property
     def help_text(self) -> str:
         return """Show command history
-Usage: history [full|trim]
-    history       - Show commands for currently selected hosts
-    history full  - Show all command history
-    history trim  - Delete old entries (configurable via history.trim_days)"""
+Usage: history [full|host <name>] [filters] | month <YYYY-MM> | export [options] | trim [--dry-run]
+    history             - Show commands run against any currently selected host
+    history full        - Show all command history
+    history host <name> - Show commands run against one host
+Filters browse all matching history, newest first, paging as you scroll:
+    --user <name>       - Commands run by one user
+    --command <name>    - One command, e.g. --command push
+    --since <date>      - Commands at or after a date (YYYY-MM-DD[THH:MM[:SS]])
+    --until <date>      - Commands before a date
+    --before <id>       - Commands older than a command ID
+    --after <id>        - Commands newer than a command ID (oldest first)
+Archived months are only read with --since, or --before/--after an archived command.
+    history month 2024-01 - Show every command from one month, including archived months
+    history export      - Write all history, oldest first, as JSON Lines to stdout
+    history export --format csv --since 2024-01-01 --with-output --output history.csv.gz --gzip
+                        - CSV from a date on, with stored output, gzipped into a file
+    history trim        - Delete old entries (configurable via history.trim_days)
+    history trim --dry-run - Show what trim would delete and roughly how much space it frees"""
+
+    @property
+    def subcommands(self) -> tuple:
+        return ('export', 'full', 'host', 'month', 'trim')
 
     @property
     def log_in_history(self) -> bool:
         return False
 
     def execute(self, shell, args: str) -> bool:
-        arg = args.strip().lower()
+        words = args.split()
+        arg = words[0].lower() if words else ""
 
         # Handle trim command
         if arg == "trim":
-            return self._trim_history(shell)
+            if words[1:] not in ([], ['--dry-run']):
+                print("Usage: history trim [--dry-run]")
+                shell.mark_failed()
+                return False
+            return self._trim_history(shell, dry_run=len(words) > 1)
+
+        if arg == "month":
+            return self._show_month(shell, words[1:])
+
+        if arg == "export":
+            return self._export(shell, words[1:])
+
+        options = [index for index, word in enumerate(words) if word.startswith('--')]
+        if options:
+            return self._browse(shell, words[:options[0]], words[options[0]:])
+
+        if arg == "host":
+            if len(words) != 2:
+                print("Usage: history host <name>")
+                shell.mark_failed()
+                return False
+            host = words[1]
+            rows = shell.db.get_command_history(selected_hosts=[host], limit=50)
+            return self._show_rows(rows, f"Command history for {host} (last 50):")
 
         # Get command history from database
         # Default to 'full' if no hosts selected
@@ -41,50 +98,141 @@ Usage: history [full|trim]
             rows = shell.db.get_command_history(selected_hosts=shell.selected_hosts, limit=50)
             header = f"Command history for selected hosts (last 50):"
 
+        return self._show_rows(rows, header)
+
+    def _export(self, shell, options) -> bool:
+        """Stream history (and optionally output) to a file or stdout"""
+        fmt, since, until, path = 'jsonl', None, None, None
+        with_output = compress = False
+        options = list(options)
+        try:
+            while options:
+                option = options.pop(0)
+                if option in ('--with-output', '--gzip'):
+                    with_output = with_output or option == '--with-output'
+                    compress = compress or option == '--gzip'
+                    continue
+                if option not in ('--format', '--since', '--until', '--output'):
+                    raise ValueError(f"Unknown option '{option}'")
+                if not options:
+                    raise ValueError(f"{option} needs a value")
+                value = options.pop(0)
+                if option == '--format':
+                    if value.lower() not in FORMATS:
+                        raise ValueError(f"Unknown format '{value}'")
+                    fmt = value.lower()
+                elif option == '--since':
+                    since = _parse_date(value)
+                elif option == '--until':
+                    until = _parse_date(value)
+                else:
+                    path = os.path.expanduser(value)
+        except ValueError as e:
+            print(f"Error: {e}")
+            print(f"Usage: history export [--format {'|'.join(FORMATS)}] [--since <date>] [--until <date>] "
+                  "[--with-output] [--output <file>] [--gzip]")
+            shell.mark_failed()
+            return False
+
+        try:
+            with open_export(path, compress) as out:
+                records = shell.db.iter_history_export(since=since, until=until, with_output=with_output)
+                count = export_history(records, out, fmt, with_output)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            shell.mark_failed()
+            return False
+
+        if path is not None:
+            print(f"Exported {count} commands to {path}.")
+        return False
+
+    def _show_rows(self, rows, header: str) -> bool:
+        """Page history rows (newest first) in chronological order"""
         if not rows:
             print("  No history found.")
             return False
 
-        # Build output
-        lines = [header]
-
         # Display results in chronological order (oldest to newest)
-        for row in reversed(rows):
-            cmd_id, timestamp, username, selected_hosts_json, command, duration = row
-            hosts = json.loads(selected_hosts_json) if selected_hosts_json else []
-
-            # Format timestamp (remove microseconds)
-            ts = timestamp.split('.')[0] if '.' in timestamp else timestamp
+        content = header + ''.join(_format_entry(row) for row in reversed(rows))
+        self._display_with_pager(content)
 
-            # Format duration
-            if duration is not None:
-                duration_str = f"{duration:.3f}s"
-            else:
-                duration_str = "N/A"
+        return False
 
-            # Format hosts
-            if hosts:
-                hosts_str = ', '.join(hosts)
-            else:
-                hosts_str = "(none)"
+    def _browse(self, shell, positional, options) -> bool:
+        """Stream every matching entry into the pager, fetching pages as it is read"""
+        try:
+            filters = _parse_filters(options)
+        except ValueError as e:
+            print(f"Error: {e}")
+            print("Usage: history [full|host <name>] [--user <name>] [--command <name>] "
+                  "[--since <date>] [--until <date>] [--before <id>|--after <id>]")
+            shell.mark_failed()
+            return False
 
-            lines.append(f"\n[ID: {cmd_id}] [{ts}] {username} ({duration_str}) - Hosts: {hosts_str}")
-            lines.append(f"  Command: {command}")
+        arg = positional[0].lower() if positional else ""
+        if arg == "host" and len(positional) == 2:
+            hosts, scope = [positional[1]], f" for {positional[1]}"
+        elif not positional or arg == "full" and len(positional) == 1:
+            show_all = arg == "full" or not shell.selected_hosts
+            hosts = None if show_all else shell.selected_hosts
+            scope = "" if show_all else " for selected hosts"
+        else:
+            print("Usage: history [full|host <name>] [filters]")
+            shell.mark_failed()
+            return False
 
-        content = '\n'.join(lines)
-        self._display_with_pager(content)
+        try:
+            rows = shell.db.iter_command_history(selected_hosts=hosts, **filters)
+            first = next(rows, None)
+        except ValueError as e:
+            print(f"Error: {e}")
+            shell.mark_failed()
+            return False
+        if first is None:
+            print("  No history found.")
+            return False
 
+        order = "oldest first" if 'after' in filters else "newest first"
+        header = f"Command history{scope} ({order}):"
+        self._display_with_pager(_entry_chunks(header, first, rows))
         return False
 
-    def _trim_history(self, shell) -> bool:
+    def _show_month(self, shell, args) -> bool:
+        """Show a whole month of history (archive files are read if needed)"""
+        try:
+            start = datetime.strptime(args[0], '%Y-%m') if len(args) == 1 else None
+        except ValueError:
+            start = None
+        if start is None:
+            print("Usage: history month <YYYY-MM>")
+            shell.mark_failed()
+            return False
+
+        end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        rows = shell.db.get_command_history(selected_hosts=None, limit=None,
+                                            since=int(start.timestamp()), until=int(end.timestamp()))
+        return self._show_rows(rows, f"Command history for {args[0]}:")
+
+    def _trim_history(self, shell, dry_run: bool = False) -> bool:
         """Delete history entries older than configured trim_days"""
         # Calculate cutoff date
         trim_days = shell.config.history_trim_days
         cutoff_date = datetime.now() - timedelta(days=trim_days)
         cutoff_iso = cutoff_date.isoformat()
 
+        if dry_run:
+            command_count, salt_output_count, size = shell.db.estimate_trim(cutoff_iso)
+            if command_count == 0:
+                print(f"No entries older than {trim_days} days found.")
+                return False
+            print(f"Would delete {command_count} command history entries older than {trim_days} days "
+                  f"and {salt_output_count} associated salt output entries (about {format_size(size)}).")
+            return False
+
         # Trim old history using database method
-        command_count, salt_output_count = shell.db.trim_old_history(cutoff_iso)
+        command_count, salt_output_count = shell.db.trim_old_history(
+            cutoff_iso, progress=progress_printer("deleted", "entries"))
         if command_count == 0:
             print(f"No entries older than {trim_days} days found.")
             return False
@@ -93,7 +241,83 @@ Usage: history [full|trim]
         if salt_output_count > 0:
             print(f"Deleted {salt_output_count} associated salt output entries.")
 
+        if shell.db.auto_vacuum != 'incremental':
+            print("Run 'db vacuum' once to let trims shrink the database file.")
+            return False
+        released = shell.db.reclaim_space()
+        if released:
+            print(f"Released {format_size(released)} to the filesystem.")
+
         return False
 
 
+def _format_entry(row) -> str:
+    """One history entry as shown by 'history'"""
+    cmd_id, timestamp, username, hosts, command, duration = row
+
+    # Format timestamp (remove microseconds)
+    ts = timestamp.split('.')[0] if '.' in timestamp else timestamp
+
+    # Format duration
+    if duration is not None:
+        duration_str = f"{duration:.3f}s"
+    else:
+        duration_str = "N/A"
+
+    # Format hosts
+    hosts_str = hosts if hosts else "(none)"
+
+    return f"\n\n[ID: {cmd_id}] [{ts}] {username} ({duration_str}) - Hosts: {hosts_str}\n  Command: {command}"
+
+
+def _entry_chunks(header: str, first, rows: Iterator[tuple]):
+    """Yield the header and formatted entries, closing the row stream when done or abandoned"""
+    try:
+        yield header
+        yield _format_entry(first)
+        for row in rows:
+            yield _format_entry(row)
+    finally:
+        if hasattr(rows, 'close'):
+            rows.close()
+
+
+def _parse_date(value: str) -> int:
+    """Epoch of a local date or date and time given to --since/--until"""
+    for date_format in _DATE_FORMATS:
+        try:
+            return int(datetime.strptime(value, date_format).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date '{value}' (expected YYYY-MM-DD or YYYY-MM-DDTHH:MM)")
+
+
+def _parse_filters(options) -> dict:
+    """iter_command_history() keyword arguments from browsing options"""
+    filters = {}
+    options = list(options)
+    while options:
+        option = options.pop(0)
+        if option not in _FILTER_OPTIONS:
+            raise ValueError(f"Unknown option '{option}'")
+        if not options:
+            raise ValueError(f"{option} needs a value")
+        key, value = _FILTER_OPTIONS[option], options.pop(0)
+
+        if key in ('since', 'until'):
+            filters[key] = _parse_date(value)
+        elif key in ('before', 'after'):
+            if not value.isdigit():
+                raise ValueError(f"{option} needs a command ID")
+            filters[key] = int(value)
+        elif key == 'verb':
+            filters[key] = value.lower()
+        else:
+            filters[key] = value
+
+    if 'before' in filters and 'after' in filters:
+        raise ValueError("Use either --before or --after, not both")
+    return filters
+
+
 # vim: set ts=4 sw=4 et:
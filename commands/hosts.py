@@ -13,13 +13,24 @@ class ListCommand(BaseCommand):
     @property
     def help_text(self) -> str:
         return """List all available minions
-Usage: hosts"""
+Usage: hosts [refresh]
+    hosts          - List all available minions
+    hosts refresh  - Reload the minion list from salt-key"""
+
+    @property
+    def subcommands(self) -> tuple:
+        return ('refresh',)
 
     @property
     def log_in_history(self) -> bool:
         return False
 
     def execute(self, shell, args: str) -> bool:
+        if args.strip().lower() == "refresh":
+            shell.refresh_minions()
+        else:
+            shell.wait_for_minions()
+
         if shell.all_minions:
             # Build output
             lines = [f"Available minions ({len(shell.all_minions)}):"]
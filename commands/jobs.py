@@ -0,0 +1,118 @@
+"""Job control commands - list, wait for and inspect background jobs"""
+
+from .base import BaseCommand
+
+
+class JobsCommand(BaseCommand):
+    """List background jobs"""
+
+    @property
+    def name(self) -> str:
+        return "jobs"
+
+    @property
+    def help_text(self) -> str:
+        return """List background jobs
+Usage: jobs
+Append '&' to a command to run it in the background, e.g. 'push apply &'"""
+
+    @property
+    def log_in_history(self) -> bool:
+        return False
+
+    def execute(self, shell, args: str) -> bool:
+        jobs = shell.jobs.list()
+        if not jobs:
+            print("No background jobs.")
+            return False
+
+        for job in jobs:
+            line = job.describe()
+            if job.owner is not shell and job.username:
+                line += f"  [{job.username}]"
+            print(line)
+
+        return False
+
+
+class FgCommand(BaseCommand):
+    """Wait for a background job and show its console output"""
+
+    @property
+    def name(self) -> str:
+        return "fg"
+
+    @property
+    def help_text(self) -> str:
+        return """Wait for a background job and show its console output
+Usage: fg [job_id]
+    fg      - Wait for the most recently started job
+    fg 2    - Wait for job 2
+Press Ctrl-C to stop waiting; the job keeps running."""
+
+    @property
+    def log_in_history(self) -> bool:
+        return False
+
+    def execute(self, shell, args: str) -> bool:
+        if args.strip():
+            try:
+                job_id = int(args.strip())
+            except ValueError:
+                print("Error: Job ID must be a number")
+                shell.mark_failed()
+                return False
+            job = shell.jobs.get(job_id)
+        else:
+            jobs = shell.jobs.list(owner=shell)
+            job = jobs[-1] if jobs else None
+
+        if job is None:
+            print("No such job.")
+            shell.mark_failed()
+            return False
+
+        if not job.done:
+            print(f"Waiting for job {job.id}: {job.command_line} (Ctrl-C to stop waiting)")
+            try:
+                job.wait()
+            except KeyboardInterrupt:
+                print(f"\nJob {job.id} is still running in the background.")
+                return False
+
+        job.announced = True
+        header = job.describe()
+        self._display_with_pager(f"{header}\n\n{job.output.getvalue()}")
+        shell.jobs.forget(job)
+        if job.failed:
+            shell.mark_failed()
+
+        return False
+
+
+class WaitCommand(BaseCommand):
+    """Wait for all background jobs to finish"""
+
+    @property
+    def name(self) -> str:
+        return "wait"
+
+    @property
+    def help_text(self) -> str:
+        return """Wait for all background jobs started in this shell to finish
+Usage: wait"""
+
+    @property
+    def log_in_history(self) -> bool:
+        return False
+
+    def execute(self, shell, args: str) -> bool:
+        try:
+            if shell.wait_for_jobs():
+                shell.mark_failed()
+        except KeyboardInterrupt:
+            print("\nStopped waiting; jobs are still running in the background.")
+        return False
+
+
+# vim: set ts=4 sw=4 et:
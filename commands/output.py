@@ -1,8 +1,17 @@
 """Output command - show output from executed commands"""
 
+import re
 import shutil
 from .base import BaseCommand
 
+# Words in a search query that are FTS5 operators rather than search terms
+_QUERY_OPERATORS = {'AND', 'OR', 'NOT', 'NEAR'}
+_SNIPPET_WIDTH = 100
+# Characters of each matching output read to find a snippet
+_SNIPPET_SCAN = 1024 * 1024
+# Hosts listed for each match
+_SEARCH_HOSTS = 10
+
 
 class OutputCommand(BaseCommand):
     """Show output from executed commands"""
@@ -14,21 +23,38 @@ class OutputCommand(BaseCommand):
     @property
     def help_text(self) -> str:
         return """Show output from executed commands
-Usage: output [command_id]
-    output          - Show output from last executed command
-    output 123      - Show output from command with ID 123"""
+Usage: output [command_id [host]] | output search <query>
+    output              - Show output from last executed command
+    output 123          - Show output from command with ID 123
+    output 123 web1     - Show only web1's output from command with ID 123
+    output search text  - Find stored outputs containing text (oldest first).
+                          Supports SQLite full-text syntax: "exact phrase", AND, OR, NOT, prefix*"""
+
+    @property
+    def subcommands(self) -> tuple:
+        return ('search',)
 
     @property
     def log_in_history(self) -> bool:
         return False
 
     def execute(self, shell, args: str) -> bool:
+        words = args.split()
+        if words and words[0] == "search":
+            return self._search(shell, args.strip()[len("search"):].strip())
+
+        if len(words) > 2:
+            print("Usage: output [command_id [host]]")
+            shell.mark_failed()
+            return False
+
         command_id = None
-        if args.strip():
+        if words:
             try:
-                command_id = int(args.strip())
+                command_id = int(words[0])
             except ValueError:
                 print("Error: Command ID must be a number")
+                shell.mark_failed()
                 return False
 
         # Get the command
@@ -39,14 +65,18 @@ Usage: output [command_id]
         if not row:
             if command_id:
                 print(f"No command found with ID {command_id}")
+                shell.mark_failed()
             else:
                 print("No command history found.")
             return False
 
         command_id, command, timestamp = row
 
-        # Get salt output for this command
-        output_row = shell.db.get_salt_output(command_id)
+        if len(words) == 2:
+            return self._show_minion_output(shell, command_id, command, timestamp, words[1])
+
+        # Get salt output for this command (streamed, as it may be huge)
+        output_row = shell.db.iter_salt_output(command_id)
 
         if not output_row:
             print(f"Command ID: {command_id}")
@@ -55,26 +85,156 @@ Usage: output [command_id]
             print("\nNo output available (command did not produce stored output)")
             return False
 
-        salt_command, output, return_code = output_row
+        salt_command, return_code, chunks = output_row
 
         # Get terminal width for separator line
         terminal_width = shutil.get_terminal_size(fallback=(80, 24)).columns
 
-        # Build the complete output
-        content = f"""Command ID: {command_id}
+        # Write the header and separators around the streamed output
+        header = f"""Command ID: {command_id}
 Command: {command}
 Timestamp: {timestamp}
 Return code: {return_code}
 
 {'='*terminal_width}
-{output}
+"""
+        footer = f"""
 {'='*terminal_width}
 """
 
         # Display through pager
+        self._display_with_pager(_framed(header, chunks, footer))
+
+        return False
+
+    def _show_minion_output(self, shell, command_id: int, command: str,
+                            timestamp: str, minion: str) -> bool:
+        """Show one minion's part of a command's output"""
+        output = shell.db.get_minion_output(command_id, minion)
+        if output is None:
+            print(f"No output stored for {minion} from command {command_id}")
+            shell.mark_failed()
+            return False
+
+        terminal_width = shutil.get_terminal_size(fallback=(80, 24)).columns
+        content = f"""Command ID: {command_id}
+Command: {command}
+Timestamp: {timestamp}
+Host: {minion}
+
+{'='*terminal_width}
+{output}
+{'='*terminal_width}
+"""
         self._display_with_pager(content)
 
         return False
 
 
+    def _search(self, shell, query: str) -> bool:
+        """List stored outputs matching a full-text query"""
+        if not query:
+            print("Usage: output search <query>")
+            shell.mark_failed()
+            return False
+
+        try:
+            rows = shell.db.search_outputs(query, limit=50)
+        except RuntimeError as e:
+            print(f"Error: {e}")
+            shell.mark_failed()
+            return False
+
+        unindexed = shell.db.unindexed_output_count()
+        if unindexed:
+            print(f"Note: {unindexed} older outputs are not indexed yet; run 'db reindex' to include them.")
+
+        if not rows:
+            print("  No matching output found.")
+            return False
+
+        terms = _query_terms(query)
+        lines = [f"Outputs matching {query!r} (oldest first, up to 50):"]
+        for command_id, timestamp, command, hosts in rows:
+            ts = timestamp.split('.')[0]
+            line_no, snippet = _output_snippet(shell, command_id, terms)
+            lines.append(f"\n[ID: {command_id}] [{ts}] {command}")
+            if hosts:
+                more = len(hosts) - _SEARCH_HOSTS
+                lines.append(f"  Hosts: {', '.join(hosts[:_SEARCH_HOSTS])}"
+                             + (f" (+{more} more)" if more > 0 else ""))
+            if snippet:
+                lines.append(f"  {line_no}: {snippet}")
+
+        self._display_with_pager('\n'.join(lines))
+        return False
+
+
+def _framed(header: str, chunks, footer: str):
+    """Yield header, the output chunks and footer, closing chunks when done or abandoned"""
+    try:
+        yield header
+        yield from chunks
+        yield footer
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _query_terms(query: str) -> list:
+    """Lower-cased search words in an FTS query, for locating matches in the text"""
+    words = re.findall(r'\w+', query)
+    return [word.lower() for word in words if word not in _QUERY_OPERATORS]
+
+
+def _line_matches(line: str, terms: list) -> bool:
+    lowered = line.lower()
+    return any(term in lowered for term in terms)
+
+
+def _output_snippet(shell, command_id: int, terms: list) -> tuple:
+    """_snippet() of the start of a command's stored output, streamed rather than loaded whole"""
+    output_row = shell.db.iter_salt_output(command_id)
+    if not output_row:
+        return None, None
+    chunks = output_row[2]
+    try:
+        return _snippet(_prefix_lines(chunks, _SNIPPET_SCAN), terms)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _prefix_lines(chunks, limit: int):
+    """Lines of the first limit characters of a chunked output"""
+    pending = ''
+    for chunk in chunks:
+        chunk = chunk[:limit]
+        limit -= len(chunk)
+        lines = (pending + chunk).splitlines(keepends=True)
+        # The last line may continue in the next chunk
+        pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        yield from lines
+        if limit <= 0:
+            break
+    if pending:
+        yield pending
+
+
+def _snippet(lines, terms: list) -> tuple:
+    """(line number, trimmed text) of the first line containing a search term"""
+    for number, line in enumerate(lines, start=1):
+        if not _line_matches(line, terms):
+            continue
+        text = line.strip()
+        if len(text) > _SNIPPET_WIDTH:
+            # Centre the window on the first matching term
+            lowered = text.lower()
+            pos = min(lowered.find(term) for term in terms if term in lowered)
+            start = max(0, min(pos - _SNIPPET_WIDTH // 3, len(text) - _SNIPPET_WIDTH))
+            text = ('...' if start else '') + text[start:start + _SNIPPET_WIDTH] + '...'
+        return number, text
+    return None, None
+
+
 # vim: set ts=4 sw=4 et:
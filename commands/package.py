@@ -1,6 +1,5 @@
 """Package command - manage packages on selected hosts"""
 
-import subprocess
 from .base import BaseCommand
 
 class PackageCommand(BaseCommand):
@@ -21,6 +20,10 @@ Examples:
     package reinstall nginx         - Reinstall nginx package
     package remove apache2          - Remove apache2 package"""
 
+    @property
+    def subcommands(self) -> tuple:
+        return ('upgrade', 'install', 'reinstall', 'remove')
+
     def validate(self, shell, args: str) -> bool:
         if not self.require_selected_hosts(shell):
             return False
@@ -53,22 +56,21 @@ Examples:
         target = shell.build_target_list()
 
         if subcommand == 'upgrade':
-            salt_cmd = shell.build_salt_cmd("salt", "--list", target, "pkg.upgrade")
+            function = "pkg.upgrade"
+            salt_cmd = shell.build_salt_cmd("salt", "--list", target, function)
         elif subcommand == 'reinstall':
+            function = "pkg.install"
             packages = ' '.join(args_list[1:])
-            salt_cmd = shell.build_salt_cmd("salt", "--list", target, "pkg.install", packages, "reinstall=True")
+            salt_cmd = shell.build_salt_cmd("salt", "--list", target, function, packages, "reinstall=True")
         else:  # install or remove
+            function = f"pkg.{subcommand}"
             packages = ' '.join(args_list[1:])
-            salt_cmd = shell.build_salt_cmd("salt", "--list", target, f"pkg.{subcommand}", packages)
+            salt_cmd = shell.build_salt_cmd("salt", "--list", target, function, packages)
 
         print(f"Running: {' '.join(salt_cmd)}")
         try:
-            result = subprocess.run(
-                salt_cmd,
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout + result.stderr
+            result = self._run_salt(shell, salt_cmd)
+            output = self._log_salt_result(shell, function, function, result)
 
             # Display output
             if result.returncode != 0:
@@ -1,6 +1,5 @@
 """Ping command - test connectivity to selected hosts"""
 
-import subprocess
 from .base import BaseCommand
 
 
@@ -26,12 +25,8 @@ Example:
         salt_cmd = shell.build_salt_cmd("salt", "--list", target, "test.ping")
         print(f"Running: {' '.join(salt_cmd)}")
         try:
-            result = subprocess.run(
-                salt_cmd,
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout + result.stderr
+            result = self._run_salt(shell, salt_cmd)
+            output = self._log_salt_result(shell, 'test.ping', 'test.ping', result)
 
             if result.returncode != 0:
                 content = f"{output}\n\nCommand failed with exit code {result.returncode}"
@@ -1,7 +1,6 @@
 """Push command - run salt test or apply on selected hosts"""
 
 import shutil
-import subprocess
 from .base import BaseCommand
 
 
@@ -20,6 +19,10 @@ Examples:
     push test               - Run state.test on selected hosts
     push apply              - Run state.apply on selected hosts"""
 
+    @property
+    def subcommands(self) -> tuple:
+        return ('test', 'apply')
+
     def validate(self, shell, args: str) -> bool:
         if not self.require_selected_hosts(shell):
             return False
@@ -41,20 +44,10 @@ Examples:
         salt_cmd = shell.build_salt_cmd("salt", "--list", target, "--state-output=changes", f"state.{action}")
         print(f"Running: {' '.join(salt_cmd)}")
         try:
-            result = subprocess.run(
-                salt_cmd,
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout + result.stderr
+            result = self._run_salt(shell, salt_cmd)
 
             # Log salt output to database
-            shell.db.log_salt_output(
-                shell.last_command_id,
-                action,
-                output,
-                result.returncode
-            )
+            output = self._log_salt_result(shell, action, f"state.{action}", result)
 
             # Only show errors to user
             if result.returncode != 0:
@@ -72,7 +65,7 @@ Return code: {result.returncode}
                 # Display through pager
                 self._display_with_pager(content)
             else:
-                print("Command completed successfully. Run 'output' to show results.")
+                print(f"Command completed successfully. Run 'output {shell.last_command_id}' to show results.")
 
         except FileNotFoundError:
             print("Error: salt command not found. Is Salt installed?")
@@ -1,6 +1,5 @@
 """QSP command - run pkg.upgrade on selected hosts"""
 
-import subprocess
 from .base import BaseCommand
 
 
@@ -29,13 +28,8 @@ Example:
         print(f"Running: {' '.join(salt_cmd)}")
 
         try:
-            result = subprocess.run(
-                salt_cmd,
-                capture_output=True,
-                text=True
-            )
-
-            output = result.stdout + result.stderr
+            result = self._run_salt(shell, salt_cmd)
+            output = self._log_salt_result(shell, 'pkg.upgrade', 'pkg.upgrade', result)
 
             # Display output
             if result.returncode != 0:
@@ -22,6 +22,10 @@ Examples:
     select *.nyc       - Select all hosts ending with '.nyc' (explicit wildcard)
     select             - Clear selection"""
 
+    @property
+    def completes_minions(self) -> bool:
+        return True
+
     @property
     def log_in_history(self) -> bool:
         return False
@@ -32,6 +36,7 @@ Examples:
             shell.selected_hosts = []
             print("Selection cleared.")
         else:
+            shell.wait_for_minions()
             patterns = args.split()
             matched_hosts = set()
             for pattern in patterns:
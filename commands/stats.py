@@ -0,0 +1,82 @@
+"""Stats command - command counts, durations and failure rates"""
+
+import json
+import time
+from stats import GROUP_COLUMNS
+from .base import BaseCommand
+
+
+class StatsCommand(BaseCommand):
+    """Show command counts, durations and failure rates"""
+
+    # Window shown when no number of days is given
+    DEFAULT_DAYS = 30
+
+    @property
+    def name(self) -> str:
+        return "stats"
+
+    @property
+    def help_text(self) -> str:
+        return """Show command counts, durations and failure rates
+Usage: stats [verb|user|hosts] [days]
+    stats               - Per command over the last 30 days
+    stats user 7        - Per user over the last 7 days
+    stats hosts         - Per selected host set
+Durations are the median (p50), 95th percentile (p95) and longest run.
+Commands run before SaltCtl recorded outcomes have no failure rate."""
+
+    @property
+    def subcommands(self) -> tuple:
+        return ('hosts', 'user', 'verb')
+
+    @property
+    def log_in_history(self) -> bool:
+        return False
+
+    def execute(self, shell, args: str) -> bool:
+        words = args.lower().split()
+        group_by = 'verb'
+        if words and words[0] in GROUP_COLUMNS:
+            group_by = words.pop(0)
+        days = self.DEFAULT_DAYS
+        if words:
+            days = int(words[0]) if len(words) == 1 and words[0].isdigit() else 0
+        if days < 1:
+            print("Usage: stats [verb|user|hosts] [days]")
+            shell.mark_failed()
+            return False
+
+        since = int(time.time()) - days * 86400
+        rows = shell.db.command_stats(group_by, since=since)
+        if not rows:
+            print(f"  No commands in the last {days} days.")
+            return False
+
+        labels = [_label(group_by, row.key) for row in rows]
+        width = max(len(group_by), *(len(label) for label in labels))
+        print(f"Commands in the last {days} days by {group_by}:")
+        print(f"  {group_by:<{width}}  {'count':>7}  {'p50':>8}  {'p95':>8}  {'max':>8}  {'failed':>6}")
+        for label, row in zip(labels, rows):
+            failed = "-" if row.failure_rate is None else f"{row.failure_rate:.1%}"
+            print(f"  {label:<{width}}  {row.commands:>7}  {_seconds(row.p50):>8}  "
+                  f"{_seconds(row.p95):>8}  {_seconds(row.longest):>8}  {failed:>6}")
+        return False
+
+
+def _label(group_by: str, key: str) -> str:
+    """Display name of a stats group"""
+    if group_by != 'hosts':
+        return key or "(unknown)"
+    try:
+        hosts = json.loads(key)
+    except ValueError:
+        return key
+    return ', '.join(hosts) if hosts else "(none)"
+
+
+def _seconds(duration: float) -> str:
+    return f"{duration:.2f}s"
+
+
+# vim: set ts=4 sw=4 et:
@@ -1,7 +1,6 @@
 """Systemctl command - run systemctl commands on selected hosts"""
 
 import re
-import subprocess
 from .base import BaseCommand
 
 
@@ -21,6 +20,10 @@ Examples:
     systemctl status docker         - Check docker status
     systemctl restart foo bar       - Restart foo and bar services"""
 
+    @property
+    def subcommands(self) -> tuple:
+        return ('restart', 'start', 'stop', 'reload', 'status', 'enable', 'disable')
+
     def validate(self, shell, args: str) -> bool:
         if not self.require_selected_hosts(shell):
             return False
@@ -46,12 +49,8 @@ Examples:
         salt_cmd = shell.build_salt_cmd("salt", "--list", target, "cmd.run", systemctl_cmd)
         print(f"Running: {' '.join(salt_cmd)}")
         try:
-            result = subprocess.run(
-                salt_cmd,
-                capture_output=True,
-                text=True
-            )
-            output = result.stdout + result.stderr
+            result = self._run_salt(shell, salt_cmd)
+            output = self._log_salt_result(shell, 'cmd.run', 'cmd.run', result)
 
             if result.returncode != 0:
                 content = f"{output}\n\nCommand failed with exit code {result.returncode}"
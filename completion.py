@@ -0,0 +1,121 @@
+"""Tab completion for the SaltCtl shell"""
+
+from bisect import bisect_left, insort
+from typing import Iterable, List, Optional
+
+# Sorts after any character that can appear in a command or minion name
+_MAX_CHAR = chr(0x10ffff)
+
+
+class PrefixIndex:
+    """Sorted list of names supporting O(log n) prefix lookups"""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._names: List[str] = sorted(set(names))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        i = bisect_left(self._names, name)
+        return i < len(self._names) and self._names[i] == name
+
+    def update(self, names: Iterable[str]):
+        """
+        Replace the indexed names, applying small changes in place
+
+        A few added or removed minions don't justify re-sorting tens of
+        thousands of names, so only large changes rebuild the index. The
+        new list is swapped in whole so concurrent lookups (the minion
+        list refreshes on a background thread) never see a partial update.
+        """
+        new = set(names)
+        old = set(self._names)
+        added = new - old
+        removed = old - new
+        if len(added) + len(removed) > len(self._names) // 4:
+            self._names = sorted(new)
+            return
+
+        updated = list(self._names)
+        for name in removed:
+            del updated[bisect_left(updated, name)]
+        for name in added:
+            insort(updated, name)
+        self._names = updated
+
+    def matches(self, prefix: str) -> List[str]:
+        """All indexed names starting with prefix, in sorted order"""
+        lo = bisect_left(self._names, prefix)
+        hi = bisect_left(self._names, prefix + _MAX_CHAR, lo)
+        return self._names[lo:hi]
+
+
+class Completer:
+    """
+    Context-aware completion for command lines
+
+    Completes command names in the first word, then subcommands or
+    minion names depending on what the resolved command accepts.
+    """
+
+    def __init__(self, commands):
+        self._commands = commands
+        self._command_index: Optional[PrefixIndex] = None
+        self.minion_index = PrefixIndex()
+        self._matches: List[str] = []
+
+    @property
+    def command_index(self) -> PrefixIndex:
+        """Index of command names, built on first use"""
+        # Listing every command name reads plugin entry points, so this
+        # is deferred until a prefix actually needs resolving
+        if self._command_index is None:
+            self._command_index = PrefixIndex(self._commands.keys())
+        return self._command_index
+
+    def resolve_command(self, prefix: str) -> Optional[str]:
+        """The command named exactly prefix, or the only one starting with it"""
+        if prefix in self._commands:
+            return prefix
+        matches = self.command_index.matches(prefix)
+        if len(matches) == 1:
+            return matches[0]
+        return None
+
+    def candidates(self, line: str, begidx: int, text: str) -> List[str]:
+        """
+        Completion candidates for the word being typed
+
+        Args:
+            line: The full line typed so far
+            begidx: Offset in line where the word being completed starts
+            text: The partial word being completed
+        """
+        words = line[:begidx].split()
+        if not words:
+            return [name + ' ' for name in self.command_index.matches(text)]
+
+        cmd_name = self.resolve_command(words[0])
+        if cmd_name is None:
+            return []
+
+        subcommands = self._commands.subcommands(cmd_name)
+        if subcommands and len(words) == 1:
+            return [sub + ' ' for sub in subcommands if sub.startswith(text)]
+
+        if self._commands.completes_minions(cmd_name):
+            return self.minion_index.matches(text)
+
+        return []
+
+    def complete(self, line: str, begidx: int, text: str, state: int) -> Optional[str]:
+        """readline-style completion: return the state'th candidate"""
+        if state == 0:
+            self._matches = self.candidates(line, begidx, text)
+        if state < len(self._matches):
+            return self._matches[state]
+        return None
+
+
+# vim: set ts=4 sw=4 et:
@@ -14,10 +14,45 @@ class SaltCtlConfig:
             'use_sudo': 'false'
         },
         'history': {
-            'trim_days': '90'
+            'trim_days': '90',
+            'archive_months': '12'
+        },
+        'minions': {
+            'cache_ttl': '300',
+            'refresh_timeout': '30'
+        },
+        'jobs': {
+            'workers': '4'
+        },
+        'daemon': {
+            'socket': '~/.saltctld.sock',
+            'socket_mode': '600'
+        },
+        'database': {
+            'path': '~/.saltctl.db',
+            'busy_timeout': '5',
+            'journal_mode': 'wal',
+            'output_codec': 'zlib',
+            'blob_threshold': '1048576',
+            'write_behind': 'true'
+        },
+        'retention': {
+            'max_db_size': '0',
+            'keep_outputs_per_hosts': '0',
+            'keep_outputs_per_command': '0',
+            'output_days': '0'
         }
     }
 
+    # SQLite journal modes accepted for [database] journal_mode
+    JOURNAL_MODES = ('wal', 'delete', 'truncate', 'persist')
+
+    # Compression codecs accepted for [database] output_codec
+    OUTPUT_CODECS = ('zlib', 'lzma', 'none')
+
+    # Suffixes accepted on sizes, e.g. max_db_size = 500M
+    SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
     def __init__(self):
         self.config = configparser.ConfigParser()
 
@@ -47,6 +82,13 @@ class SaltCtlConfig:
         except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
             return fallback
 
+    def get_int(self, section: str, option: str, fallback: int = 0) -> int:
+        """Get an integer configuration value"""
+        try:
+            return self.config.getint(section, option)
+        except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
+            return fallback
+
     def get_str(self, section: str, option: str, fallback: str = '') -> str:
         """Get a string configuration value"""
         try:
@@ -54,6 +96,15 @@ class SaltCtlConfig:
         except (configparser.NoSectionError, configparser.NoOptionError):
             return fallback
 
+    def get_size(self, section: str, option: str, fallback: int = 0) -> int:
+        """Get a size in bytes, optionally with a K, M or G suffix"""
+        value = self.get_str(section, option).strip().lower().rstrip('b')
+        unit = value[-1:] if value[-1:] in self.SIZE_UNITS else ''
+        try:
+            return int(float(value[:len(value) - len(unit)]) * self.SIZE_UNITS[unit])
+        except ValueError:
+            return fallback
+
     @property
     def use_sudo(self) -> bool:
         """Whether to use sudo when running salt commands"""
@@ -69,5 +120,111 @@ class SaltCtlConfig:
         except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
             return default
 
+    @property
+    def history_archive_months(self) -> int:
+        """Months of history 'db archive' keeps in the main database"""
+        default = int(self.DEFAULTS['history']['archive_months'])
+        return self.get_int('history', 'archive_months', fallback=default)
+
+    @property
+    def minion_cache_ttl(self) -> int:
+        """Seconds before the cached minion list is refreshed from salt-key"""
+        default = int(self.DEFAULTS['minions']['cache_ttl'])
+        return self.get_int('minions', 'cache_ttl', fallback=default)
+
+    @property
+    def minion_refresh_timeout(self) -> int:
+        """Seconds to wait for salt-key before falling back to the cached list"""
+        default = int(self.DEFAULTS['minions']['refresh_timeout'])
+        return self.get_int('minions', 'refresh_timeout', fallback=default)
+
+    @property
+    def job_workers(self) -> int:
+        """Maximum number of background jobs running at once"""
+        default = int(self.DEFAULTS['jobs']['workers'])
+        return self.get_int('jobs', 'workers', fallback=default)
+
+    @property
+    def db_path(self) -> str:
+        """History database file; point several users at one file to share an audit trail"""
+        default = self.DEFAULTS['database']['path']
+        return os.path.expanduser(self.get_str('database', 'path', fallback=default) or default)
+
+    @property
+    def db_busy_timeout(self) -> float:
+        """Seconds to wait for another shell's write to finish before retrying"""
+        default = float(self.DEFAULTS['database']['busy_timeout'])
+        try:
+            return max(0.0, self.config.getfloat('database', 'busy_timeout'))
+        except (configparser.NoSectionError, configparser.NoOptionError, ValueError):
+            return default
+
+    @property
+    def db_journal_mode(self) -> str:
+        """SQLite journal mode for the history database"""
+        mode = self.get_str('database', 'journal_mode').lower()
+        if mode not in self.JOURNAL_MODES:
+            return self.DEFAULTS['database']['journal_mode']
+        return mode
+
+    @property
+    def db_output_codec(self) -> str:
+        """Compression codec for salt output stored in the history database"""
+        codec = self.get_str('database', 'output_codec').lower()
+        if codec not in self.OUTPUT_CODECS:
+            return self.DEFAULTS['database']['output_codec']
+        return codec
+
+    @property
+    def db_blob_threshold(self) -> int:
+        """Compressed size in bytes above which output is kept in the blob store (0: never)"""
+        default = int(self.DEFAULTS['database']['blob_threshold'])
+        return max(0, self.get_size('database', 'blob_threshold', fallback=default))
+
+    @property
+    def db_write_behind(self) -> bool:
+        """Whether history is written by a background thread instead of before/after each command"""
+        default = self.DEFAULTS['database']['write_behind'] == 'true'
+        return self.get_bool('database', 'write_behind', fallback=default)
+
+    @property
+    def retention_max_db_size(self) -> int:
+        """Bytes of database pages and blob files in use before the oldest outputs are dropped (0: no limit)"""
+        default = int(self.DEFAULTS['retention']['max_db_size'])
+        return max(0, self.get_size('retention', 'max_db_size', fallback=default))
+
+    @property
+    def retention_keep_outputs_per_hosts(self) -> int:
+        """Newest outputs kept per selected host set (0: no limit)"""
+        default = int(self.DEFAULTS['retention']['keep_outputs_per_hosts'])
+        return max(0, self.get_int('retention', 'keep_outputs_per_hosts', fallback=default))
+
+    @property
+    def retention_keep_outputs_per_command(self) -> int:
+        """Newest outputs kept per command, e.g. 'push' (0: no limit)"""
+        default = int(self.DEFAULTS['retention']['keep_outputs_per_command'])
+        return max(0, self.get_int('retention', 'keep_outputs_per_command', fallback=default))
+
+    @property
+    def retention_output_days(self) -> int:
+        """Days salt output is kept; the command history entries stay (0: no limit)"""
+        default = int(self.DEFAULTS['retention']['output_days'])
+        return max(0, self.get_int('retention', 'output_days', fallback=default))
+
+    @property
+    def daemon_socket(self) -> str:
+        """Unix socket path saltctld listens on and saltctl --connect attaches to"""
+        default = self.DEFAULTS['daemon']['socket']
+        return os.path.expanduser(self.get_str('daemon', 'socket', fallback=default))
+
+    @property
+    def daemon_socket_mode(self) -> int:
+        """Permissions (octal) of the saltctld socket; 660 lets a group share the daemon"""
+        default = int(self.DEFAULTS['daemon']['socket_mode'], 8)
+        try:
+            return int(self.get_str('daemon', 'socket_mode'), 8)
+        except ValueError:
+            return default
+
 
 # vim: set ts=4 sw=4 et:
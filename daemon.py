@@ -0,0 +1,364 @@
+#!/usr/bin/python3
+"""
+SaltCtl daemon (saltctld) and thin client.
+
+The daemon keeps the database, config, command registry, minion cache and
+job pool resident and serves shell sessions over a Unix socket, so every
+operator terminal attached to it shares one warm process and one job table.
+
+Messages are JSON objects, one per line:
+    client -> daemon:  {"command": "<command line>"}
+                       {"complete": {"line": ..., "begidx": ..., "text": ...}}
+    daemon -> client:  {"output": "<text>"}            (any number)
+                       {"done": true, "exit": bool, "failed": bool, "prompt": "..."}
+                       {"candidates": [...]}
+On connect the daemon sends a "done" message carrying the first prompt.
+"""
+
+import os
+import sys
+import json
+import pwd
+import socket
+import signal
+import struct
+import argparse
+import threading
+import socketserver
+from typing import List, Optional
+from background import captured_output
+from config import SaltCtlConfig
+from saltctl import SaltCtlShell
+
+
+def _peer_username(sock) -> Optional[str]:
+    """Name of the user on the other end of a Unix socket, from the kernel's peer credentials"""
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _pid, uid, _gid = struct.unpack('3i', creds)
+        return pwd.getpwuid(uid).pw_name
+    except (AttributeError, OSError, KeyError):
+        return None
+
+
+class _MessageWriter:
+    """File-like object that forwards printed text to the client as output messages"""
+
+    def __init__(self, send):
+        self._send = send
+        self.connected = True
+
+    def write(self, text: str) -> int:
+        # A client that detached mid-command must not abort the command
+        # (its history and output still need logging), so drop the text
+        if text and self.connected:
+            try:
+                self._send({'output': text})
+            except OSError:
+                self.connected = False
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class _SessionHandler(socketserver.StreamRequestHandler):
+    """One attached client: a shell session sharing the daemon's resources"""
+
+    def setup(self):
+        super().setup()
+        self._send_lock = threading.Lock()
+
+    def send(self, message: dict):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self._send_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self):
+        daemon = self.server.daemon
+        username = _peer_username(self.request) or 'unknown'
+        shell = SaltCtlShell(interactive=False, shared=daemon.shell, username=username)
+        writer = _MessageWriter(self.send)
+
+        try:
+            with captured_output(writer):
+                shell.report_finished_jobs()
+            self.send({'done': True, 'exit': False, 'failed': False, 'prompt': shell.prompt})
+
+            for raw in self.rfile:
+                try:
+                    request = json.loads(raw.decode('utf-8'))
+                except ValueError:
+                    continue
+
+                if 'complete' in request:
+                    args = request['complete']
+                    candidates = shell.completer.candidates(
+                        args.get('line', ''), args.get('begidx', 0), args.get('text', ''))
+                    self.send({'candidates': candidates})
+                    continue
+
+                with captured_output(writer):
+                    try:
+                        should_exit = shell.run_command(request.get('command', ''))
+                    except Exception as e:
+                        print(f"Error: {e}")
+                        shell.mark_failed()
+                        should_exit = False
+                    if not should_exit:
+                        shell.report_finished_jobs()
+                self.send({
+                    'done': True,
+                    'exit': should_exit,
+                    'failed': shell.last_command_failed,
+                    'prompt': shell.prompt,
+                })
+                if should_exit:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; any jobs it started keep running
+            pass
+        finally:
+            shell.db.release_thread_connection()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SaltCtlDaemon:
+    """Resident saltctl process serving shell sessions over a Unix socket"""
+
+    def __init__(self, socket_path: str, socket_mode: int = 0o600):
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.shell = SaltCtlShell(interactive=False)
+        self._stop = threading.Event()
+        self._server: Optional[_UnixServer] = None
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise RuntimeError(f"saltctld is already running on {self.socket_path}")
+
+    def _refresh_minions_periodically(self):
+        """Keep the resident minion list no older than the cache TTL"""
+        cache = self.shell.minion_cache
+        interval = max(1, cache.ttl)
+        while not self._stop.wait(interval):
+            if cache.is_stale:
+                cache.refresh_in_background()
+
+    def start(self):
+        """Bind the socket and start serving sessions on a background thread"""
+        self._remove_stale_socket()
+        old_umask = os.umask(0o777 & ~self.socket_mode)
+        try:
+            self._server = _UnixServer(self.socket_path, _SessionHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, self.socket_mode)
+        self._server.daemon = self
+
+        threading.Thread(target=self._server.serve_forever, name='saltctld-server', daemon=True).start()
+        threading.Thread(target=self._refresh_minions_periodically, name='saltctld-minions', daemon=True).start()
+
+    def stop(self):
+        """Stop accepting sessions, wait for running jobs and remove the socket"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.shell.jobs.shutdown()
+        self.shell.db.close()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    def serve_forever(self):
+        """Serve until SIGTERM or SIGINT"""
+        self.start()
+        print(f"saltctld listening on {self.socket_path}")
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._stop.set())
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        print("saltctld shutting down (waiting for running jobs)...")
+        self.stop()
+
+
+class DaemonClient:
+    """Connection from a saltctl client to saltctld"""
+
+    def __init__(self, socket_path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self._rfile = self.sock.makefile('rb')
+        self.prompt = "saltctl> "
+        greeting = self._read_until_done()
+        self.prompt = greeting.get('prompt', self.prompt)
+
+    def _send(self, message: dict):
+        self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+    def _read(self) -> dict:
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionError("saltctld closed the connection")
+        return json.loads(line.decode('utf-8'))
+
+    def _read_until_done(self) -> dict:
+        """Print output messages until the daemon reports the command finished"""
+        while True:
+            message = self._read()
+            if 'output' in message:
+                sys.stdout.write(message['output'])
+                sys.stdout.flush()
+            if message.get('done'):
+                return message
+
+    def run_command(self, cmdLine: str) -> dict:
+        """
+        Run a command line in the daemon session, printing its output
+
+        Returns:
+            The daemon's final message ('exit', 'failed' and 'prompt' keys)
+        """
+        self._send({'command': cmdLine})
+        result = self._read_until_done()
+        self.prompt = result.get('prompt', self.prompt)
+        return result
+
+    def complete(self, line: str, begidx: int, text: str) -> List[str]:
+        """Ask the daemon for completion candidates"""
+        self._send({'complete': {'line': line, 'begidx': begidx, 'text': text}})
+        while True:
+            message = self._read()
+            if 'candidates' in message:
+                return message['candidates']
+
+    def close(self):
+        self._rfile.close()
+        self.sock.close()
+
+
+def run_client(socket_path: str, script: Optional[List[str]] = None,
+               keep_going: bool = False) -> int:
+    """
+    Attach to saltctld and run a session (interactive, or the given script)
+
+    Returns:
+        Process exit status
+    """
+    try:
+        client = DaemonClient(socket_path)
+    except (OSError, ConnectionError) as e:
+        print(f"Error: Cannot connect to saltctld at {socket_path}: {e}")
+        return 2
+
+    try:
+        if script is not None:
+            status = 0
+            for cmdLine in script:
+                print(f"{client.prompt}{cmdLine}")
+                result = client.run_command(cmdLine)
+                if result.get('failed'):
+                    status = 1
+                    if not keep_going:
+                        print(f"Stopping: '{cmdLine}' failed")
+                        break
+                if result.get('exit'):
+                    break
+            return status
+
+        _interactive_client(client)
+        return 0
+    except ConnectionError as e:
+        print(f"\nError: {e}")
+        return 2
+    finally:
+        client.close()
+
+
+def _interactive_client(client: DaemonClient):
+    """Prompt loop for a client attached to saltctld"""
+    import readline
+
+    history_file = os.path.expanduser("~/.saltctl_history")
+    try:
+        readline.read_history_file(history_file)
+    except FileNotFoundError:
+        pass
+    readline.set_history_length(1000)
+    readline.parse_and_bind('tab: complete')
+    readline.set_completer_delims(' \t\n')
+
+    matches: List[str] = []
+
+    def completer(text, state):
+        nonlocal matches
+        if state == 0:
+            matches = client.complete(readline.get_line_buffer(), readline.get_begidx(), text)
+        return matches[state] if state < len(matches) else None
+
+    readline.set_completer(completer)
+
+    print("SaltCtl - Salt Minion Management (attached to saltctld)")
+    print("Type 'help' for available commands.\n")
+    try:
+        while True:
+            try:
+                cmdLine = input(client.prompt)
+            except EOFError:
+                print()
+                print("Goodbye!")
+                break
+            except KeyboardInterrupt:
+                print()
+                print("Adios!")
+                break
+            try:
+                if client.run_command(cmdLine).get('exit'):
+                    break
+            except KeyboardInterrupt:
+                # The command keeps running in the daemon; stop waiting for it
+                print("\nDetached from running command.")
+                break
+    finally:
+        readline.write_history_file(history_file)
+
+
+def main():
+    """saltctld entry point"""
+    config = SaltCtlConfig()
+    parser = argparse.ArgumentParser(description="Resident saltctl daemon serving shells over a Unix socket")
+    parser.add_argument('--socket', default=config.daemon_socket,
+                        help=f"socket path (default: {config.daemon_socket})")
+    args = parser.parse_args()
+
+    try:
+        daemon = SaltCtlDaemon(args.socket, config.daemon_socket_mode)
+        daemon.serve_forever()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# vim: set ts=4 sw=4 et:
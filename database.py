@@ -3,64 +3,862 @@
 import sqlite3
 import os
 import json
-from typing import List, Optional
+import lzma
+import zlib
+import atexit
+import codecs
+import threading
+import time
+import random
+import heapq
+import hashlib
+import shutil
+import tempfile
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from datetime import datetime
-from contextlib import contextmanager
+from contextlib import closing, contextmanager
+from urllib.request import pathname2url
+from blobstore import BlobStore, blob_store_path
+from writebehind import WriteBehindQueue
+from swaplock import SwapLock
+from retention import RetentionPolicy, select_outputs
+from stats import GROUP_COLUMNS, STATS_PERIOD, CommandStats, duration_bucket, summarize
+
+
+# SQL expression converting a local-time ISO timestamp to Unix epoch seconds
+# (matches int(datetime.now().timestamp()) for the naive local timestamps stored)
+_EPOCH_OF = "CAST(strftime('%s', {}, 'utc') AS INTEGER)"
+
+# SQL for a command line's verb (its first word, lower-cased); must match _command_verb()
+_VERB_OF = "lower(CASE WHEN instr({0}, ' ') > 0 THEN substr({0}, 1, instr({0}, ' ') - 1) ELSE {0} END)"
+
+# SQL for a live salt_outputs row's stored value, whether inline or in the blob store
+_OUTPUT_VALUE = "COALESCE(output, saltctl_blob(blob_hash))"
+
+# The same for a live minion_results row's payload
+_PAYLOAD_VALUE = "COALESCE(payload, saltctl_blob(blob_hash))"
+
+
+def _command_verb(command: str) -> str:
+    """The command a history entry ran, e.g. 'push' for 'push apply'"""
+    return command.split(' ', 1)[0].lower()
+
+
+def _content_hash(timestamp: str, username: str, selected_hosts: Optional[str], command: str) -> str:
+    """Identity of a history entry in any database, which 'db import' deduplicates on"""
+    key = json.dumps([timestamp, username, selected_hosts, command])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _migrate_base_tables(cursor):
+    """v1: the original tables (already present in databases created before versioning)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS command_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            username TEXT NOT NULL,
+            selected_hosts TEXT,
+            command TEXT NOT NULL,
+            duration REAL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS salt_outputs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            command_id INTEGER NOT NULL,
+            salt_command TEXT NOT NULL,
+            output TEXT,
+            return_code INTEGER,
+            FOREIGN KEY (command_id) REFERENCES command_history (id)
+        )
+    ''')
+
+
+def _migrate_output_index(cursor):
+    """v2: index outputs by command, for 'output' lookups and trim"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_salt_outputs_command_id
+        ON salt_outputs (command_id)
+    ''')
+
+
+def _migrate_epoch_timestamps(cursor):
+    """v3: integer epoch timestamps, indexed, for history ordering and trim"""
+    cursor.execute('ALTER TABLE command_history ADD COLUMN epoch INTEGER')
+    cursor.execute(f'''
+        UPDATE command_history
+        SET epoch = {_EPOCH_OF.format('timestamp')}
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_command_history_epoch
+        ON command_history (epoch)
+    ''')
+    # Rows inserted without an epoch (e.g. by an older saltctl sharing the
+    # database) get one derived from their timestamp
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS command_history_fill_epoch
+        AFTER INSERT ON command_history
+        WHEN NEW.epoch IS NULL
+        BEGIN
+            UPDATE command_history
+            SET epoch = {_EPOCH_OF.format('NEW.timestamp')}
+            WHERE id = NEW.id;
+        END
+    ''')
+
+
+def _migrate_command_hosts(cursor):
+    """v4: selected hosts as an indexed join table, for per-host history"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS hosts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS command_hosts (
+            host_id INTEGER NOT NULL REFERENCES hosts (id),
+            command_id INTEGER NOT NULL REFERENCES command_history (id),
+            PRIMARY KEY (host_id, command_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_command_hosts_command_id
+        ON command_hosts (command_id)
+    ''')
+
+    # Backfill from the JSON column (decoded here rather than with json_each,
+    # which isn't compiled into every SQLite)
+    rows = cursor.execute('''
+        SELECT id, selected_hosts FROM command_history
+        WHERE selected_hosts IS NOT NULL AND selected_hosts != '[]'
+    ''').fetchall()
+    for command_id, hosts_json in rows:
+        try:
+            hosts = json.loads(hosts_json)
+        except ValueError:
+            continue
+        if isinstance(hosts, list):
+            _link_command_hosts(cursor, command_id, [str(host) for host in hosts])
+
+
+def _link_command_hosts(cursor, command_id: int, hosts: List[str]):
+    """Record which hosts a command was run against"""
+    if not hosts:
+        return
+    cursor.executemany('INSERT OR IGNORE INTO hosts (name) VALUES (?)',
+                       [(host,) for host in hosts])
+    cursor.executemany('''
+        INSERT OR IGNORE INTO command_hosts (host_id, command_id)
+        SELECT id, ? FROM hosts WHERE name = ?
+    ''', [(command_id, host) for host in hosts])
+
+
+def _migrate_output_codec(cursor):
+    """v5: per-row compression codec for salt output (NULL means plain text)"""
+    cursor.execute('ALTER TABLE salt_outputs ADD COLUMN codec TEXT')
+
+
+def _migrate_minion_results(cursor):
+    """v6: per-minion results parsed from salt output"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS minion_results (
+            id INTEGER PRIMARY KEY,
+            command_id INTEGER NOT NULL REFERENCES command_history (id),
+            minion TEXT NOT NULL,
+            success INTEGER,
+            changed_count INTEGER,
+            failed_count INTEGER,
+            duration REAL,
+            payload,
+            codec TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_minion_results_command_id
+        ON minion_results (command_id, minion)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_minion_results_minion
+        ON minion_results (minion, command_id)
+    ''')
+
+
+def _fts5_available(cursor) -> bool:
+    """Whether this SQLite was built with the FTS5 extension"""
+    try:
+        cursor.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        cursor.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _create_output_fts(cursor) -> bool:
+    """
+    Create the full-text index over salt output, if FTS5 is available
+
+    The index is contentless (outputs are stored compressed, so FTS5
+    can't read them itself): the application adds and removes each
+    output's text, and salt_outputs.fts_indexed marks the rows it holds.
+
+    Returns:
+        Whether the index exists
+    """
+    if not _fts5_available(cursor):
+        return False
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS output_fts
+        USING fts5(output, content='', tokenize='unicode61')
+    ''')
+    return True
+
+
+def _migrate_output_search(cursor):
+    """v7: full-text index over salt output"""
+    # Existing outputs are indexed by 'db reindex' rather than here, as
+    # decompressing years of output would stall the first startup
+    cursor.execute('ALTER TABLE salt_outputs ADD COLUMN fts_indexed INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_salt_outputs_unindexed
+        ON salt_outputs (id) WHERE fts_indexed IS NULL
+    ''')
+    _create_output_fts(cursor)
+
+
+def _migrate_command_verb(cursor):
+    """v8: the command's verb, and indexes grouping history by verb and host set for retention"""
+    cursor.execute('ALTER TABLE command_history ADD COLUMN verb TEXT')
+    cursor.execute(f"UPDATE command_history SET verb = {_VERB_OF.format('command')}")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_command_history_verb
+        ON command_history (verb, epoch)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_command_history_selected_hosts
+        ON command_history (selected_hosts, epoch)
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS command_history_fill_verb
+        AFTER INSERT ON command_history
+        WHEN NEW.verb IS NULL
+        BEGIN
+            UPDATE command_history
+            SET verb = {_VERB_OF.format('NEW.command')}
+            WHERE id = NEW.id;
+        END
+    ''')
+
+
+def _migrate_archive_index(cursor):
+    """v9: index of the monthly archive files old history is moved into"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_index (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            first_epoch INTEGER NOT NULL,
+            last_epoch INTEGER NOT NULL,
+            commands INTEGER NOT NULL
+        )
+    ''')
+
+
+def _create_archive_schema(cursor):
+    """
+    Tables of an archive file attached as 'archive'
+
+    They mirror the live tables (IDs included) so history and output
+    queries run unchanged against either; only the search index is left out.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive.command_history (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            epoch INTEGER,
+            username TEXT NOT NULL,
+            selected_hosts TEXT,
+            command TEXT NOT NULL,
+            verb TEXT,
+            duration REAL,
+            content_hash TEXT
+        )
+    ''')
+    # Archives written before content hashes were copied lack the column
+    columns = [row[1] for row in cursor.execute('PRAGMA archive.table_info(command_history)')]
+    if 'content_hash' not in columns:
+        cursor.execute('ALTER TABLE archive.command_history ADD COLUMN content_hash TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_command_history_epoch ON command_history (epoch)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive.salt_outputs (
+            id INTEGER PRIMARY KEY,
+            command_id INTEGER NOT NULL,
+            salt_command TEXT NOT NULL,
+            output,
+            return_code INTEGER,
+            codec TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_salt_outputs_command_id ON salt_outputs (command_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive.minion_results (
+            id INTEGER PRIMARY KEY,
+            command_id INTEGER NOT NULL,
+            minion TEXT NOT NULL,
+            success INTEGER,
+            changed_count INTEGER,
+            failed_count INTEGER,
+            duration REAL,
+            payload,
+            codec TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS archive.idx_minion_results_command_id
+        ON minion_results (command_id, minion)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive.hosts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive.command_hosts (
+            host_id INTEGER NOT NULL,
+            command_id INTEGER NOT NULL,
+            PRIMARY KEY (host_id, command_id)
+        ) WITHOUT ROWID
+    ''')
+    # History rows look their host names up by command
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS archive.idx_command_hosts_command_id
+        ON command_hosts (command_id)
+    ''')
+
+
+def _migrate_history_user_index(cursor):
+    """v10: index history by user, for 'history --user'"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_command_history_username
+        ON command_history (username, epoch)
+    ''')
+
+
+def _migrate_command_stats(cursor):
+    """v11: each command's outcome, and hourly duration histograms for 'stats'"""
+    cursor.execute('ALTER TABLE command_history ADD COLUMN success INTEGER')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS command_stats (
+            period INTEGER NOT NULL,
+            verb TEXT NOT NULL,
+            username TEXT NOT NULL,
+            selected_hosts TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            commands INTEGER NOT NULL DEFAULT 0,
+            outcomes INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            longest REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, verb, username, selected_hosts, bucket)
+        ) WITHOUT ROWID
+    ''')
+    # Existing history is counted once here (without outcomes, which
+    # weren't recorded); from then on each command adds itself as it ends
+    cursor.execute(f'''
+        INSERT INTO command_stats (period, verb, username, selected_hosts, bucket, commands, longest)
+        SELECT epoch / {STATS_PERIOD}, COALESCE(verb, ''), username, COALESCE(selected_hosts, '[]'),
+               saltctl_duration_bucket(duration), COUNT(*), MAX(duration)
+        FROM command_history
+        WHERE duration IS NOT NULL AND epoch IS NOT NULL
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+
+
+def _migrate_content_hash(cursor):
+    """v12: a hash of each entry's content, so 'db import' can skip entries it already has"""
+    cursor.execute('ALTER TABLE command_history ADD COLUMN content_hash TEXT')
+    cursor.execute('''
+        UPDATE command_history
+        SET content_hash = saltctl_content_hash(timestamp, username, selected_hosts, command)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_command_history_content_hash
+        ON command_history (content_hash)
+    ''')
+
+
+def _migrate_output_blobs(cursor):
+    """v13: large outputs kept in the blob store, referenced by hash"""
+    cursor.execute('ALTER TABLE salt_outputs ADD COLUMN blob_hash TEXT')
+    cursor.execute('ALTER TABLE salt_outputs ADD COLUMN blob_size INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_salt_outputs_blob_hash
+        ON salt_outputs (blob_hash) WHERE blob_hash IS NOT NULL
+    ''')
+
+
+def _migrate_output_epoch(cursor):
+    """v14: outputs indexed by their command's time, for the age and size retention policies"""
+    cursor.execute('ALTER TABLE salt_outputs ADD COLUMN command_epoch INTEGER')
+    cursor.execute('''
+        UPDATE salt_outputs
+        SET command_epoch = (SELECT epoch FROM command_history WHERE id = salt_outputs.command_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_salt_outputs_command_epoch
+        ON salt_outputs (command_epoch, command_id)
+    ''')
+    # Outputs inserted without it (e.g. by an older saltctl sharing the
+    # database) get it from their command, and it follows the command's
+    # epoch if that changes
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS salt_outputs_fill_command_epoch
+        AFTER INSERT ON salt_outputs
+        WHEN NEW.command_epoch IS NULL
+        BEGIN
+            UPDATE salt_outputs
+            SET command_epoch = (SELECT epoch FROM command_history WHERE id = NEW.command_id)
+            WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS command_history_update_output_epoch
+        AFTER UPDATE OF epoch ON command_history
+        BEGIN
+            UPDATE salt_outputs SET command_epoch = NEW.epoch WHERE command_id = NEW.id;
+        END
+    ''')
+
+
+def _migrate_payload_blobs(cursor):
+    """v15: large per-minion payloads kept in the blob store too"""
+    cursor.execute('ALTER TABLE minion_results ADD COLUMN blob_hash TEXT')
+    cursor.execute('ALTER TABLE minion_results ADD COLUMN blob_size INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_minion_results_blob_hash
+        ON minion_results (blob_hash) WHERE blob_hash IS NOT NULL
+    ''')
+
+
+# Schema migrations, in order. Migration N upgrades a database at
+# user_version N-1 to N; append new ones, never edit or reorder old ones.
+MIGRATIONS = [
+    _migrate_base_tables,
+    _migrate_output_index,
+    _migrate_epoch_timestamps,
+    _migrate_command_hosts,
+    _migrate_output_codec,
+    _migrate_minion_results,
+    _migrate_output_search,
+    _migrate_command_verb,
+    _migrate_archive_index,
+    _migrate_history_user_index,
+    _migrate_command_stats,
+    _migrate_content_hash,
+    _migrate_output_blobs,
+    _migrate_output_epoch,
+    _migrate_payload_blobs,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _zlib_stream(chunks: Iterable[bytes], max_length: int) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj()
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, max_length)
+            if data:
+                yield data
+            chunk = decompressor.unconsumed_tail
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def _lzma_stream(chunks: Iterable[bytes], max_length: int) -> Iterator[bytes]:
+    decompressor = lzma.LZMADecompressor()
+    for chunk in chunks:
+        data = decompressor.decompress(chunk, max_length)
+        if data:
+            yield data
+        while not decompressor.needs_input and not decompressor.eof:
+            data = decompressor.decompress(b'', max_length)
+            if data:
+                yield data
+
+
+class OutputCodec(NamedTuple):
+    """Compression for stored output, whole-value and streaming"""
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+    # (compressed chunks, max bytes per output chunk) -> decompressed chunks
+    stream: Callable[[Iterable[bytes], int], Iterator[bytes]]
+
+
+# Output compression codecs by name.
+# The name is stored with each row, so entries must never be renamed.
+OUTPUT_CODECS: Dict[str, OutputCodec] = {
+    'zlib': OutputCodec(lambda data: zlib.compress(data, 6), zlib.decompress, _zlib_stream),
+    'lzma': OutputCodec(lzma.compress, lzma.decompress, _lzma_stream),
+}
+
+
+def encode_output(output: Optional[str], codec: str) -> Tuple[object, Optional[str]]:
+    """
+    Compress output for storage
+
+    Returns:
+        Tuple of (stored value, codec name or None if stored as plain text)
+    """
+    if output is None or codec not in OUTPUT_CODECS:
+        return output, None
+    data = output.encode('utf-8')
+    compressed = OUTPUT_CODECS[codec].compress(data)
+    # Short outputs can grow when compressed; keep those as text
+    if len(compressed) >= len(data):
+        return output, None
+    return compressed, codec
+
+
+def decode_output(value, codec: Optional[str]) -> Optional[str]:
+    """Decompress a stored output value (plain text rows are returned as-is)"""
+    if codec is None or value is None:
+        # Uncompressed output read from the blob store is UTF-8 bytes
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+    return _codec(codec).decompress(bytes(value)).decode('utf-8')
+
+
+def _codec(name: str) -> OutputCodec:
+    try:
+        return OUTPUT_CODECS[name]
+    except KeyError:
+        raise ValueError(f"Stored output uses unknown codec '{name}'")
+
+
+def decode_output_stream(chunks: Iterable[bytes], codec: Optional[str],
+                         chunk_size: int) -> Iterator[str]:
+    """Decompress and decode stored output incrementally, chunk_size bytes at a time"""
+    if codec is not None:
+        chunks = _codec(codec).stream(chunks, chunk_size)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def _output_value(schema: str) -> str:
+    """SQL for the stored value of a salt_outputs row in schema"""
+    # Archive files hold their output inline (see _copy_to_archive())
+    return _OUTPUT_VALUE if schema == 'main' else 'output'
+
+
+def _payload_value(schema: str) -> str:
+    """SQL for the stored payload of a minion_results row in schema"""
+    return _PAYLOAD_VALUE if schema == 'main' else 'payload'
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """Whether an error means another connection holds a lock (SQLITE_BUSY)"""
+    return str(error).startswith(('database is locked', 'database is busy'))
+
+
+def _stored_size(value) -> int:
+    """Bytes a stored output value takes (text is stored as UTF-8)"""
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(value)
+
+
+class DatabaseStats(NamedTuple):
+    """Health of the history database, as shown by 'db stats'"""
+    path: str
+    file_size: int                  # bytes, main file only
+    wal_size: int                   # bytes of write-ahead log (0 without one)
+    page_size: int
+    page_count: int
+    freelist_count: int             # free pages, reclaimable by reclaim_space() or vacuum()
+    journal_mode: str
+    auto_vacuum: str
+    schema_version: int
+    tables: List[tuple]             # (name, rows, bytes or None)
+    search_index_size: Optional[int]
+    indexes: List[tuple]            # (name, table, bytes or None, rows per key or None)
+    largest_outputs: List[tuple]    # (command_id, command, stored bytes, codec)
+    blob_count: int                 # files in the blob store
+    blob_size: int                  # bytes they take
 
 
 class SaltCtlDatabase:
     """Handle SQLite database operations for SaltCtl"""
 
-    def __init__(self, db_path: str = None):
+    # Statements cached per connection; every query here is a fixed string,
+    # so each is prepared once per connection and reused
+    STATEMENT_CACHE_SIZE = 64
+
+    # Applied to every new connection
+    CONNECTION_PRAGMAS = (
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA cache_size = -8192',      # 8 MiB page cache
+        'PRAGMA mmap_size = 67108864',    # 64 MiB memory-mapped I/O
+        'PRAGMA temp_store = MEMORY',
+    )
+
+    # Retries (with exponential backoff and jitter) when another writer still
+    # holds the write lock after busy_timeout expires
+    BUSY_RETRIES = 5
+    BUSY_RETRY_DELAY = 0.05
+
+    # Outputs re-encoded per transaction by recompress(); bounds its memory use
+    RECOMPRESS_BATCH_SIZE = 50
+
+    # Commands deleted per transaction by trim_old_history(), and the pause
+    # between transactions that lets other shells' writes in
+    TRIM_BATCH_SIZE = 200
+    TRIM_BATCH_PAUSE = 0.01
+
+    # Free pages handed back to the filesystem per incremental_vacuum step
+    VACUUM_STEP_PAGES = 2048
+
+    # Most outputs dropped by the retention step run after each logged command
+    RETENTION_STEP_SIZE = 20
+
+    # Search index pages merged after deleting outputs; merging is what
+    # actually frees the space of deleted index entries
+    FTS_MERGE_PAGES = 256
+
+    # Bytes read (and decompressed) at a time when streaming stored output
+    STREAM_CHUNK_SIZE = 256 * 1024
+
+    # Command IDs reserved per write transaction when logging is write-behind
+    ID_BLOCK_SIZE = 16
+
+    # History rows fetched per query by iter_command_history()
+    HISTORY_PAGE_SIZE = 200
+
+    # Commands moved per transaction by archive_old_history()
+    ARCHIVE_BATCH_SIZE = 200
+
+    # Commands copied per transaction by import_history(); large batches
+    # keep the per-transaction overhead small next to the copying itself
+    IMPORT_BATCH_SIZE = 5000
+
+    # Attempts at the compacting copy made by optimize(vacuum=True) when
+    # other shells write to the database while it is being made
+    OPTIMIZE_VACUUM_ATTEMPTS = 3
+
+    # (table, column) pairs holding output encoded by encode_output()
+    COMPRESSED_COLUMNS = (('salt_outputs', 'output'), ('minion_results', 'payload'))
+
+    def __init__(self, db_path: str = None, journal_mode: str = 'wal',
+                 output_codec: str = 'zlib', write_behind: bool = False,
+                 retention: Optional[RetentionPolicy] = None, busy_timeout: float = 5.0,
+                 blob_threshold: int = 0):
         if db_path is None:
             db_path = os.path.expanduser("~/.saltctl.db")
         self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.output_codec = output_codec
+        # Outputs taking more than this many bytes once compressed are kept
+        # in the blob store beside the database (0: always inline)
+        self.blob_threshold = blob_threshold
+        self.blobs = BlobStore(blob_store_path(db_path))
+        self.retention = retention
+        # Why the last retention step failed, until the shell reports it
+        # (steps can run on the writer thread, so they don't print)
+        self.retention_error: Optional[Exception] = None
+        # Seconds SQLite waits for another connection's lock before SQLITE_BUSY
+        self.busy_timeout = busy_timeout
+        # Connections are long-lived and owned by one thread each
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        # Held shared by every transaction; see _vacuum_into()
+        self._swap_lock = SwapLock(db_path + '.lock')
+        # Write-behind logging: history writes are queued for a writer
+        # thread and committed in groups; see log_command()
+        self._writer: Optional[WriteBehindQueue] = None
+        self._id_lock = threading.Lock()
+        self._next_id = self._id_limit = 0
         self.init_db()
+        self.search_available = self._has_table('output_fts')
+        if write_behind:
+            self._writer = WriteBehindQueue(self._apply_write_batch)
+            atexit.register(self.flush)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open and tune a new connection"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            cached_statements=self.STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+            # For attaching import sources read-only (see _read_only_uri())
+            uri=True
+        )
+        for pragma in self.CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        # Used by migrations and bulk statements that can't do this in SQL
+        conn.create_function('saltctl_duration_bucket', 1, duration_bucket)
+        conn.create_function('saltctl_content_hash', 4, _content_hash)
+        conn.create_function('saltctl_blob', 1, self.blobs.read)
+        return conn
+
+    def _thread_connection(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
 
     @contextmanager
-    def _get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
-        try:
+    def _get_connection(self, write: bool = False):
+        """
+        Context manager for database connections (one transaction per use)
+
+        Args:
+            write: Take the write lock up front (see _begin_write())
+        """
+        # Queued writes go first, so every read sees this process's history
+        self.flush()
+        with self._transaction(write) as conn:
             yield conn
-            conn.commit()
-        finally:
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        """One transaction on the calling thread's connection, without flushing queued writes"""
+        conn = self._thread_connection()
+        with self._swap_lock.shared():
+            try:
+                if write:
+                    self._begin_write(conn)
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    def _begin_write(self, conn: sqlite3.Connection):
+        """
+        Start a write transaction, waiting for other writers to finish
+
+        Taking the write lock first (BEGIN IMMEDIATE) means a transaction
+        never fails halfway through: in WAL mode a read transaction can't
+        always be upgraded to a write, and then SQLite returns SQLITE_BUSY
+        without waiting. SQLite itself waits up to busy_timeout for the
+        lock; if another shell still holds it, retry with backoff before
+        giving up, so a dozen shells sharing one database queue up rather
+        than fail.
+        """
+        delay = self.BUSY_RETRY_DELAY
+        for attempt in range(self.BUSY_RETRIES + 1):
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == self.BUSY_RETRIES:
+                    raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+    def release_thread_connection(self):
+        """Close the calling thread's connection (for threads that are about to exit)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
             conn.close()
+        self._swap_lock.release_thread()
+
+    def flush(self):
+        """Wait until queued history writes are committed"""
+        if self._writer is not None:
+            self._writer.flush()
+
+    @property
+    def write_error(self) -> Optional[Exception]:
+        """Why queued history writes last failed (they are retried), or None"""
+        return self._writer.last_error if self._writer is not None else None
+
+    def clear_write_error(self):
+        """Forget a reported write error (the writes themselves stay queued)"""
+        if self._writer is not None:
+            self._writer.last_error = None
+
+    def close(self):
+        """Flush queued writes and close every connection; the database reopens on next use"""
+        if self._writer is not None:
+            self._writer.close()
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+        self._swap_lock.close()
 
     def init_db(self):
-        """Initialize database and create tables if they don't exist"""
+        """Initialize the database, creating or migrating its schema as needed"""
         with self._get_connection() as conn:
-            cursor = conn.cursor()
+            # Only takes effect on a new file (or the next VACUUM); lets
+            # reclaim_space() shrink the file after a trim
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # Journal mode is stored in the database file, so only needs setting once
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        self.migrate()
 
-            # Create command_history table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS command_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    username TEXT NOT NULL,
-                    selected_hosts TEXT,
-                    command TEXT NOT NULL,
-                    duration REAL
-                )
-            ''')
+    def _has_table(self, name: str) -> bool:
+        with self._get_connection() as conn:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+            ).fetchone() is not None
 
-            # Create salt_outputs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS salt_outputs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    command_id INTEGER NOT NULL,
-                    salt_command TEXT NOT NULL,
-                    output TEXT,
-                    return_code INTEGER,
-                    FOREIGN KEY (command_id) REFERENCES command_history (id)
-                )
-            ''')
+    @property
+    def schema_version(self) -> int:
+        """Schema version recorded in the database file"""
+        with self._get_connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def migrate(self):
+        """
+        Bring the schema up to SCHEMA_VERSION
+
+        Each migration runs in its own write transaction and bumps
+        PRAGMA user_version, so an interrupted upgrade resumes where it
+        stopped and concurrent shells never apply the same step twice.
+        """
+        with self._get_connection() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+                return
+
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            with self._get_connection(write=True) as conn:
+                current = conn.execute('PRAGMA user_version').fetchone()[0]
+                if current >= version:
+                    continue
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
 
     def log_command(self, username: str, selected_hosts: List[str],
                     command: str, duration: float) -> int:
         """
         Log a command to the database
 
+        With write-behind enabled the ID is taken from a block reserved in
+        advance and the row is queued for the writer thread, so this
+        doesn't wait for the disk.
+
         Args:
             username: Username of the user running the command
             selected_hosts: List of currently selected hosts
@@ -70,54 +868,386 @@ class SaltCtlDatabase:
         Returns:
             The ID of the inserted row
         """
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
+        now = datetime.now()
+        row = (now.isoformat(), int(now.timestamp()), username, json.dumps(selected_hosts),
+               command, duration, list(selected_hosts))
 
-            timestamp = datetime.now().isoformat()
-            hosts_json = json.dumps(selected_hosts)
+        if self._writer is not None:
+            command_id = self._reserve_command_id()
+            self._writer.put(('command', command_id) + row)
+            return command_id
 
-            cursor.execute('''
-                INSERT INTO command_history (timestamp, username, selected_hosts, command, duration)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (timestamp, username, hosts_json, command, duration))
+        with self._get_connection(write=True) as conn:
+            return self._insert_command(conn.cursor(), None, *row)
+
+    def _reserve_command_id(self) -> int:
+        """
+        Next command ID from this process's reserved block
 
-            return cursor.lastrowid
+        Blocks are reserved by advancing the AUTOINCREMENT sequence, so
+        other shells sharing the database never hand out the same IDs.
+        IDs left unused at exit are skipped.
+        """
+        with self._id_lock:
+            if self._next_id >= self._id_limit:
+                with self._transaction(write=True) as conn:
+                    last = conn.execute('''
+                        SELECT MAX(
+                            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'command_history'), 0),
+                            COALESCE((SELECT MAX(id) FROM command_history), 0)
+                        )
+                    ''').fetchone()[0]
+                    limit = last + self.ID_BLOCK_SIZE
+                    updated = conn.execute('''
+                        UPDATE sqlite_sequence SET seq = ? WHERE name = 'command_history'
+                    ''', (limit,)).rowcount
+                    if not updated:
+                        conn.execute('''
+                            INSERT INTO sqlite_sequence (name, seq) VALUES ('command_history', ?)
+                        ''', (limit,))
+                self._next_id, self._id_limit = last + 1, limit + 1
+            command_id = self._next_id
+            self._next_id += 1
+            return command_id
+
+    @staticmethod
+    def _insert_command(cursor, command_id: Optional[int], timestamp: str, epoch: int,
+                        username: str, hosts_json: str, command: str, duration: float,
+                        hosts: List[str], success: Optional[bool] = None) -> int:
+        cursor.execute('''
+            INSERT INTO command_history
+                (id, timestamp, epoch, username, selected_hosts, command, verb, duration, success, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (command_id, timestamp, epoch, username, hosts_json, command, _command_verb(command),
+              duration, success, _content_hash(timestamp, username, hosts_json, command)))
+        command_id = cursor.lastrowid
+        _link_command_hosts(cursor, command_id, hosts)
+        return command_id
 
     def log_salt_output(self, command_id: int, salt_command: str,
-                        output: str, return_code: int):
+                        output: str, return_code: int,
+                        minion_results: Sequence[tuple] = ()):
         """
         Log salt command output to the database
 
         Args:
             command_id: ID of the command in command_history table
-            salt_command: Type of salt command ("test" or "apply")
+            salt_command: Type of salt command ("test" or "apply", or the salt function run)
             output: Full output from the salt command
             return_code: Return code from the salt command
+            minion_results: Per-minion results (results.MinionResult tuples)
+                parsed from the output
         """
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
+        if self._writer is not None:
+            # Compression happens on the writer thread too
+            self._writer.put(('output', command_id, salt_command, output, return_code,
+                              list(minion_results)))
+            return
 
-            cursor.execute('''
-                INSERT INTO salt_outputs (command_id, salt_command, output, return_code)
-                VALUES (?, ?, ?, ?)
-            ''', (command_id, salt_command, output, return_code))
+        prepared = self._prepare_output(command_id, salt_command, output, return_code, minion_results)
+        with self._get_connection(write=True) as conn:
+            self._insert_output(conn.cursor(), *prepared)
+
+    def _prepare_output(self, command_id: int, salt_command: str, output: str,
+                        return_code: int, minion_results: Sequence[tuple]) -> tuple:
+        """
+        Compress an output and its per-minion results before taking the write lock
+
+        An output or per-minion payload larger than blob_threshold once
+        compressed is written to the blob store here too, so the write
+        lock is only held for the row that refers to it.
+        """
+        value, codec = encode_output(output, self.output_codec)
+        value, blob_hash = self._put_blob(value)
+        rows = []
+        for minion, success, changed_count, failed_count, duration, payload in minion_results:
+            payload_value, payload_codec = encode_output(payload, self.output_codec)
+            payload_value, payload_hash = self._put_blob(payload_value)
+            rows.append((command_id, minion, success, changed_count, failed_count,
+                         duration, payload_value, payload_codec, payload_hash))
+        return (command_id, salt_command, output, value, codec, return_code, rows, blob_hash)
+
+    def _put_blob(self, value) -> tuple:
+        """(value, None), or (bytes, hash) for a value over blob_threshold, now in the blob store"""
+        if not self.blob_threshold or value is None or _stored_size(value) <= self.blob_threshold:
+            return (value, None)
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return (value, self.blobs.put(value))
+
+    def _blob_reference(self, value, blob_hash: Optional[str]) -> tuple:
+        """
+        (value, None) for an inline value, or (None, size) for one in the blob store
+
+        Another shell may have collected an identical, then unreferenced,
+        blob since _put_blob() wrote it; with the write lock held it can't
+        again, so it is written back if missing.
+        """
+        if blob_hash is None:
+            return (value, None)
+        if blob_hash not in self.blobs:
+            self.blobs.put(value)
+        return (None, len(value))
+
+    def _insert_output(self, cursor, command_id: int, salt_command: str, output: str,
+                       value, codec: Optional[str], return_code: int, rows: List[tuple],
+                       blob_hash: Optional[str] = None):
+        indexed = 1 if self.search_available and output is not None else None
+        value, blob_size = self._blob_reference(value, blob_hash)
+        cursor.execute('''
+            INSERT INTO salt_outputs
+                (command_id, salt_command, output, return_code, codec, fts_indexed, blob_hash, blob_size,
+                 command_epoch)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, (SELECT epoch FROM command_history WHERE id = ?))
+        ''', (command_id, salt_command, value, return_code, codec, indexed, blob_hash, blob_size,
+              command_id))
+        if indexed:
+            cursor.execute('INSERT INTO output_fts (rowid, output) VALUES (?, ?)',
+                           (cursor.lastrowid, output))
+
+        results = []
+        for row in rows:
+            payload, payload_size = self._blob_reference(row[6], row[8])
+            results.append(row[:6] + (payload, row[7], row[8], payload_size))
+        cursor.executemany('''
+            INSERT INTO minion_results
+                (command_id, minion, success, changed_count, failed_count, duration, payload, codec,
+                 blob_hash, blob_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', results)
 
-    def update_command_duration(self, command_id: int, duration: float):
+    def update_command_duration(self, command_id: int, duration: float,
+                                success: Optional[bool] = None):
         """
         Update the duration of a command after execution
 
+        This marks the end of a logged command: it is counted in the
+        command statistics, and the retention policy (if any) takes a
+        step afterwards.
+
         Args:
             command_id: ID of the command in command_history table
             duration: Duration in seconds the command took
+            success: Whether the command succeeded (None if unknown)
         """
-        with self._get_connection() as conn:
+        if self._writer is not None:
+            self._writer.put(('duration', command_id, duration, success))
+            return
+
+        with self._get_connection(write=True) as conn:
             cursor = conn.cursor()
+            self._update_duration(cursor, command_id, duration, success)
+            self._count_command(cursor, command_id)
+        self.enforce_retention([command_id])
+
+    @staticmethod
+    def _update_duration(cursor, command_id: int, duration: float, success: Optional[bool]):
+        cursor.execute('''
+            UPDATE command_history
+            SET duration = ?, success = ?
+            WHERE id = ?
+        ''', (duration, success, command_id))
 
+    @staticmethod
+    def _count_command(cursor, command_id: int, last_id: Optional[int] = None):
+        """Add finished commands (IDs command_id to last_id) to their hours' histograms in command_stats"""
+        counts = cursor.execute(f'''
+            SELECT epoch / {STATS_PERIOD}, COALESCE(verb, ''), username, COALESCE(selected_hosts, '[]'),
+                   saltctl_duration_bucket(duration),
+                   COUNT(*), COUNT(success), COALESCE(SUM(success = 0), 0), MAX(COALESCE(duration, 0))
+            FROM command_history
+            WHERE id BETWEEN ? AND ? AND epoch IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5
+        ''', (command_id, command_id if last_id is None else last_id)).fetchall()
+        for row in counts:
+            key = row[:5]
             cursor.execute('''
-                UPDATE command_history
-                SET duration = ?
-                WHERE id = ?
-            ''', (duration, command_id))
+                INSERT OR IGNORE INTO command_stats (period, verb, username, selected_hosts, bucket)
+                VALUES (?, ?, ?, ?, ?)
+            ''', key)
+            cursor.execute('''
+                UPDATE command_stats
+                SET commands = commands + ?,
+                    outcomes = outcomes + ?,
+                    failures = failures + ?,
+                    longest = MAX(longest, ?)
+                WHERE period = ? AND verb = ? AND username = ? AND selected_hosts = ? AND bucket = ?
+            ''', row[5:] + key)
+
+    def command_stats(self, group_by: str = 'verb', since: Optional[int] = None) -> List[CommandStats]:
+        """
+        Command counts, duration percentiles and failure rates
+
+        Read from the hourly histograms in command_stats, so the cost
+        depends on the window and the number of groups, not on the size
+        of the history. The window starts at the beginning of since's hour.
+
+        Args:
+            group_by: 'verb', 'user' or 'hosts' (the selected host set)
+            since: Only commands at or after this epoch
+
+        Returns:
+            One summary per group, busiest first
+        """
+        column = GROUP_COLUMNS[group_by]
+        period = 0 if since is None else since // STATS_PERIOD
+        with self._get_connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {column}, bucket, SUM(commands), SUM(outcomes), SUM(failures), MAX(longest)
+                FROM command_stats
+                WHERE period >= ?
+                GROUP BY {column}, bucket
+            ''', (period,)).fetchall()
+        return summarize(rows)
+
+    def _apply_write_batch(self, ops: List[tuple]):
+        """
+        Write a batch of queued operations in one transaction (on the writer thread)
+
+        A command whose duration (and output) arrive in the same batch,
+        as they do for quick commands, is inserted complete rather than
+        inserted and then updated. Outputs are compressed before the write
+        lock is taken, so other shells wait only for the inserts.
+        """
+        # Command rows by ID: (timestamp, epoch, username, hosts_json, command, duration, hosts, success)
+        commands: Dict[int, list] = {}
+        for op in ops:
+            if op[0] == 'command':
+                commands[op[1]] = list(op[2:]) + [None]
+            elif op[0] == 'duration' and op[1] in commands:
+                commands[op[1]][5] = op[2]
+                commands[op[1]][7] = op[3]
+        outputs = [self._prepare_output(*op[1:]) for op in ops if op[0] == 'output']
+
+        with self._transaction(write=True) as conn:
+            cursor = conn.cursor()
+            for op in ops:
+                kind, command_id = op[0], op[1]
+                if kind == 'command':
+                    self._insert_command(cursor, command_id, *commands[command_id])
+                elif kind == 'duration':
+                    if command_id not in commands:
+                        self._update_duration(cursor, command_id, op[2], op[3])
+                    self._count_command(cursor, command_id)
+                elif kind == 'output':
+                    self._insert_output(cursor, *outputs.pop(0))
+
+        self.enforce_retention([op[1] for op in ops if op[0] == 'duration'])
+
+    def enforce_retention(self, command_ids: Sequence[int] = ()) -> int:
+        """
+        Take one bounded step towards the retention policy
+
+        Drops at most RETENTION_STEP_SIZE outputs in one short transaction,
+        so the cost of a purge is spread over the commands that follow
+        rather than paid all at once. A failed step is left for the next
+        one, and the error kept in retention_error for the caller to report.
+
+        Args:
+            command_ids: Commands finished since the last step (their host
+                set and verb are checked against the count limits)
+
+        Returns:
+            Number of outputs dropped
+        """
+        if self.retention is None or not self.retention.enabled:
+            return 0
+        try:
+            with self._transaction(write=True) as conn:
+                cursor = conn.cursor()
+                output_ids = select_outputs(cursor, self.retention, command_ids,
+                                            self.RETENTION_STEP_SIZE)
+                blob_hashes = self._drop_outputs(cursor, output_ids)
+            self._collect_blobs(blob_hashes)
+            if output_ids and self.retention.max_db_size > 0:
+                self.reclaim_space()
+        except sqlite3.Error as e:
+            self.retention_error = e
+            return 0
+        return len(output_ids)
+
+    def _drop_outputs(self, cursor, output_ids: List[int]) -> List[str]:
+        """
+        Delete stored outputs (and their per-minion output), keeping the commands and result summaries
+
+        Returns:
+            Blob hashes the deleted outputs referred to (see _collect_blobs())
+        """
+        if not output_ids:
+            return []
+        placeholders = ','.join('?' * len(output_ids))
+        if self.search_available:
+            self._unindex_outputs(cursor, f'''
+                SELECT id, {_OUTPUT_VALUE}, codec FROM salt_outputs
+                WHERE id IN ({placeholders}) AND fts_indexed = 1
+            ''', output_ids)
+        commands = f'SELECT command_id FROM salt_outputs WHERE id IN ({placeholders})'
+        blob_hashes = self._command_blobs(cursor, commands, output_ids)
+        cursor.execute(f'''
+            UPDATE minion_results SET payload = NULL, codec = NULL, blob_hash = NULL, blob_size = NULL
+            WHERE command_id IN ({commands})
+        ''', output_ids)
+        cursor.execute(f'DELETE FROM salt_outputs WHERE id IN ({placeholders})', output_ids)
+        self._merge_search_index(cursor)
+        return blob_hashes
+
+    @staticmethod
+    def _command_blobs(cursor, commands: str, params, schema: str = 'main') -> List[str]:
+        """
+        Blob hashes the outputs and per-minion payloads of some commands refer to
+
+        Args:
+            commands: SQL query selecting the command ids
+            params: Parameters for that query
+        """
+        return [row[0] for row in cursor.execute(f'''
+            SELECT blob_hash FROM {schema}.salt_outputs
+            WHERE command_id IN ({commands}) AND blob_hash IS NOT NULL
+            UNION
+            SELECT blob_hash FROM {schema}.minion_results
+            WHERE command_id IN ({commands}) AND blob_hash IS NOT NULL
+        ''', tuple(params) * 2)]
+
+    def _collect_blobs(self, blob_hashes: Optional[Iterable[str]] = None) -> int:
+        """
+        Delete blob store files no output or per-minion payload refers to any more
+
+        The files are removed inside a write transaction that changes
+        nothing: holding the write lock keeps other shells from adding a
+        reference meanwhile, and _insert_output() rewrites a blob that
+        went missing after it was written, so a file is never removed
+        from under a new row.
+
+        Args:
+            blob_hashes: Blobs to check (default: every file in the store)
+
+        Returns:
+            Number of files removed
+        """
+        candidates = set(self.blobs.hashes() if blob_hashes is None else blob_hashes)
+        if not candidates:
+            return 0
+        removed = 0
+        with self._transaction(write=True) as conn:
+            referenced = {row[0] for row in conn.execute('''
+                SELECT blob_hash FROM main.salt_outputs WHERE blob_hash IS NOT NULL
+                UNION
+                SELECT blob_hash FROM main.minion_results WHERE blob_hash IS NOT NULL
+            ''')}
+            for blob_hash in candidates - referenced:
+                removed += self.blobs.remove(blob_hash)
+        return removed
+
+    def _merge_search_index(self, cursor):
+        """
+        Do a bounded amount of search index merging
+
+        Deleting from a contentless FTS5 index only records delete markers;
+        the space is freed when segments holding them are merged.
+        """
+        if self.search_available:
+            cursor.execute("INSERT INTO output_fts (output_fts, rank) VALUES ('merge', ?)",
+                           (-self.FTS_MERGE_PAGES,))
 
     def get_command_by_id(self, command_id: int) -> Optional[tuple]:
         """
@@ -129,12 +1259,12 @@ class SaltCtlDatabase:
         Returns:
             Tuple of (id, command, timestamp) or None if not found
         """
-        with self._get_connection() as conn:
+        with self._command_schema(command_id) as schema, self._get_connection() as conn:
             cursor = conn.cursor()
 
-            cursor.execute('''
+            cursor.execute(f'''
                 SELECT id, command, timestamp
-                FROM command_history
+                FROM {schema}.command_history
                 WHERE id = ?
             ''', (command_id,))
 
@@ -153,7 +1283,7 @@ class SaltCtlDatabase:
             cursor.execute('''
                 SELECT id, command, timestamp
                 FROM command_history
-                ORDER BY id DESC
+                ORDER BY epoch DESC, id DESC
                 LIMIT 1
             ''')
 
@@ -169,91 +1299,1386 @@ class SaltCtlDatabase:
         Returns:
             Tuple of (salt_command, output, return_code) or None if not found
         """
+        with self._command_schema(command_id) as schema, self._get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(f'''
+                SELECT salt_command, {_output_value(schema)}, return_code, codec
+                FROM {schema}.salt_outputs
+                WHERE command_id = ?
+            ''', (command_id,))
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        salt_command, value, return_code, codec = row
+        return (salt_command, decode_output(value, codec), return_code)
+
+    def iter_salt_output(self, command_id: int) -> Optional[tuple]:
+        """
+        Get salt output for a command as a stream of text chunks
+
+        The stored value is read with incremental blob I/O (Python 3.11+),
+        or memory-mapped from the blob store, and decompressed as it is
+        read, so memory use doesn't grow with the size of the output. The chunks are read in one transaction;
+        close the iterator if it isn't read to the end.
+
+        Args:
+            command_id: ID of the command
+
+        Returns:
+            Tuple of (salt_command, return_code, chunks) or None if not found
+        """
+        # An archived command's file stays attached until the stream ends
+        schema = self._attach_command_archive(command_id)
+        try:
+            stream = self._output_stream(schema, command_id, detach_archive=True)
+        except BaseException:
+            self._detach_archive()
+            raise
+        if stream is None:
+            self._detach_archive()
+        return stream
+
+    def _output_stream(self, schema: str, command_id: int,
+                       detach_archive: bool = False) -> Optional[tuple]:
+        """(salt_command, return_code, chunks) of a command's output in schema, or None"""
+        # Archive files have no blob_hash column
+        blob_column = 'blob_hash' if schema == 'main' else 'NULL'
         with self._get_connection() as conn:
+            row = conn.execute(f'''
+                SELECT id, salt_command, return_code, codec, {blob_column}
+                FROM {schema}.salt_outputs
+                WHERE command_id = ?
+            ''', (command_id,)).fetchone()
+        if row is None:
+            return None
+
+        row_id, salt_command, return_code, codec, blob_hash = row
+        if blob_hash is not None:
+            raw = self.blobs.iter_chunks(blob_hash, self.STREAM_CHUNK_SIZE)
+        else:
+            raw = self._iter_output_bytes(row_id, schema, detach_archive)
+        return (salt_command, return_code, decode_output_stream(raw, codec, self.STREAM_CHUNK_SIZE))
+
+    def _iter_output_bytes(self, row_id: int, schema: str = 'main',
+                           detach_archive: bool = True) -> Iterator[bytes]:
+        """
+        Stored bytes of one salt_outputs value, in STREAM_CHUNK_SIZE pieces
+
+        An attached archive is detached at the end unless detach_archive is False.
+        """
+        conn = self._thread_connection()
+        size = self.STREAM_CHUNK_SIZE
+        # A read transaction keeps the value stable while it is streamed
+        conn.execute('BEGIN')
+        try:
+            if hasattr(conn, 'blobopen'):
+                try:
+                    blob = conn.blobopen('salt_outputs', 'output', row_id, readonly=True, name=schema)
+                except sqlite3.OperationalError:
+                    # NULL output (or the row was just deleted)
+                    return
+                with blob:
+                    while True:
+                        data = blob.read(size)
+                        if not data:
+                            break
+                        yield data
+            else:
+                row = conn.execute(f'SELECT output FROM {schema}.salt_outputs WHERE id = ?', (row_id,)).fetchone()
+                value = row[0] if row else None
+                if isinstance(value, str):
+                    for start in range(0, len(value), size):
+                        yield value[start:start + size].encode('utf-8')
+                elif value is not None:
+                    for start in range(0, len(value), size):
+                        yield bytes(value[start:start + size])
+        finally:
+            conn.commit()
+            if schema == 'archive' and detach_archive:
+                self._detach_archive()
+
+    def get_minion_results(self, command_id: int) -> List[tuple]:
+        """
+        Get the per-minion results of a command, without their payloads
+
+        Returns:
+            List of tuples (minion, success, changed_count, failed_count, duration)
+            in the order the minions returned
+        """
+        with self._command_schema(command_id) as schema, self._get_connection() as conn:
             cursor = conn.cursor()
 
-            cursor.execute('''
-                SELECT salt_command, output, return_code
-                FROM salt_outputs
+            cursor.execute(f'''
+                SELECT minion, success, changed_count, failed_count, duration
+                FROM {schema}.minion_results
                 WHERE command_id = ?
+                ORDER BY id
             ''', (command_id,))
 
-            return cursor.fetchone()
+            return [(minion, None if success is None else bool(success), changed, failed, duration)
+                    for minion, success, changed, failed, duration in cursor.fetchall()]
+
+    def get_minion_output(self, command_id: int, minion: str) -> Optional[str]:
+        """
+        Get one minion's section of a command's output
+
+        Returns:
+            The minion's output, or None if it has no stored result for the command
+        """
+        with self._command_schema(command_id) as schema, self._get_connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(f'''
+                SELECT {_payload_value(schema)}, codec
+                FROM {schema}.minion_results
+                WHERE command_id = ? AND minion = ?
+            ''', (command_id, minion))
+            row = cursor.fetchone()
+
+        if row is None or row[0] is None:
+            return None
+        return decode_output(*row)
 
     def get_command_history(self, selected_hosts: Optional[List[str]] = None,
-                           limit: int = 50) -> List[tuple]:
+                           limit: Optional[int] = 50, since: Optional[int] = None,
+                           until: Optional[int] = None) -> List[tuple]:
         """
-        Get command history, optionally filtered by selected hosts
+        Get command history, optionally filtered by selected hosts and time
+
+        Archive files are only attached when since reaches back into a
+        month that has been archived.
 
         Args:
-            selected_hosts: List of hosts to filter by, or None for all commands
-            limit: Maximum number of commands to return
+            selected_hosts: Only return commands run against any of these hosts,
+                or None for all commands
+            limit: Maximum number of commands to return (None for all)
+            since: Only commands at or after this epoch
+            until: Only commands before this epoch
 
         Returns:
-            List of tuples (id, timestamp, username, selected_hosts_json, command, duration)
+            List of tuples (id, timestamp, username, hosts, command, duration),
+            newest first, with hosts the host names joined by ', '
         """
+        archives = self._archives_between(since, until) if since is not None else []
+
         with self._get_connection() as conn:
             cursor = conn.cursor()
-
             if selected_hosts:
-                selected_json = json.dumps(selected_hosts)
+                # Host lists can be longer than SQLite's bound-parameter limit,
+                # so the filter goes through a per-connection temp table
                 cursor.execute('''
-                    SELECT id, timestamp, username, selected_hosts, command, duration
-                    FROM command_history
-                    WHERE selected_hosts = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (selected_json, limit))
+                    CREATE TEMP TABLE IF NOT EXISTS host_filter (name TEXT PRIMARY KEY)
+                ''')
+                cursor.execute('DELETE FROM temp.host_filter')
+                cursor.executemany('INSERT OR IGNORE INTO temp.host_filter (name) VALUES (?)',
+                                   [(host,) for host in selected_hosts])
+            rows = self._history_rows(cursor, 'main', bool(selected_hosts), limit, since, until)
+
+        for path in archives:
+            with self._attached_archive(path), self._get_connection() as conn:
+                rows += self._history_rows(conn.cursor(), 'archive', bool(selected_hosts),
+                                           limit, since, until)
+
+        if archives:
+            rows.sort(key=lambda row: (row[-1], row[0]), reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        return [row[:-1] for row in rows]
+
+    @staticmethod
+    def _history_rows(cursor, schema: str, host_filter: bool, limit: Optional[int],
+                      since: Optional[int], until: Optional[int], username: Optional[str] = None,
+                      verb: Optional[str] = None, position: Optional[tuple] = None,
+                      ascending: bool = False) -> List[tuple]:
+        """
+        History rows (with their epoch last) from one schema, newest first
+
+        position is an (epoch, id) keyset: only rows after it in the
+        requested order are returned. It is written as a range on epoch
+        plus a tie-break on id, so the epoch index serves both the range
+        and the ORDER BY however deep into the history a page is.
+
+        Host names are read from command_hosts rather than decoding each
+        row's selected_hosts JSON.
+        """
+        conditions = []
+        params: List = []
+        if username is not None:
+            conditions.append('username = ?')
+            params.append(username)
+        if verb is not None:
+            conditions.append('verb = ?')
+            params.append(verb)
+        if position is not None:
+            if ascending:
+                conditions.append('epoch >= ? AND (epoch > ? OR id > ?)')
             else:
-                cursor.execute('''
-                    SELECT id, timestamp, username, selected_hosts, command, duration
-                    FROM command_history
-                    ORDER BY timestamp DESC
+                conditions.append('epoch <= ? AND (epoch < ? OR id < ?)')
+            params.extend((position[0], position[0], position[1]))
+        if host_filter:
+            conditions.append(f'''id IN (
+                SELECT ch.command_id
+                FROM temp.host_filter f
+                JOIN {schema}.hosts h ON h.name = f.name
+                JOIN {schema}.command_hosts ch ON ch.host_id = h.id
+            )''')
+        if since is not None:
+            conditions.append('epoch >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append('epoch < ?')
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        params.append(-1 if limit is None else limit)
+        order = 'ASC' if ascending else 'DESC'
+
+        return cursor.execute(f'''
+            SELECT id, timestamp, username, (
+                SELECT group_concat(h.name, ', ')
+                FROM {schema}.command_hosts ch
+                JOIN {schema}.hosts h ON h.id = ch.host_id
+                WHERE ch.command_id = c.id
+            ), command, duration, epoch
+            FROM {schema}.command_history c
+            {where}
+            ORDER BY epoch {order}, id {order}
+            LIMIT ?
+        ''', params).fetchall()
+
+    def iter_command_history(self, selected_hosts: Optional[List[str]] = None,
+                             username: Optional[str] = None, verb: Optional[str] = None,
+                             since: Optional[int] = None, until: Optional[int] = None,
+                             before: Optional[int] = None, after: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Stream command history a page at a time, for browsing it all
+
+        Pages are fetched with keyset pagination on (epoch, id) as the
+        iterator is consumed, each in its own short read transaction, so
+        reading deep into millions of rows costs the same per page as the
+        first one and nothing is locked while the caller (a pager) waits.
+        Archive files are attached when since, or the before/after
+        command, reaches into an archived month.
+
+        Args:
+            selected_hosts: Only commands run against any of these hosts
+            username: Only commands run by this user
+            verb: Only this command, e.g. 'push'
+            since: Only commands at or after this epoch
+            until: Only commands before this epoch
+            before: Only commands older than this command ID (newest first)
+            after: Only commands newer than this command ID (oldest first)
+
+        Yields:
+            Tuples (id, timestamp, username, hosts, command, duration) as from
+            get_command_history(), newest first (oldest first when after is given)
+
+        Raises:
+            ValueError: before or after isn't a known command ID
+        """
+        for _schema, row in self._iter_history(selected_hosts, username, verb, since, until,
+                                               before, after):
+            yield row[:-1]
+
+    def _iter_history(self, selected_hosts: Optional[List[str]], username: Optional[str],
+                      verb: Optional[str], since: Optional[int], until: Optional[int],
+                      before: Optional[int], after: Optional[int],
+                      oldest_first: bool = False) -> Iterator[tuple]:
+        """(schema, row with its epoch last) for iter_command_history() and export"""
+        ascending = after is not None or oldest_first
+        anchor_id = after if ascending else before
+        position = None
+        archived_anchor = False
+        if anchor_id is not None:
+            with self._command_schema(anchor_id) as schema, self._get_connection() as conn:
+                row = conn.execute(f'SELECT epoch FROM {schema}.command_history WHERE id = ?',
+                                   (anchor_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"No command with ID {anchor_id}")
+            position = (row[0], anchor_id)
+            archived_anchor = schema == 'archive'
+
+        archives: List[str] = []
+        if since is not None or archived_anchor:
+            low, high = since, until
+            if position is not None and ascending:
+                low = max(low or 0, position[0])
+            elif position is not None:
+                high = position[0] + 1 if high is None else min(high, position[0] + 1)
+            archives = self._archives_between(low, high)
+
+        if selected_hosts:
+            with self._get_connection() as conn:
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS host_filter (name TEXT PRIMARY KEY)')
+                conn.execute('DELETE FROM temp.host_filter')
+                conn.executemany('INSERT OR IGNORE INTO temp.host_filter (name) VALUES (?)',
+                                 [(host,) for host in selected_hosts])
+
+        filters = (bool(selected_hosts), since, until, username, verb, position, ascending)
+        live = (('main', row) for row in self._history_pages('main', *filters))
+        if not archives:
+            yield from live
+            return
+        # Archived months follow one another, but imported history can put
+        # old entries in the main database, so the two are merged
+        archived = self._archived_history(archives if ascending else archives[::-1], *filters)
+        try:
+            yield from heapq.merge(archived, live, key=lambda entry: (entry[1][-1], entry[1][0]),
+                                   reverse=not ascending)
+        finally:
+            # Detach the archive now rather than whenever archived is collected
+            archived.close()
+
+    def _history_pages(self, schema: str, host_filter: bool, since: Optional[int],
+                       until: Optional[int], username: Optional[str], verb: Optional[str],
+                       position: Optional[tuple], ascending: bool) -> Iterator[tuple]:
+        """History rows of one schema from position on, fetched a page per query"""
+        while True:
+            with self._get_connection() as conn:
+                rows = self._history_rows(conn.cursor(), schema, host_filter, self.HISTORY_PAGE_SIZE,
+                                          since, until, username, verb, position, ascending)
+            yield from rows
+            if len(rows) < self.HISTORY_PAGE_SIZE:
+                return
+            position = (rows[-1][-1], rows[-1][0])
+
+    def _archived_history(self, archives: List[str], *filters) -> Iterator[tuple]:
+        """(schema, row) from each archive in turn, attached while it is read"""
+        for path in archives:
+            self._attach_archive(path)
+            try:
+                for row in self._history_pages('archive', *filters):
+                    yield 'archive', row
+            finally:
+                self._detach_archive()
+
+    def iter_history_export(self, since: Optional[int] = None, until: Optional[int] = None,
+                            with_output: bool = False) -> Iterator[tuple]:
+        """
+        Stream command history, oldest first, for exporting
+
+        Pages are read as for iter_command_history(), archived months
+        included. Each output is streamed from the same file as its
+        command, so it must be read (or closed) before the next entry
+        is taken.
+
+        Args:
+            since: Only commands at or after this epoch
+            until: Only commands before this epoch
+            with_output: Stream each command's stored output too
+
+        Yields:
+            Tuples (row, output): row as from iter_command_history(), and
+            output None or (salt_command, return_code, chunks) as from
+            iter_salt_output()
+        """
+        since = 0 if since is None else since
+        for schema, row in self._iter_history(None, None, None, since, until, None, None,
+                                              oldest_first=True):
+            output = self._output_stream(schema, row[0]) if with_output else None
+            yield row[:-1], output
+
+    def recompress(self, codec: Optional[str] = None,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int, int]:
+        """
+        Re-encode stored outputs with a codec, a batch at a time
+
+        Each batch is read, re-encoded and written back in its own
+        transaction, so memory use is bounded and other shells are only
+        blocked briefly. Outputs in the blob store keep their codec.
+
+        Args:
+            codec: Codec to convert to (default: the configured codec; 'none' for plain text)
+            progress: Called with (rows done, total rows) after each batch
+
+        Returns:
+            Tuple of (values converted, bytes before, bytes after) for converted values
+        """
+        codec = codec or self.output_codec
+        with self._get_connection() as conn:
+            total = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                        for table, _column in self.COMPRESSED_COLUMNS)
+
+        done = converted = before = after = 0
+        for table, column in self.COMPRESSED_COLUMNS:
+            last_id = 0
+            while True:
+                with self._get_connection() as conn:
+                    rows = conn.execute(f'''
+                        SELECT id, {column}, codec FROM {table}
+                        WHERE id > ?
+                        ORDER BY id
+                        LIMIT ?
+                    ''', (last_id, self.RECOMPRESS_BATCH_SIZE)).fetchall()
+                if not rows:
+                    break
+
+                # Re-encode outside the write transaction; a row changed
+                # meanwhile (e.g. dropped by retention) is left alone
+                updates = []
+                for row_id, value, old_codec in rows:
+                    if old_codec == codec or value is None:
+                        continue
+                    text = decode_output(value, old_codec)
+                    new_value, new_codec = encode_output(text, codec)
+                    if new_codec == old_codec:
+                        continue
+                    updates.append((new_value, new_codec, row_id, old_codec))
+                    before += _stored_size(value)
+                    after += _stored_size(new_value)
+                with self._get_connection(write=True) as conn:
+                    conn.executemany(f'''
+                        UPDATE {table} SET {column} = ?, codec = ?
+                        WHERE id = ? AND codec IS ? AND {column} IS NOT NULL
+                    ''', updates)
+
+                converted += len(updates)
+                done += len(rows)
+                last_id = rows[-1][0]
+                if progress is not None:
+                    progress(done, total)
+
+        return (converted, before, after)
+
+    def _unindex_outputs(self, cursor, select_sql: str, params: tuple):
+        """
+        Remove outputs from the full-text index before they are deleted
+
+        A contentless FTS5 index needs the original text to delete a row,
+        so each output is decompressed again. select_sql must yield
+        (id, output, codec) for indexed rows only: deleting a row that
+        was never added corrupts the index.
+        """
+        for row_id, value, codec in cursor.execute(select_sql, params).fetchall():
+            cursor.execute('''
+                INSERT INTO output_fts (output_fts, rowid, output) VALUES ('delete', ?, ?)
+            ''', (row_id, decode_output(value, codec)))
+
+    def search_outputs(self, query: str, limit: int = 20) -> List[tuple]:
+        """
+        Find stored outputs matching a full-text query
+
+        Only the matching commands are returned, not their output: use
+        iter_salt_output() to read as much of it as is needed.
+
+        Args:
+            query: FTS5 query; text that isn't valid query syntax is searched as a phrase
+            limit: Maximum number of outputs to return
+
+        Returns:
+            List of tuples (command_id, timestamp, command, hosts), oldest first, where
+            hosts are the minions with a stored result (or else the command's hosts)
+
+        Raises:
+            RuntimeError: SQLite lacks FTS5
+        """
+        if not self.search_available:
+            raise RuntimeError("Output search needs SQLite built with FTS5")
+
+        sql = '''
+            SELECT c.id, c.timestamp, c.command
+            FROM output_fts f
+            JOIN salt_outputs o ON o.id = f.rowid
+            JOIN command_history c ON c.id = o.command_id
+            WHERE output_fts MATCH ?
+            ORDER BY o.id
+            LIMIT ?
+        '''
+        with self._get_connection() as conn:
+            try:
+                rows = conn.execute(sql, (query, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # e.g. "Permission denied: /etc" (':' is column filter syntax)
+                phrase = '"' + query.replace('"', '""') + '"'
+                rows = conn.execute(sql, (phrase, limit)).fetchall()
+            hosts = self._result_hosts(conn, [row[0] for row in rows])
+
+        return [(command_id, timestamp, command, hosts.get(command_id, []))
+                for command_id, timestamp, command in rows]
+
+    @staticmethod
+    def _result_hosts(conn, command_ids: List[int]) -> dict:
+        """Minions with a stored result for each command, or else its hosts"""
+        if not command_ids:
+            return {}
+        placeholders = ','.join('?' * len(command_ids))
+        hosts: dict = {}
+        for command_id, minion in conn.execute(f'''
+            SELECT command_id, minion FROM minion_results
+            WHERE command_id IN ({placeholders})
+            ORDER BY id
+        ''', command_ids):
+            hosts.setdefault(command_id, []).append(minion)
+        without_results = [command_id for command_id in command_ids if command_id not in hosts]
+        if without_results:
+            placeholders = ','.join('?' * len(without_results))
+            for command_id, name in conn.execute(f'''
+                SELECT ch.command_id, h.name FROM command_hosts ch
+                JOIN hosts h ON h.id = ch.host_id
+                WHERE ch.command_id IN ({placeholders})
+                ORDER BY h.name
+            ''', without_results):
+                hosts.setdefault(command_id, []).append(name)
+        return hosts
+
+    def unindexed_output_count(self) -> int:
+        """Number of stored outputs not yet in the full-text index"""
+        if not self.search_available:
+            return 0
+        with self._get_connection() as conn:
+            return conn.execute('''
+                SELECT COUNT(*) FROM salt_outputs
+                WHERE fts_indexed IS NULL AND (output IS NOT NULL OR blob_hash IS NOT NULL)
+            ''').fetchone()[0]
+
+    def reindex_outputs(self, progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Rebuild the full-text index over every stored output, a batch at a time
+
+        Outputs are indexed newest first so searches cover recent history
+        soonest. Each batch commits with its rows marked as indexed, so an
+        interrupted rebuild leaves a consistent index.
+
+        Args:
+            progress: Called with (outputs done, total outputs) after each batch
+
+        Returns:
+            Number of outputs indexed
+
+        Raises:
+            RuntimeError: SQLite lacks FTS5
+        """
+        with self._get_connection(write=True) as conn:
+            cursor = conn.cursor()
+            if not _create_output_fts(cursor):
+                raise RuntimeError("Output search needs SQLite built with FTS5")
+            cursor.execute("INSERT INTO output_fts (output_fts) VALUES ('delete-all')")
+            cursor.execute('UPDATE salt_outputs SET fts_indexed = NULL WHERE fts_indexed IS NOT NULL')
+            total = cursor.execute('''
+                SELECT COUNT(*) FROM salt_outputs WHERE output IS NOT NULL OR blob_hash IS NOT NULL
+            ''').fetchone()[0]
+        self.search_available = True
+        return self._index_outputs(0, total, progress)
+
+    def _index_outputs(self, after_id: int, total: int,
+                       progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """Add unindexed outputs with IDs above after_id to the search index, newest first"""
+        done = 0
+        while True:
+            with self._get_connection(write=True) as conn:
+                rows = conn.execute(f'''
+                    SELECT id, {_OUTPUT_VALUE}, codec FROM salt_outputs
+                    WHERE fts_indexed IS NULL AND (output IS NOT NULL OR blob_hash IS NOT NULL) AND id > ?
+                    ORDER BY id DESC
                     LIMIT ?
-                ''', (limit,))
+                ''', (after_id, self.RECOMPRESS_BATCH_SIZE)).fetchall()
+                if not rows:
+                    break
+                conn.executemany('INSERT INTO output_fts (rowid, output) VALUES (?, ?)',
+                                 [(row_id, decode_output(value, codec)) for row_id, value, codec in rows])
+                conn.executemany('UPDATE salt_outputs SET fts_indexed = 1 WHERE id = ?',
+                                 [(row[0],) for row in rows])
+
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
+
+        return done
+
+    def _cutoff_epoch(self, conn, cutoff_iso: str) -> int:
+        """Epoch of a local-time ISO date, computed the way the epoch column is filled"""
+        cutoff_epoch = conn.execute(f"SELECT {_EPOCH_OF.format('?')}", (cutoff_iso,)).fetchone()[0]
+        if cutoff_epoch is None:
+            raise ValueError(f"Invalid cutoff date: {cutoff_iso}")
+        return cutoff_epoch
+
+    def estimate_trim(self, cutoff_iso: str) -> Tuple[int, int, int]:
+        """
+        What trim_old_history() would delete, without deleting anything
+
+        Args:
+            cutoff_iso: ISO format date string for cutoff
 
-            return cursor.fetchall()
+        Returns:
+            Tuple of (command_count, salt_output_count, bytes) where bytes is
+            the stored size of the rows' values (page and index overhead aside)
+        """
+        with self._get_connection() as conn:
+            cutoff_epoch = self._cutoff_epoch(conn, cutoff_iso)
+            command_count, command_bytes = conn.execute('''
+                SELECT COUNT(*),
+                       COALESCE(SUM(length(CAST(command AS BLOB)) + length(CAST(selected_hosts AS BLOB))
+                                    + length(timestamp) + length(CAST(username AS BLOB))), 0)
+                FROM command_history
+                WHERE epoch < ?
+            ''', (cutoff_epoch,)).fetchone()
+            salt_output_count, output_bytes = conn.execute('''
+                SELECT COUNT(*),
+                       COALESCE(SUM(COALESCE(length(CAST(o.output AS BLOB)), o.blob_size)
+                                    + length(CAST(o.salt_command AS BLOB))), 0)
+                FROM salt_outputs o
+                JOIN command_history c ON c.id = o.command_id
+                WHERE c.epoch < ?
+            ''', (cutoff_epoch,)).fetchone()
+            result_bytes = conn.execute('''
+                SELECT COALESCE(SUM(COALESCE(length(CAST(r.payload AS BLOB)), r.blob_size)
+                                    + length(CAST(r.minion AS BLOB))), 0)
+                FROM minion_results r
+                JOIN command_history c ON c.id = r.command_id
+                WHERE c.epoch < ?
+            ''', (cutoff_epoch,)).fetchone()[0]
 
-    def trim_old_history(self, cutoff_iso: str) -> tuple:
+        return (command_count, salt_output_count, command_bytes + output_bytes + result_bytes)
+
+    def trim_old_history(self, cutoff_iso: str,
+                         progress: Optional[Callable[[int, int], None]] = None) -> tuple:
         """
         Delete history entries older than cutoff date
 
+        Commands are deleted oldest first, TRIM_BATCH_SIZE at a time, each
+        batch (with its outputs, results and host links) in its own short
+        write transaction, so other shells are never locked out for long.
+        Freed pages stay in the file until reclaim_space() is called;
+        blob store files no remaining output refers to are deleted.
+
         Args:
             cutoff_iso: ISO format date string for cutoff
+            progress: Called with (commands deleted, total to delete) after each batch
 
         Returns:
             Tuple of (command_count, salt_output_count) deleted
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-
-            # Count entries to delete
-            cursor.execute('''
+            cutoff_epoch = self._cutoff_epoch(conn, cutoff_iso)
+            total = conn.execute('''
                 SELECT COUNT(*) FROM command_history
-                WHERE timestamp < ?
-            ''', (cutoff_iso,))
-            command_count = cursor.fetchone()[0]
+                WHERE epoch < ?
+            ''', (cutoff_epoch,)).fetchone()[0]
 
-            if command_count == 0:
-                return (0, 0)
+        command_count = salt_output_count = 0
+        while command_count < total:
+            if command_count:
+                time.sleep(self.TRIM_BATCH_PAUSE)
 
-            # Delete salt_outputs first (foreign key constraint)
-            cursor.execute('''
-                DELETE FROM salt_outputs
-                WHERE command_id IN (
+            with self._get_connection(write=True) as conn:
+                cursor = conn.cursor()
+                ids = [row[0] for row in cursor.execute('''
                     SELECT id FROM command_history
-                    WHERE timestamp < ?
-                )
-            ''', (cutoff_iso,))
-            salt_output_count = cursor.rowcount
+                    WHERE epoch < ?
+                    ORDER BY epoch
+                    LIMIT ?
+                ''', (cutoff_epoch, self.TRIM_BATCH_SIZE))]
+                if not ids:
+                    break
+                placeholders = ','.join('?' * len(ids))
+
+                if self.search_available:
+                    self._unindex_outputs(cursor, f'''
+                        SELECT id, {_OUTPUT_VALUE}, codec FROM salt_outputs
+                        WHERE command_id IN ({placeholders}) AND fts_indexed = 1
+                    ''', ids)
 
-            # Delete command_history entries
+                cursor.execute(f'DELETE FROM salt_outputs WHERE command_id IN ({placeholders})', ids)
+                salt_output_count += cursor.rowcount
+                cursor.execute(f'DELETE FROM minion_results WHERE command_id IN ({placeholders})', ids)
+                cursor.execute(f'DELETE FROM command_hosts WHERE command_id IN ({placeholders})', ids)
+                cursor.execute(f'DELETE FROM command_history WHERE id IN ({placeholders})', ids)
+                self._merge_search_index(cursor)
+
+            command_count += len(ids)
+            if progress is not None:
+                progress(command_count, total)
+
+        # A sweep of the whole store also catches blobs left behind by an
+        # interrupted trim or a shell that crashed before logging its output
+        if command_count:
+            self._collect_blobs()
+        return (command_count, salt_output_count)
+
+    @property
+    def auto_vacuum(self) -> str:
+        """The file's auto_vacuum mode: 'none', 'full' or 'incremental'"""
+        with self._get_connection() as conn:
+            return ('none', 'full', 'incremental')[conn.execute('PRAGMA auto_vacuum').fetchone()[0]]
+
+    def reclaim_space(self) -> int:
+        """
+        Return free pages to the filesystem with incremental_vacuum
+
+        Pages are released VACUUM_STEP_PAGES at a time, each step in its
+        own transaction. Does nothing unless auto_vacuum is incremental
+        (see vacuum()).
+
+        Returns:
+            Bytes released
+        """
+        with self._get_connection() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return 0
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+
+        released = 0
+        while True:
+            with self._get_connection() as conn:
+                free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if free == 0:
+                    break
+                conn.execute(f'PRAGMA incremental_vacuum({min(free, self.VACUUM_STEP_PAGES)})').fetchall()
+                step = free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # Other shells may free pages as fast as they are released
+            if step <= 0:
+                break
+            released += step
+
+        return released * page_size
+
+    def vacuum(self) -> Tuple[int, int]:
+        """
+        Rebuild the database file, switching it to incremental auto_vacuum
+
+        Files created before auto_vacuum was enabled need this once before
+        reclaim_space() can shrink them. VACUUM rewrites the whole file
+        and blocks other writers while it runs.
+
+        Returns:
+            Tuple of (size before, size after) in bytes
+        """
+        with self._get_connection() as conn:
+            before = self._page_bytes(conn)
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+            after = self._page_bytes(conn)
+        return (before, after)
+
+    def database_stats(self, largest: int = 5) -> DatabaseStats:
+        """
+        Sizes, row counts and index statistics of the database
+
+        Table and index sizes need SQLite's dbstat table (None without it)
+        and reading every page, so this takes a while on a large file.
+        Rows per key come from the statistics 'db optimize' gathers.
+
+        Args:
+            largest: Number of largest stored outputs to list
+        """
+        with self._get_connection() as conn:
+            def pragma(name):
+                return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+            sizes: Dict[str, int] = {}
+            try:
+                sizes = dict(conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'))
+            except sqlite3.OperationalError:
+                pass
+
+            tables = []
+            for (name,) in conn.execute('''
+                SELECT name FROM sqlite_master
+                WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'output_fts%'
+                ORDER BY name
+            ''').fetchall():
+                rows = conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+                tables.append((name, rows, sizes.get(name)))
+            search_index_size = None
+            if sizes and self.search_available:
+                search_index_size = sum(size for name, size in sizes.items() if name.startswith('output_fts'))
+
+            stat1: Dict[str, str] = {}
+            if self._has_table('sqlite_stat1'):
+                stat1 = {index: stat for index, stat in conn.execute(
+                    'SELECT idx, stat FROM sqlite_stat1 WHERE idx IS NOT NULL')}
+            indexes = []
+            for name, table in conn.execute('''
+                SELECT name, tbl_name FROM sqlite_master
+                WHERE type = 'index' AND tbl_name NOT LIKE 'output_fts%'
+                ORDER BY tbl_name, name
+            ''').fetchall():
+                # stat is "<rows> <rows per value of the first column> ..."
+                stat = stat1.get(name, '').split()
+                per_key = int(stat[1]) if len(stat) > 1 and stat[1].isdigit() else None
+                indexes.append((name, table, sizes.get(name), per_key))
+
+            largest_outputs = conn.execute('''
+                SELECT o.command_id, c.command, COALESCE(length(o.output), o.blob_size) AS size, o.codec
+                FROM salt_outputs o LEFT JOIN command_history c ON c.id = o.command_id
+                WHERE o.output IS NOT NULL OR o.blob_hash IS NOT NULL
+                ORDER BY size DESC
+                LIMIT ?
+            ''', (largest,)).fetchall()
+
+            wal_path = self.db_path + '-wal'
+            return DatabaseStats(
+                self.db_path, os.path.getsize(self.db_path),
+                os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+                pragma('page_size'), pragma('page_count'), pragma('freelist_count'),
+                pragma('journal_mode'), ('none', 'full', 'incremental')[pragma('auto_vacuum')],
+                pragma('user_version'), tables, search_index_size, indexes, largest_outputs,
+                *self.blobs.usage())
+
+    def optimize(self, vacuum: bool = False) -> Tuple[List[str], int, int]:
+        """
+        Refresh query planner statistics, check integrity and optionally compact
+
+        Runs ANALYZE and PRAGMA optimize, then PRAGMA integrity_check.
+        With vacuum (and a clean check) the database is compacted online:
+        VACUUM INTO writes a compacted copy while other shells carry on,
+        then the copy replaces the contents of the live file through the
+        backup API, with their transactions held off by the swap lock
+        (a flock() on <database>.lock) meanwhile. Copying into the file rather
+        than renaming over it keeps other shells' open connections valid.
+        If another shell wrote in the meantime, the copy is made again.
+
+        Returns:
+            Tuple of (integrity problems, empty if none; size before; size
+            after) with sizes in bytes of pages
+
+        Raises:
+            RuntimeError: The database kept changing during every compacting attempt
+        """
+        with self._get_connection(write=True) as conn:
+            conn.execute('ANALYZE')
+        with self._get_connection() as conn:
+            conn.execute('PRAGMA optimize')
+            problems = [row[0] for row in conn.execute('PRAGMA integrity_check(100)')]
+            before = self._page_bytes(conn)
+        if problems == ['ok']:
+            problems = []
+        if not vacuum or problems:
+            return (problems, before, before)
+
+        compacted = self.db_path + '.optimize'
+        try:
+            for _attempt in range(self.OPTIMIZE_VACUUM_ATTEMPTS):
+                if self._vacuum_into(compacted):
+                    break
+            else:
+                raise RuntimeError("Other shells kept writing to the database; try again when it is quieter")
+        finally:
+            for path in (compacted, compacted + '-journal'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        with self._get_connection() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            after = self._page_bytes(conn)
+        return (problems, before, after)
+
+    @staticmethod
+    def _page_bytes(conn) -> int:
+        return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+    def _vacuum_into(self, compacted: str) -> bool:
+        """
+        Compact into a copy, then copy it over the live database
+
+        Every transaction holds the swap lock shared, so holding it
+        exclusively from the data_version check to the end of the copy
+        means nothing another connection commits can be overwritten.
+
+        Returns:
+            False (leaving the database alone) if another connection
+            committed while the copy was being made, or other connections'
+            transactions kept the swap lock for longer than busy_timeout
+        """
+        if os.path.exists(compacted):
+            os.remove(compacted)
+        conn = self._thread_connection()
+        conn.commit()
+        # data_version changes when any other connection commits
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        conn.execute('VACUUM INTO ?', (compacted,))
+
+        source = sqlite3.connect(compacted)
+        try:
+            with self._swap_lock.exclusive(self.busy_timeout) as locked:
+                if not locked:
+                    return False
+                if conn.execute('PRAGMA data_version').fetchone()[0] != version:
+                    return False
+                source.backup(conn)
+        finally:
+            source.close()
+        return True
+
+
+    def _archive_path(self, name: str) -> str:
+        """Archive file path; archive_index holds names relative to the database's directory"""
+        return os.path.join(os.path.dirname(os.path.abspath(self.db_path)), name)
+
+    def _archive_name(self, month: str) -> str:
+        """File name of a month's archive, e.g. .saltctl.2024-01.db beside .saltctl.db"""
+        root, ext = os.path.splitext(os.path.basename(self.db_path))
+        return f"{root}.{month}{ext or '.db'}"
+
+    def _attach_archive(self, path: str):
+        """Attach an archive file as schema 'archive' on the calling thread's connection"""
+        self.flush()
+        self._detach_archive()
+        self._thread_connection().execute('ATTACH DATABASE ? AS archive', (path,))
+
+    def _detach_archive(self):
+        """Detach the calling thread's archive, if one is attached"""
+        conn = self._thread_connection()
+        if any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list')):
+            conn.commit()
+            conn.execute('DETACH DATABASE archive')
+
+    @contextmanager
+    def _attached_archive(self, path: str):
+        self._attach_archive(path)
+        try:
+            yield
+        finally:
+            self._detach_archive()
+
+    def _attach_command_archive(self, command_id: int) -> str:
+        """
+        Schema holding a command: 'main' if it is live, otherwise 'archive'
+        with its archive file attached (the caller detaches it)
+
+        Commands in neither are reported as 'main', where lookups find nothing.
+        """
+        with self._get_connection() as conn:
+            if conn.execute('SELECT 1 FROM command_history WHERE id = ?', (command_id,)).fetchone():
+                return 'main'
+            names = [row[0] for row in conn.execute('''
+                SELECT path FROM archive_index
+                WHERE ? BETWEEN first_id AND last_id
+                ORDER BY month
+            ''', (command_id,))]
+
+        for name in names:
+            path = self._archive_path(name)
+            if not os.path.exists(path):
+                continue
+            self._attach_archive(path)
+            with self._get_connection() as conn:
+                found = conn.execute('SELECT 1 FROM archive.command_history WHERE id = ?',
+                                     (command_id,)).fetchone()
+            if found:
+                return 'archive'
+            self._detach_archive()
+        return 'main'
+
+    @contextmanager
+    def _command_schema(self, command_id: int):
+        """Context manager giving the schema holding a command (see _attach_command_archive())"""
+        schema = self._attach_command_archive(command_id)
+        try:
+            yield schema
+        finally:
+            if schema == 'archive':
+                self._detach_archive()
+
+    def _archives_between(self, since: Optional[int], until: Optional[int]) -> List[str]:
+        """Paths of existing archive files holding commands in [since, until)"""
+        with self._get_connection() as conn:
+            names = [row[0] for row in conn.execute('''
+                SELECT path FROM archive_index
+                WHERE last_epoch >= ? AND first_epoch < ?
+                ORDER BY month
+            ''', (since if since is not None else 0, until if until is not None else 2 ** 62))]
+        paths = [self._archive_path(name) for name in names]
+        return [path for path in paths if os.path.exists(path)]
+
+    def list_archives(self) -> List[tuple]:
+        """
+        Archive files, oldest first
+
+        Returns:
+            List of tuples (month, path, commands, first_id, last_id)
+        """
+        with self._get_connection() as conn:
+            rows = conn.execute('''
+                SELECT month, path, commands, first_id, last_id FROM archive_index ORDER BY month
+            ''').fetchall()
+        return [(month, self._archive_path(name), commands, first_id, last_id)
+                for month, name, commands, first_id, last_id in rows]
+
+    def archive_old_history(self, cutoff_iso: str,
+                            progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int, int]:
+        """
+        Move commands older than cutoff, with their outputs, into monthly archive files
+
+        Each batch is first copied into its month's archive (replacing any
+        copy left by an interrupted run) and then deleted from the live
+        database, in two transactions: commits spanning two WAL database
+        files aren't atomic, and this way a crash can only leave a command
+        in both places, never in neither. Lookups try the live database
+        first, so such a duplicate is harmless and the next run removes it.
+
+        Args:
+            cutoff_iso: ISO format date string; whole months before it are archived
+            progress: Called with (commands moved, total to move) after each batch
+
+        Returns:
+            Tuple of (commands moved, outputs moved, archive files written to)
+        """
+        with self._get_connection() as conn:
+            cutoff_epoch = self._cutoff_epoch(conn, cutoff_iso[:7] + '-01T00:00:00')
+            total = conn.execute('''
+                SELECT COUNT(*) FROM command_history WHERE epoch < ?
+            ''', (cutoff_epoch,)).fetchone()[0]
+            months = [row[0] for row in conn.execute('''
+                SELECT DISTINCT strftime('%Y-%m', epoch, 'unixepoch', 'localtime')
+                FROM command_history
+                WHERE epoch < ?
+                ORDER BY 1
+            ''', (cutoff_epoch,))]
+
+        moved = outputs = 0
+        for month in months:
+            name = self._archive_name(month)
+            with self._attached_archive(self._archive_path(name)):
+                with self._transaction(write=True) as conn:
+                    _create_archive_schema(conn.cursor())
+                with self._get_connection() as conn:
+                    start = self._cutoff_epoch(conn, f'{month}-01T00:00:00')
+                    year, number = map(int, month.split('-'))
+                    following = f'{year + number // 12:04d}-{number % 12 + 1:02d}-01T00:00:00'
+                    end = min(self._cutoff_epoch(conn, following), cutoff_epoch)
+
+                while True:
+                    copied = self._copy_to_archive(start, end)
+                    if copied is None:
+                        break
+                    ids, output_count = copied
+                    self._remove_archived(month, name, ids)
+                    moved += len(ids)
+                    outputs += output_count
+                    if progress is not None:
+                        progress(moved, total)
+
+        if moved:
+            self.reclaim_space()
+        return (moved, outputs, len(months))
+
+    def _copy_to_archive(self, start: int, end: int) -> Optional[tuple]:
+        """Copy the oldest batch of live commands in [start, end) to the attached archive"""
+        with self._get_connection(write=True) as conn:
+            cursor = conn.cursor()
+            ids = [row[0] for row in cursor.execute('''
+                SELECT id FROM main.command_history
+                WHERE epoch >= ? AND epoch < ?
+                ORDER BY epoch
+                LIMIT ?
+            ''', (start, end, self.ARCHIVE_BATCH_SIZE))]
+            if not ids:
+                return None
+            placeholders = ','.join('?' * len(ids))
+
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.command_history
+                    (id, timestamp, epoch, username, selected_hosts, command, verb, duration, content_hash)
+                SELECT id, timestamp, epoch, username, selected_hosts, command, verb, duration, content_hash
+                FROM main.command_history WHERE id IN ({placeholders})
+            ''', ids)
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.salt_outputs
+                    (id, command_id, salt_command, output, return_code, codec)
+                SELECT id, command_id, salt_command, {_OUTPUT_VALUE}, return_code, codec
+                FROM main.salt_outputs WHERE command_id IN ({placeholders})
+            ''', ids)
+            output_count = cursor.rowcount
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.minion_results
+                    (id, command_id, minion, success, changed_count, failed_count, duration, payload, codec)
+                SELECT id, command_id, minion, success, changed_count, failed_count, duration,
+                       {_PAYLOAD_VALUE}, codec
+                FROM main.minion_results WHERE command_id IN ({placeholders})
+            ''', ids)
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO archive.hosts (id, name)
+                SELECT DISTINCT h.id, h.name FROM main.hosts h
+                JOIN main.command_hosts ch ON ch.host_id = h.id
+                WHERE ch.command_id IN ({placeholders})
+            ''', ids)
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO archive.command_hosts (host_id, command_id)
+                SELECT host_id, command_id FROM main.command_hosts WHERE command_id IN ({placeholders})
+            ''', ids)
+        return (ids, output_count)
+
+    def _remove_archived(self, month: str, name: str, ids: List[int]):
+        """Record archived commands in archive_index and delete them from the live tables"""
+        placeholders = ','.join('?' * len(ids))
+        with self._get_connection(write=True) as conn:
+            cursor = conn.cursor()
+            first_id, last_id, first_epoch, last_epoch = cursor.execute(f'''
+                SELECT MIN(id), MAX(id), MIN(epoch), MAX(epoch)
+                FROM main.command_history WHERE id IN ({placeholders})
+            ''', ids).fetchone()
+            cursor.execute('''
+                INSERT OR IGNORE INTO archive_index
+                    (month, path, first_id, last_id, first_epoch, last_epoch, commands)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', (month, name, first_id, last_id, first_epoch, last_epoch))
             cursor.execute('''
-                DELETE FROM command_history
-                WHERE timestamp < ?
-            ''', (cutoff_iso,))
+                UPDATE archive_index
+                SET first_id = MIN(first_id, ?), last_id = MAX(last_id, ?),
+                    first_epoch = MIN(first_epoch, ?), last_epoch = MAX(last_epoch, ?),
+                    commands = commands + ?
+                WHERE month = ?
+            ''', (first_id, last_id, first_epoch, last_epoch, len(ids), month))
+
+            if self.search_available:
+                self._unindex_outputs(cursor, f'''
+                    SELECT id, {_OUTPUT_VALUE}, codec FROM main.salt_outputs
+                    WHERE command_id IN ({placeholders}) AND fts_indexed = 1
+                ''', ids)
+            blob_hashes = self._command_blobs(cursor, placeholders, ids)
+            cursor.execute(f'DELETE FROM main.salt_outputs WHERE command_id IN ({placeholders})', ids)
+            cursor.execute(f'DELETE FROM main.minion_results WHERE command_id IN ({placeholders})', ids)
+            cursor.execute(f'DELETE FROM main.command_hosts WHERE command_id IN ({placeholders})', ids)
+            cursor.execute(f'DELETE FROM main.command_history WHERE id IN ({placeholders})', ids)
+            self._merge_search_index(cursor)
+        self._collect_blobs(blob_hashes)
+
+    @staticmethod
+    def _read_only_uri(path: str) -> str:
+        """
+        URI opening a database read-only without creating files beside it
+
+        A read-only connection to a WAL-mode database still creates its
+        -wal and -shm files. If there is no -wal file, no connection has
+        the database open, so it is opened as immutable instead.
+        """
+        uri = 'file:' + pathname2url(os.path.abspath(path)) + '?mode=ro'
+        with open(path, 'rb') as f:
+            header = f.read(20)
+        # Header bytes 18 and 19 are 2 for a WAL-mode database
+        if header[18:19] == b'\x02' and not os.path.exists(path + '-wal'):
+            uri += '&immutable=1'
+        return uri
+
+    def _open_import_source(self, path: str) -> Tuple[str, Optional[str]]:
+        """
+        Check path is another saltctl database and get it ready to attach
+
+        The file itself is only read. A database at an older schema
+        version is copied into a temporary directory and the copy is
+        upgraded instead.
+
+        Returns:
+            Tuple of (URI or path to attach, temporary directory to remove
+            afterwards or None)
+        """
+        if not os.path.isfile(path):
+            raise ValueError(f"No such database: {path}")
+        if os.path.exists(self.db_path) and os.path.samefile(path, self.db_path):
+            raise ValueError("Can't import a database into itself")
+        try:
+            uri = self._read_only_uri(path)
+            conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout)
+            try:
+                has_history = conn.execute('''
+                    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'command_history'
+                ''').fetchone()
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if not has_history or version >= SCHEMA_VERSION:
+                    copy_dir = None
+                else:
+                    copy_dir = tempfile.mkdtemp(prefix='saltctl-import-')
+                    copy = os.path.join(copy_dir, 'source.db')
+                    with closing(sqlite3.connect(copy)) as target:
+                        conn.backup(target)
+            finally:
+                conn.close()
+        except (sqlite3.DatabaseError, OSError) as e:
+            raise ValueError(f"{path} isn't a saltctl database: {e}")
+        if not has_history:
+            raise ValueError(f"{path} isn't a saltctl database")
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"{path} was written by a newer version of SaltCtl")
+        if copy_dir is None:
+            return (uri, None)
+        # The same upgrade any saltctl opening it would do, on the copy
+        try:
+            SaltCtlDatabase(copy, busy_timeout=self.busy_timeout).close()
+        except sqlite3.Error as e:
+            shutil.rmtree(copy_dir, ignore_errors=True)
+            raise ValueError(f"Can't upgrade {path}: {e}")
+        return (copy, copy_dir)
+
+    def import_history(self, path: str,
+                       progress: Optional[Callable[[int, int], None]] = None) -> Tuple[int, int, int]:
+        """
+        Merge another saltctl database's history into this one
+
+        The other file is attached and copied with INSERT ... SELECT,
+        IMPORT_BATCH_SIZE commands per transaction. Imported commands get
+        new IDs after the existing ones; their outputs, per-minion results
+        and host links follow them, and they are added to the command
+        statistics. Entries already present (same time, user, hosts and
+        command line, e.g. from an earlier import), live or archived, are
+        skipped. Imported outputs are then added to the search index.
+
+        Only the other database's live history is imported, not its
+        monthly archive files. The other database is only read: one from
+        an older version is upgraded in a temporary copy.
+
+        Args:
+            path: The database to import
+            progress: Called with (commands checked, total commands) after each batch
+
+        Returns:
+            Tuple of (commands imported, outputs imported, duplicate commands skipped)
+
+        Raises:
+            ValueError: path isn't a saltctl database that can be imported
+        """
+        source, copy_dir = self._open_import_source(path)
+        source_blobs = BlobStore(blob_store_path(path))
+        try:
+            self._load_archived_hashes()
+            self.flush()
+            conn = self._thread_connection()
+            conn.commit()
+            conn.execute('ATTACH DATABASE ? AS source', (source,))
+            try:
+                with self._get_connection() as conn:
+                    total = conn.execute('SELECT COUNT(*) FROM source.command_history').fetchone()[0]
+                    first_output = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.salt_outputs').fetchone()[0]
+                    conn.execute('''
+                        CREATE TEMP TABLE IF NOT EXISTS import_map (
+                            seq INTEGER PRIMARY KEY,
+                            old_id INTEGER NOT NULL UNIQUE
+                        )
+                    ''')
+
+                imported = outputs = checked = 0
+                position = 0
+                while True:
+                    with self._get_connection(write=True) as conn:
+                        batch = self._import_batch(conn.cursor(), position, source_blobs)
+                    if batch is None:
+                        break
+                    position, count, scanned, output_count = batch
+                    imported += count
+                    outputs += output_count
+                    checked += scanned
+                    if progress is not None:
+                        progress(checked, total)
+            finally:
+                self._thread_connection().commit()
+                self._thread_connection().execute('DETACH DATABASE source')
+        finally:
+            if copy_dir is not None:
+                shutil.rmtree(copy_dir, ignore_errors=True)
+
+        if outputs and self.search_available:
+            self._index_outputs(first_output, outputs)
+        return (imported, outputs, total - imported)
+
+    def _load_archived_hashes(self):
+        """Fill temp.archived_hashes with the content hash of every archived command"""
+        with self._get_connection() as conn:
+            conn.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS archived_hashes (
+                    content_hash TEXT PRIMARY KEY
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('DELETE FROM temp.archived_hashes')
+
+        for path in self._archives_between(None, None):
+            with self._attached_archive(path), self._get_connection() as conn:
+                # Archives written before content hashes were copied have
+                # none stored; compute them the way the migration did
+                columns = [row[1] for row in conn.execute('PRAGMA archive.table_info(command_history)')]
+                stored = 'content_hash' if 'content_hash' in columns else 'NULL'
+                conn.execute(f'''
+                    INSERT OR IGNORE INTO temp.archived_hashes (content_hash)
+                    SELECT COALESCE({stored}, saltctl_content_hash(timestamp, username, selected_hosts, command))
+                    FROM archive.command_history
+                ''')
+
+    def _import_batch(self, cursor, position: int, source_blobs: BlobStore) -> Optional[tuple]:
+        """
+        Copy the next batch of new commands with source IDs above position
+
+        Blobs their outputs refer to are copied from source_blobs first.
+
+        Returns:
+            (last source ID checked, commands copied, source commands checked,
+            outputs copied), or None when there is nothing left to check
+        """
+        last = cursor.execute('''
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM source.command_history WHERE id > ? ORDER BY id LIMIT ?
+            )
+        ''', (position, self.IMPORT_BATCH_SIZE)).fetchone()
+        if last[0] is None:
+            return None
+        end, scanned = last
+
+        # New IDs follow everything used so far (including write-behind reservations);
+        # import_map numbers the batch's new commands 1, 2, ... in source order
+        base = cursor.execute('''
+            SELECT MAX(
+                COALESCE((SELECT seq FROM main.sqlite_sequence WHERE name = 'command_history'), 0),
+                COALESCE((SELECT MAX(id) FROM main.command_history), 0)
+            )
+        ''').fetchone()[0]
+        cursor.execute('DELETE FROM temp.import_map')
+        cursor.execute('''
+            INSERT INTO temp.import_map (old_id)
+            SELECT s.id FROM source.command_history s
+            WHERE s.id > ? AND s.id <= ?
+              AND NOT EXISTS (SELECT 1 FROM main.command_history c WHERE c.content_hash = s.content_hash)
+              AND NOT EXISTS (SELECT 1 FROM temp.archived_hashes a WHERE a.content_hash = s.content_hash)
+            ORDER BY s.id
+        ''', (position, end))
+        count = cursor.rowcount
+        if count == 0:
+            return (end, 0, scanned, 0)
 
-            return (command_count, salt_output_count)
+        cursor.execute('''
+            INSERT INTO main.command_history
+                (id, timestamp, epoch, username, selected_hosts, command, verb, duration, success, content_hash)
+            SELECT ? + m.seq, s.timestamp, s.epoch, s.username, s.selected_hosts, s.command, s.verb,
+                   s.duration, s.success, s.content_hash
+            FROM temp.import_map m JOIN source.command_history s ON s.id = m.old_id
+        ''', (base,))
+        for blob_hash in self._command_blobs(cursor, 'SELECT old_id FROM temp.import_map', (), 'source'):
+            self.blobs.copy_from(source_blobs, blob_hash)
+        cursor.execute('''
+            INSERT INTO main.salt_outputs
+                (command_id, salt_command, output, return_code, codec, blob_hash, blob_size, command_epoch)
+            SELECT ? + m.seq, o.salt_command, o.output, o.return_code, o.codec, o.blob_hash, o.blob_size,
+                   s.epoch
+            FROM temp.import_map m
+            JOIN source.salt_outputs o ON o.command_id = m.old_id
+            JOIN source.command_history s ON s.id = m.old_id
+            ORDER BY o.id
+        ''', (base,))
+        output_count = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO main.minion_results
+                (command_id, minion, success, changed_count, failed_count, duration, payload, codec,
+                 blob_hash, blob_size)
+            SELECT ? + m.seq, r.minion, r.success, r.changed_count, r.failed_count, r.duration, r.payload, r.codec,
+                   r.blob_hash, r.blob_size
+            FROM temp.import_map m JOIN source.minion_results r ON r.command_id = m.old_id
+            ORDER BY r.id
+        ''', (base,))
+        cursor.execute('''
+            INSERT OR IGNORE INTO main.hosts (name)
+            SELECT DISTINCT h.name
+            FROM temp.import_map m
+            JOIN source.command_hosts ch ON ch.command_id = m.old_id
+            JOIN source.hosts h ON h.id = ch.host_id
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO main.command_hosts (host_id, command_id)
+            SELECT mh.id, ? + m.seq
+            FROM temp.import_map m
+            JOIN source.command_hosts ch ON ch.command_id = m.old_id
+            JOIN source.hosts sh ON sh.id = ch.host_id
+            JOIN main.hosts mh ON mh.name = sh.name
+        ''', (base,))
+        self._count_command(cursor, base + 1, base + count)
+        return (end, count, scanned, output_count)
 
 
 # vim: set ts=4 sw=4 et:
@@ -0,0 +1,163 @@
+"""Streaming export of command history (and stored output) to JSONL or CSV"""
+
+import io
+import csv
+import sys
+import gzip
+import json
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, TextIO
+
+FORMATS = ('jsonl', 'csv')
+
+# Columns of every exported command, and the extra ones with --with-output
+FIELDS = ('id', 'timestamp', 'username', 'hosts', 'command', 'duration')
+OUTPUT_FIELDS = ('salt_command', 'return_code', 'output')
+
+
+def _command_fields(row) -> list:
+    cmd_id, timestamp, username, hosts, command, duration = row
+    return [cmd_id, timestamp, username, hosts.split(', ') if hosts else [], command, duration]
+
+
+def _drain(chunks: Iterable[str], escape) -> Iterator[str]:
+    """Escaped chunks of an output, closing its stream when done or abandoned"""
+    try:
+        for chunk in chunks:
+            yield escape(chunk)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def jsonl_chunks(records: Iterable[tuple], with_output: bool = False) -> Iterator[str]:
+    """
+    Text of a JSON Lines export, one object per command
+
+    Args:
+        records: (row, output) tuples from SaltCtlDatabase.iter_history_export()
+        with_output: Add salt_command, return_code and output keys
+    """
+    for row, output in records:
+        record = dict(zip(FIELDS, _command_fields(row)))
+        if not with_output:
+            yield json.dumps(record) + '\n'
+            continue
+        if output is None:
+            record.update(dict.fromkeys(OUTPUT_FIELDS))
+            yield json.dumps(record) + '\n'
+            continue
+
+        # The output is written as it is decompressed: the object is
+        # closed by hand after its (escaped) chunks
+        salt_command, return_code, chunks = output
+        record.update(salt_command=salt_command, return_code=return_code)
+        yield json.dumps(record)[:-1] + ', "output": "'
+        yield from _drain(chunks, lambda chunk: json.dumps(chunk)[1:-1])
+        yield '"}\n'
+
+
+def _csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(values)
+    return buffer.getvalue()
+
+
+def csv_chunks(records: Iterable[tuple], with_output: bool = False) -> Iterator[str]:
+    """
+    Text of a CSV export with a header row (hosts are comma separated)
+
+    Args:
+        records: (row, output) tuples from SaltCtlDatabase.iter_history_export()
+        with_output: Add salt_command, return_code and output columns
+    """
+    header = FIELDS + OUTPUT_FIELDS if with_output else FIELDS
+    yield _csv_line(header) + '\r\n'
+    for row, output in records:
+        values = _command_fields(row)
+        values[3] = ','.join(values[3])
+        if not with_output:
+            yield _csv_line(values) + '\r\n'
+            continue
+        if output is None:
+            yield _csv_line(values + [None, None, None]) + '\r\n'
+            continue
+
+        # Quote the output field by hand so it can be written chunk by chunk
+        salt_command, return_code, chunks = output
+        yield _csv_line(values + [salt_command, return_code]) + ',"'
+        yield from _drain(chunks, lambda chunk: chunk.replace('"', '""'))
+        yield '"\r\n'
+
+
+@contextmanager
+def open_export(path: Optional[str] = None, compress: bool = False):
+    """
+    Text stream an export is written to: a file, or stdout when path is None
+
+    With compress the text is gzipped as it is written.
+
+    Raises:
+        OSError: The file can't be created
+        ValueError: Compressed output to a stdout that only takes text
+    """
+    if path is None:
+        if not compress:
+            yield sys.stdout
+            sys.stdout.flush()
+            return
+        buffer = getattr(sys.stdout, 'buffer', None)
+        if buffer is None:
+            raise ValueError("Compressed export needs --output <file> here")
+        sys.stdout.flush()
+        out = io.TextIOWrapper(gzip.GzipFile(fileobj=buffer, mode='wb'), encoding='utf-8', newline='')
+    elif compress:
+        out = gzip.open(path, 'wt', encoding='utf-8', newline='')
+    else:
+        out = open(path, 'w', encoding='utf-8', newline='')
+    try:
+        yield out
+    finally:
+        out.close()
+        if path is None:
+            buffer.flush()
+
+
+def export_history(records: Iterable[tuple], out: TextIO, fmt: str = 'jsonl',
+                   with_output: bool = False) -> int:
+    """
+    Write an export, a chunk at a time
+
+    Memory use doesn't depend on the number of commands or the size of
+    their output: records are read lazily and each chunk is written as
+    soon as it is formatted.
+
+    Args:
+        records: (row, output) tuples from SaltCtlDatabase.iter_history_export()
+        out: Text stream to write to (see open_export())
+        fmt: 'jsonl' or 'csv'
+        with_output: Include each command's stored output
+
+    Returns:
+        Number of commands exported
+    """
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+
+    formatter = jsonl_chunks if fmt == 'jsonl' else csv_chunks
+    try:
+        for chunk in formatter(counted(), with_output):
+            out.write(chunk)
+    finally:
+        # Ends the read transaction (and detaches any archive) on failure too
+        if hasattr(records, 'close'):
+            records.close()
+    return count
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,185 @@
+"""Minion list cache for SaltCtl"""
+
+import os
+import json
+import time
+import threading
+import subprocess
+from typing import Callable, List, Optional
+
+
+class MinionListError(Exception):
+    """Raised when the minion list cannot be retrieved from salt-key"""
+    pass
+
+
+def fetch_minions(salt_key_cmd: List[str], timeout: Optional[float] = None) -> List[str]:
+    """
+    Fetch the list of accepted minions from salt-key
+
+    Args:
+        salt_key_cmd: Full salt-key command line (including sudo if required)
+        timeout: Seconds to wait for salt-key before giving up
+
+    Returns:
+        List of accepted minion names
+
+    Raises:
+        MinionListError: If salt-key fails or returns unexpected output
+    """
+    try:
+        result = subprocess.run(
+            salt_key_cmd,
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=timeout
+        )
+        data = json.loads(result.stdout)
+        if 'minions' not in data:
+            raise MinionListError("Unexpected salt-key output format - missing 'minions' key")
+        return list(data['minions'])
+    except subprocess.CalledProcessError as e:
+        raise MinionListError(f"Failed to get minion list: {e}")
+    except subprocess.TimeoutExpired:
+        raise MinionListError(f"salt-key did not respond within {timeout} seconds")
+    except FileNotFoundError:
+        raise MinionListError("salt-key command not found. Is Salt installed?")
+    except json.JSONDecodeError as e:
+        raise MinionListError(f"Failed to parse minion list JSON: {e}")
+    except (KeyError, TypeError) as e:
+        raise MinionListError(f"Unexpected salt-key output structure: {e}")
+
+
+class MinionCache:
+    """
+    On-disk cache of the accepted minion list
+
+    The cached list is served immediately (even when stale) while a
+    background thread refreshes it from salt-key. Callers that need an
+    up-to-date list can block on wait() until the refresh finishes.
+    """
+
+    # Bump when the cache file layout changes; older files are ignored
+    CACHE_VERSION = 1
+
+    def __init__(self, path: str, ttl: int, fetch: Callable[[], List[str]]):
+        self.path = path
+        self.ttl = ttl
+        self._fetch = fetch
+        self.minions: List[str] = []
+        self.timestamp: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._refresh_done = threading.Event()
+        self._refresh_done.set()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[List[str]], None]] = []
+
+    def add_listener(self, callback: Callable[[List[str]], None]):
+        """Register a callback invoked with the new list whenever it changes"""
+        self._listeners.append(callback)
+
+    def load(self) -> bool:
+        """
+        Load the minion list from the cache file
+
+        Returns:
+            True if a usable cache file was loaded (fresh or stale)
+        """
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if not isinstance(data, dict) or data.get('version') != self.CACHE_VERSION:
+            return False
+        minions = data.get('minions')
+        if not isinstance(minions, list):
+            return False
+
+        self._set_minions(minions, data.get('timestamp'))
+        return True
+
+    def save(self):
+        """Write the current minion list to the cache file atomically"""
+        data = {
+            'version': self.CACHE_VERSION,
+            'timestamp': self.timestamp,
+            'minions': self.minions,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # A cache we can't write is only a missed optimisation
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    @property
+    def is_stale(self) -> bool:
+        """Whether the cached list is missing or older than the TTL"""
+        if self.timestamp is None:
+            return True
+        return (time.time() - self.timestamp) > self.ttl
+
+    @property
+    def refreshing(self) -> bool:
+        """Whether a background refresh is currently running"""
+        return not self._refresh_done.is_set()
+
+    def refresh(self) -> bool:
+        """
+        Refresh the minion list from salt-key, keeping the stale copy on failure
+
+        Returns:
+            True if the list was refreshed successfully
+        """
+        # wait() returns once the event is set, so only set it after the
+        # new list is stored (or the refresh has failed)
+        try:
+            try:
+                minions = self._fetch()
+            except MinionListError as e:
+                self.last_error = str(e)
+                return False
+
+            self.last_error = None
+            self._set_minions(minions, time.time())
+            self.save()
+            return True
+        finally:
+            self._refresh_done.set()
+
+    def refresh_in_background(self):
+        """Start a background refresh unless one is already running"""
+        with self._lock:
+            if self.refreshing:
+                return
+            self._refresh_done.clear()
+        thread = threading.Thread(target=self.refresh, name='saltctl-minion-refresh', daemon=True)
+        thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until any running background refresh completes
+
+        Returns:
+            False if the refresh was still running when the timeout expired
+        """
+        return self._refresh_done.wait(timeout)
+
+    def _set_minions(self, minions: List[str], timestamp: Optional[float]):
+        changed = minions != self.minions
+        self.minions = minions
+        self.timestamp = timestamp
+        if changed:
+            for callback in self._listeners:
+                callback(minions)
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,128 @@
+"""Per-minion results parsed from salt's console output"""
+
+import re
+import textwrap
+from typing import Iterable, List, NamedTuple, Optional
+
+
+class MinionResult(NamedTuple):
+    """One minion's return from a salt run"""
+    minion: str
+    success: Optional[bool]         # None when it can't be told from the output
+    changed_count: Optional[int]
+    failed_count: Optional[int]
+    duration: Optional[float]       # seconds
+    payload: str
+
+
+# Highstate summary lines, e.g.
+#   Succeeded: 12 (changed=3)
+#   Failed:     1
+#   Total run time:   4.210 s
+_SUCCEEDED = re.compile(r'^Succeeded:\s*(\d+)(?:\s*\((.*)\))?', re.MULTILINE)
+_FAILED = re.compile(r'^Failed:\s*(\d+)', re.MULTILINE)
+_RUN_TIME = re.compile(r'^Total run time:\s*([\d.]+)\s*(ms|s)\b', re.MULTILINE)
+_CHANGED = re.compile(r'\bchanged=(\d+)')
+
+_NO_RETURN = 'Minion did not return'
+_EXCEPTION_PREFIXES = ('ERROR', 'The minion function caused an exception')
+
+
+def split_minion_sections(output: str, minions: Iterable[str]) -> List[tuple]:
+    """
+    Split salt console output into (minion, text) sections
+
+    Salt's outputters start each minion's return with its name at the
+    start of a line followed by a colon. Only targeted minion names are
+    treated as headers, since highstate output also has unindented lines.
+    """
+    targeted = set(minions)
+    sections = []
+    current = None
+    lines: List[str] = []
+    for line in output.splitlines():
+        header = line.rstrip()
+        if header.endswith(':') and header[:-1] in targeted:
+            if current is not None:
+                sections.append((current, lines))
+            current = header[:-1]
+            lines = []
+        elif current is not None:
+            lines.append(line)
+    if current is not None:
+        sections.append((current, lines))
+
+    return [(minion, textwrap.dedent('\n'.join(lines)).strip('\n')) for minion, lines in sections]
+
+
+def _parse_highstate(text: str) -> Optional[tuple]:
+    """(changed, failed, duration) from a highstate summary, or None if there isn't one"""
+    succeeded = _SUCCEEDED.search(text)
+    failed = _FAILED.search(text)
+    if succeeded is None or failed is None:
+        return None
+
+    changed = _CHANGED.search(succeeded.group(2) or '')
+    duration = None
+    run_time = _RUN_TIME.search(text)
+    if run_time:
+        duration = float(run_time.group(1))
+        if run_time.group(2) == 'ms':
+            duration /= 1000
+    return (int(changed.group(1)) if changed else 0, int(failed.group(1)), duration)
+
+
+def parse_minion_result(minion: str, text: str, function: str, returncode: int) -> MinionResult:
+    """
+    Interpret one minion's section of salt output
+
+    Args:
+        minion: Minion name
+        text: The minion's (dedented) section of the output
+        function: Salt function that was run, e.g. 'state.apply' or 'test.ping'
+        returncode: Exit status of the salt command as a whole
+    """
+    changed = failed = duration = None
+    success: Optional[bool] = None
+
+    if _NO_RETURN in text:
+        success = False
+    elif text.lstrip().startswith(_EXCEPTION_PREFIXES):
+        success = False
+    elif function.startswith('state.'):
+        summary = _parse_highstate(text)
+        if summary is not None:
+            changed, failed, duration = summary
+            success = failed == 0
+    elif function == 'test.ping':
+        success = text.strip() == 'True'
+    elif function.startswith('pkg.'):
+        # Each changed package is a nested dict with 'new' and 'old' keys
+        changed = sum(1 for line in text.splitlines() if line.strip() == 'new:')
+
+    # Salt exits 0 only when every minion succeeded
+    if success is None and returncode == 0:
+        success = True
+
+    return MinionResult(minion, success, changed, failed, duration, text)
+
+
+def parse_salt_output(output: str, minions: Iterable[str], function: str,
+                      returncode: int) -> List[MinionResult]:
+    """
+    Per-minion results from salt's console output
+
+    Args:
+        output: Salt's stdout
+        minions: Targeted minion names
+        function: Salt function that was run
+        returncode: Exit status of the salt command
+
+    Returns:
+        One result per minion found in the output, in output order
+    """
+    return [parse_minion_result(minion, text, function, returncode)
+            for minion, text in split_minion_sections(output, minions)]
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,127 @@
+"""Retention policies for salt output stored in the history database"""
+
+import sys
+import time
+from typing import Iterable, List, NamedTuple, Optional
+
+# Columns a count policy can group commands by
+_GROUP_COLUMNS = ('selected_hosts', 'verb')
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    Limits on stored salt output
+
+    Policies only ever drop outputs (and per-minion output); the command
+    history entries themselves are kept until 'history trim'. Zero means
+    no limit.
+    """
+    max_db_size: int = 0            # bytes of pages and blob files in use
+    keep_per_hosts: int = 0         # newest outputs kept per selected host set
+    keep_per_command: int = 0       # newest outputs kept per command (first word)
+    output_days: int = 0            # outputs older than this are dropped
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit > 0 for limit in self)
+
+
+def live_size(cursor) -> int:
+    """Bytes of the database file in use (free pages excluded)"""
+    page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+    free = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+    return (page_count - free) * page_size
+
+
+def blob_size(cursor) -> int:
+    """Bytes of the blob store files the history refers to"""
+    # Each file counted once, however many rows share it
+    return cursor.execute('''
+        SELECT COALESCE(SUM(blob_size), 0) FROM (
+            SELECT blob_hash, blob_size FROM salt_outputs WHERE blob_hash IS NOT NULL
+            UNION
+            SELECT blob_hash, blob_size FROM minion_results WHERE blob_hash IS NOT NULL
+        )
+    ''').fetchone()[0]
+
+
+def history_size(cursor) -> int:
+    """Bytes the history takes: database pages in use plus its blob files"""
+    return live_size(cursor) + blob_size(cursor)
+
+
+def _oldest_outputs(cursor, limit: int, before: Optional[int] = None) -> List[int]:
+    """Stored outputs of the oldest commands (run before an epoch, if given)"""
+    # Ordered by the commands' time, not output IDs: 'db import' gives old
+    # outputs new IDs. idx_salt_outputs_command_epoch is read in order, so
+    # a step only reads the outputs it returns.
+    return [row[0] for row in cursor.execute('''
+        SELECT id FROM salt_outputs
+        WHERE command_epoch < ?
+        ORDER BY command_epoch, command_id, id
+        LIMIT ?
+    ''', (sys.maxsize if before is None else before, limit))]
+
+
+def _outputs_past_age(cursor, days: int, limit: int) -> List[int]:
+    return _oldest_outputs(cursor, limit, before=int(time.time()) - days * 86400)
+
+
+def _outputs_past_count(cursor, column: str, value, keep: int, limit: int) -> List[int]:
+    """Outputs of commands sharing column's value, beyond the newest keep"""
+    assert column in _GROUP_COLUMNS
+    return [row[0] for row in cursor.execute(f'''
+        SELECT o.id FROM command_history c
+        JOIN salt_outputs o ON o.command_id = c.id
+        WHERE c.{column} = ?
+        ORDER BY c.epoch DESC, c.id DESC
+        LIMIT ? OFFSET ?
+    ''', (value, limit, keep))]
+
+
+def select_outputs(cursor, policy: RetentionPolicy, command_ids: Iterable[int],
+                   limit: int) -> List[int]:
+    """
+    IDs of at most limit outputs to drop in one retention step
+
+    Count policies are checked only for the groups of the given (newly
+    logged) commands, as no other group can have grown past its limit.
+
+    Args:
+        cursor: Cursor inside the step's write transaction
+        policy: Limits to enforce
+        command_ids: Commands logged since the last step
+        limit: Most outputs to select
+    """
+    selected: List[int] = []
+
+    def add(ids):
+        for output_id in ids:
+            if len(selected) < limit and output_id not in selected:
+                selected.append(output_id)
+
+    if policy.output_days > 0:
+        add(_outputs_past_age(cursor, policy.output_days, limit))
+
+    command_ids = list(command_ids)
+    if command_ids and (policy.keep_per_hosts > 0 or policy.keep_per_command > 0):
+        placeholders = ','.join('?' * len(command_ids))
+        groups = cursor.execute(f'''
+            SELECT DISTINCT selected_hosts, verb FROM command_history
+            WHERE id IN ({placeholders})
+        ''', command_ids).fetchall()
+        for hosts_json, verb in groups:
+            if policy.keep_per_hosts > 0 and hosts_json is not None:
+                add(_outputs_past_count(cursor, 'selected_hosts', hosts_json,
+                                        policy.keep_per_hosts, limit))
+            if policy.keep_per_command > 0 and verb is not None:
+                add(_outputs_past_count(cursor, 'verb', verb, policy.keep_per_command, limit))
+
+    if policy.max_db_size > 0 and len(selected) < limit and history_size(cursor) > policy.max_db_size:
+        add(_oldest_outputs(cursor, limit))
+
+    return selected
+
+
+# vim: set ts=4 sw=4 et:
@@ -6,29 +6,95 @@ Interactive shell for managing Salt minions - Main script.
 import sys
 import os
 import time
-import subprocess
-import json
+import argparse
 import readline
-from typing import List, Dict
-from commands import load_commands
-from commands.base import BaseCommand
+import threading
+from typing import List, Optional
+from commands import CommandRegistry, load_commands
 from database import SaltCtlDatabase
+from retention import RetentionPolicy
 from config import SaltCtlConfig
+from minions import MinionCache, fetch_minions
+from completion import Completer
+from timing import timer
+from background import JobManager
+
+def split_script(text: str) -> List[str]:
+    """
+    Split script text into command lines
+
+    Commands are separated by newlines or ';'. Blank lines and lines
+    starting with '#' are skipped.
+    """
+    commands = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for cmdLine in line.split(';'):
+            cmdLine = cmdLine.strip()
+            if cmdLine:
+                commands.append(cmdLine)
+    return commands
+
 
 class SaltCtlShell:
-    def __init__(self):
+    def __init__(self, interactive: bool = True, shared: Optional['SaltCtlShell'] = None,
+                 username: Optional[str] = None):
+        """
+        Args:
+            interactive: Set up readline for an interactive prompt
+            shared: Another shell whose database, config, commands, minion
+                cache and jobs this one uses (daemon sessions share one set)
+            username: User to record in history (defaults to $USER)
+        """
+        self.interactive = interactive
+        self.startup_timings = timer.begin('startup')
+        # Per-thread overrides used while a background job runs
+        self._job_context = threading.local()
         self.selected_hosts: List[str] = []
-        self.all_minions: List[str] = []
-        self.db = SaltCtlDatabase()
-        self.config = SaltCtlConfig()
-        self.username = os.getenv('USER') or os.getenv('USERNAME') or 'unknown'
-        self.commands: Dict[str, BaseCommand] = load_commands()
+        self.username = username or os.getenv('USER') or os.getenv('USERNAME') or 'unknown'
         self.running = True
+        self.print_timings = False
         self.last_command_id = None
+        self.last_command_failed = False
         self.readline_history_file = os.path.expanduser("~/.saltctl_history")
-        self._setup_readline()
-        print("Loading minion list...")
-        self.refresh_minions()
+
+        if shared is not None:
+            self.db = shared.db
+            self.config = shared.config
+            self.commands = shared.commands
+            self.completer = shared.completer
+            self.jobs = shared.jobs
+            self.minion_cache = shared.minion_cache
+        else:
+            with timer.phase('config files'):
+                self.config = SaltCtlConfig()
+            with timer.phase('database init'):
+                self.db = SaltCtlDatabase(
+                    self.config.db_path,
+                    journal_mode=self.config.db_journal_mode,
+                    output_codec=self.config.db_output_codec,
+                    write_behind=self.config.db_write_behind,
+                    retention=RetentionPolicy(
+                        max_db_size=self.config.retention_max_db_size,
+                        keep_per_hosts=self.config.retention_keep_outputs_per_hosts,
+                        keep_per_command=self.config.retention_keep_outputs_per_command,
+                        output_days=self.config.retention_output_days
+                    ),
+                    busy_timeout=self.config.db_busy_timeout,
+                    blob_threshold=self.config.db_blob_threshold
+                )
+            with timer.phase('load commands'):
+                self.commands: CommandRegistry = load_commands()
+            self.completer = Completer(self.commands)
+            self.jobs = JobManager(self.config.job_workers)
+            with timer.phase('minion cache'):
+                self._setup_minion_cache()
+
+        if interactive:
+            with timer.phase('readline setup'):
+                self._setup_readline()
         self.update_prompt()
 
     def update_prompt(self):
@@ -39,6 +105,41 @@ class SaltCtlShell:
         else:
             self.prompt = "saltctl> "
 
+    @property
+    def selected_hosts(self) -> List[str]:
+        """Selected hosts (a background job sees the selection it was started with)"""
+        return getattr(self._job_context, 'selected_hosts', self._selected_hosts)
+
+    @selected_hosts.setter
+    def selected_hosts(self, hosts: List[str]):
+        self._selected_hosts = hosts
+
+    @property
+    def last_command_id(self) -> Optional[int]:
+        """History ID of the command being run (per job when running in the background)"""
+        return getattr(self._job_context, 'command_id', self._last_command_id)
+
+    @last_command_id.setter
+    def last_command_id(self, command_id: Optional[int]):
+        job = getattr(self._job_context, 'job', None)
+        if job is not None:
+            self._job_context.command_id = command_id
+            job.command_id = command_id
+        else:
+            self._last_command_id = command_id
+
+    def mark_failed(self):
+        """Record that the command being run failed (checked by script mode and jobs)"""
+        if getattr(self._job_context, 'job', None) is not None:
+            self._job_context.failed = True
+        else:
+            self.last_command_failed = True
+
+    @property
+    def command_failed(self) -> bool:
+        """Whether the command being run has failed so far (per job when running in the background)"""
+        return getattr(self._job_context, 'failed', self.last_command_failed)
+
     def build_salt_cmd(self, *args):
         """Build salt command with sudo if configured"""
         cmd = list(args)
@@ -50,34 +151,55 @@ class SaltCtlShell:
         """Build comma-separated list of selected hosts for salt --list"""
         return ','.join(self.selected_hosts)
 
+    def _setup_minion_cache(self):
+        """Serve the minion list from the on-disk cache, refreshing it in the background"""
+        self.minion_cache = MinionCache(
+            os.path.expanduser("~/.saltctl_minions.json"),
+            self.config.minion_cache_ttl,
+            self._fetch_minions
+        )
+        self.minion_cache.add_listener(self._on_minions_changed)
+        self.minion_cache.load()
+        if self.minion_cache.is_stale:
+            self.minion_cache.refresh_in_background()
+
+    def _fetch_minions(self) -> List[str]:
+        """Fetch the accepted minion list from salt-key"""
+        cmd = self.build_salt_cmd("salt-key", "--list=accepted", "--out=json")
+        start = time.monotonic()
+        try:
+            return fetch_minions(cmd, timeout=self.config.minion_refresh_timeout)
+        finally:
+            timer.record(self.startup_timings, 'salt-key (background)', time.monotonic() - start)
+
+    def _on_minions_changed(self, minions: List[str]):
+        """Called by the minion cache whenever the list changes"""
+        self.completer.minion_index.update(minions)
+
+    @property
+    def all_minions(self) -> List[str]:
+        """Accepted minions, as last loaded or refreshed by the minion cache"""
+        return self.minion_cache.minions
+
+    def wait_for_minions(self):
+        """Block until a pending minion list refresh completes (or times out)"""
+        if self.minion_cache.refreshing:
+            if not self.all_minions:
+                print("Loading minion list...")
+            if not self.minion_cache.wait(self.config.minion_refresh_timeout):
+                print("Warning: salt-key is slow to respond, using cached minion list")
+                return
+
+        if self.minion_cache.last_error:
+            print(f"Warning: {self.minion_cache.last_error}")
+            if self.all_minions:
+                print("Using cached minion list.")
+            self.minion_cache.last_error = None
+
     def refresh_minions(self):
         """Refresh the list of available minions from salt-key"""
-        try:
-            cmd = self.build_salt_cmd("salt-key", "--list=accepted", "--out=json")
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            data = json.loads(result.stdout)
-            if 'minions' in data:
-                self.all_minions = data['minions']
-            else:
-                print(f"Error: Unexpected salt-key output format - missing 'minions' key")
-                sys.exit(1)
-        except subprocess.CalledProcessError as e:
-            print(f"Error: Failed to get minion list: {e}")
-            sys.exit(1)
-        except FileNotFoundError:
-            print("Error: salt-key command not found. Is Salt installed?")
-            sys.exit(1)
-        except json.JSONDecodeError as e:
-            print(f"Error: Failed to parse minion list JSON: {e}")
-            sys.exit(1)
-        except KeyError as e:
-            print(f"Error: Unexpected salt-key output structure: {e}")
-            sys.exit(1)
+        self.minion_cache.refresh_in_background()
+        self.wait_for_minions()
 
     def _setup_readline(self):
         """Configure readline for command history and editing"""
@@ -91,16 +213,20 @@ class SaltCtlShell:
         # Set maximum history length
         readline.set_history_length(1000)
 
-        # Enable tab completion
+        # Enable tab completion. Only whitespace separates words, since
+        # minion names commonly contain '-' and '.'
         readline.parse_and_bind('tab: complete')
+        readline.set_completer_delims(' \t\n')
         readline.set_completer(self._completer)
 
     def _completer(self, text, state):
-        """Tab completion for commands"""
-        options = [cmd for cmd in self.commands.keys() if cmd.startswith(text)]
-        if state < len(options):
-            return options[state]
-        return None
+        """Tab completion for commands, subcommands and minion names"""
+        return self.completer.complete(
+            readline.get_line_buffer(),
+            readline.get_begidx(),
+            text,
+            state
+        )
 
     def run_command(self, cmdLine: str) -> bool:
         """
@@ -113,6 +239,15 @@ class SaltCtlShell:
         if not cmdLine:
             return False
 
+        self.last_command_failed = False
+
+        # A trailing '&' runs the command as a background job
+        background = cmdLine.endswith('&')
+        if background:
+            cmdLine = cmdLine[:-1].rstrip()
+            if not cmdLine:
+                return False
+
         # Split into command and arguments
         parts = cmdLine.split(None, 1)
         cmdInput = parts[0]
@@ -123,51 +258,168 @@ class SaltCtlShell:
             print("Goodbye!")
             return True
 
-        start_time = time.time()
-        result = False
-        executed_command = None
-
         # Check for exact match first
         if cmdInput in self.commands:
-            executed_command = self.commands[cmdInput]
+            cmd_name = cmdInput
         else:
             # Try shortest unique prefix matching
-            matches = [name for name in self.commands.keys() if name.startswith(cmdInput)]
+            matches = self.completer.command_index.matches(cmdInput)
             if len(matches) == 1:
                 # Unique match found
-                executed_command = self.commands[matches[0]]
+                cmd_name = matches[0]
             elif len(matches) > 1:
-                print(f"Ambiguous command '{cmdInput}'. Matches: {', '.join(sorted(set(matches)))}")
+                print(f"Ambiguous command '{cmdInput}'. Matches: {', '.join(matches)}")
+                self.mark_failed()
                 return False
             else:
                 print(f"Unknown command: {cmdInput}")
                 print("Type 'help' for available commands.")
+                self.mark_failed()
                 return False
 
+        # Import the command's module on first use
+        executed_command = self.commands.get(cmd_name)
+        if executed_command is None:
+            self.mark_failed()
+            return False
+
+        section = timer.begin(cmdLine)
+
         # Validate command before logging/execution
-        if not executed_command.validate(self, args):
+        with timer.phase('validate'):
+            valid = executed_command.validate(self, args)
+        if not valid:
+            self.mark_failed()
             return False
 
+        if background:
+            if not executed_command.can_run_in_background:
+                print(f"Error: '{cmd_name}' can't run in the background")
+                self.mark_failed()
+                return False
+            self._start_job(executed_command, args, cmdLine)
+            return False
+
+        return self._execute(executed_command, args, cmdLine, section)
+
+    def _execute(self, executed_command, args: str, cmdLine: str, section) -> bool:
+        """Run a validated command, logging it to history when required"""
+        start_time = time.time()
+
         # Log to database BEFORE execution (when required)
         if executed_command.log_in_history:
-            command_id = self.db.log_command(
-                self.username,
-                self.selected_hosts,
-                cmdLine,
-                0.0  # Duration will be updated after execution
-            )
+            with timer.phase('history insert'):
+                command_id = self.db.log_command(
+                    self.username,
+                    self.selected_hosts,
+                    cmdLine,
+                    0.0  # Duration will be updated after execution
+                )
             self.last_command_id = command_id
 
         # Execute the command
-        result = executed_command.execute(self, args)
+        with timer.phase('execute'):
+            result = executed_command.execute(self, args)
 
         # Update duration if command was logged
         if executed_command.log_in_history:
             duration = time.time() - start_time
-            self.db.update_command_duration(command_id, duration)
+            with timer.phase('db writes'):
+                self.db.update_command_duration(command_id, duration,
+                                                success=not self.command_failed)
+
+        if section is not None and self.print_timings:
+            print(section.format())
 
         return result
 
+    def _start_job(self, executed_command, args: str, cmdLine: str):
+        """Run a validated command on the job worker pool"""
+        hosts = list(self.selected_hosts)
+
+        def run(job) -> bool:
+            context = self._job_context
+            context.job = job
+            context.selected_hosts = hosts
+            context.failed = False
+            try:
+                section = timer.begin(f"{cmdLine} &")
+                self._execute(executed_command, args, cmdLine, section)
+                return context.failed
+            finally:
+                context.__dict__.clear()
+
+        job = self.jobs.submit(cmdLine, run, owner=self, username=self.username)
+        print(f"[{job.id}] Started: {cmdLine}")
+
+    def report_finished_jobs(self) -> bool:
+        """
+        Announce background jobs that finished since the last prompt
+
+        Returns:
+            True if any of them failed
+        """
+        failed = False
+        for job in self.jobs.take_finished(owner=self):
+            print(job.describe())
+            print(f"    Run 'fg {job.id}' to see its console output.")
+            failed = failed or job.failed
+        return failed
+
+    def report_database_errors(self, exiting: bool = False):
+        """Warn about history writes and retention steps that failed since the last prompt"""
+        error = self.db.write_error
+        if error:
+            print(f"Warning: Failed to write command history: {error}")
+            if exiting:
+                print("Commands since the last successful write are missing from history.")
+            else:
+                print("It will be written with the next command.")
+            self.db.clear_write_error()
+        if self.db.retention_error:
+            print(f"Warning: Failed to apply the retention policy: {self.db.retention_error}")
+            self.db.retention_error = None
+
+    def wait_for_jobs(self) -> bool:
+        """
+        Wait for this shell's background jobs to finish
+
+        Returns:
+            True if any job that hadn't been announced yet failed
+        """
+        running = self.jobs.running(owner=self)
+        if running:
+            print(f"Waiting for {len(running)} background job(s) to finish...")
+            self.jobs.wait_all(owner=self)
+        return self.report_finished_jobs()
+
+
+    def run_script(self, commands: List[str], keep_going: bool = False) -> int:
+        """
+        Run a list of command lines without prompting
+
+        Args:
+            commands: Command lines to run in order
+            keep_going: Continue after a failed command instead of stopping
+
+        Returns:
+            Process exit status: 0 if every command succeeded, 1 otherwise
+        """
+        status = 0
+        for cmdLine in commands:
+            print(f"{self.prompt}{cmdLine}")
+            should_exit = self.run_command(cmdLine)
+            if self.last_command_failed:
+                status = 1
+                if not keep_going:
+                    print(f"Stopping: '{cmdLine}' failed")
+                    break
+            if should_exit:
+                break
+        if self.wait_for_jobs():
+            status = 1
+        return status
+
     def mainInputLoop(self):
         """The main command user input loop"""
         print("SaltCtl - Salt Minion Management")
@@ -176,6 +428,8 @@ class SaltCtlShell:
         try:
             while self.running:
                 try:
+                    self.report_finished_jobs()
+                    self.report_database_errors()
                     cmdLine = input(self.prompt)
                     should_exit = self.run_command(cmdLine)
                     if should_exit:
@@ -193,16 +447,82 @@ class SaltCtlShell:
         finally:
             # Save readline history on exit
             readline.write_history_file(self.readline_history_file)
+            self.wait_for_jobs()
+            self.db.close()
+            self.report_database_errors(exiting=True)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Interactive shell for managing Salt minions")
+    parser.add_argument('-c', '--command', metavar='COMMANDS',
+                        help="run ';'-separated commands and exit, e.g. \"select web; push test\"")
+    parser.add_argument('-f', '--file', metavar='SCRIPT',
+                        help="run commands from SCRIPT ('-' for stdin) and exit")
+    parser.add_argument('-k', '--keep-going', action='store_true',
+                        help="in script mode, continue after a command fails")
+    parser.add_argument('--connect', nargs='?', const='', metavar='SOCKET',
+                        help="attach to a running saltctld (default socket from [daemon] socket)")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print how long each startup phase took")
+    parser.add_argument('--profile', action='store_true',
+                        help="print startup timings and per-stage timings after every command")
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help="write all recorded timings to FILE as JSON on exit")
+    return parser.parse_args(argv)
+
+
+def read_script(args) -> Optional[List[str]]:
+    """Command lines to run non-interactively, or None for an interactive session"""
+    if args.command is not None:
+        return split_script(args.command)
+    if args.file == '-' or (args.file is None and not sys.stdin.isatty()):
+        return split_script(sys.stdin.read())
+    if args.file is not None:
+        with open(args.file) as f:
+            return split_script(f.read())
+    return None
 
 
 def main():
     """Main entry point"""
+    args = parse_args()
+    timer.enabled = args.profile_startup or args.profile or bool(args.profile_json)
     try:
-        shell = SaltCtlShell()
-        shell.mainInputLoop()
+        script = read_script(args)
+    except OSError as e:
+        print(f"Error: Failed to read script: {e}")
+        sys.exit(2)
+
+    if args.connect is not None:
+        from daemon import run_client
+        socket_path = args.connect or SaltCtlConfig().daemon_socket
+        sys.exit(run_client(socket_path, script, keep_going=args.keep_going))
+
+    try:
+        shell = SaltCtlShell(interactive=script is None)
+        shell.print_timings = args.profile
+        if args.profile_startup or args.profile:
+            print(shell.startup_timings.format())
+        if script is None:
+            shell.mainInputLoop()
+        else:
+            # Output goes to a file or pipe, so never page it
+            os.environ['SALTCTL_PAGER'] = ''
+            # One minion list snapshot for the whole run
+            shell.wait_for_minions()
+            try:
+                status = shell.run_script(script, keep_going=args.keep_going)
+            finally:
+                shell.db.close()
+                shell.report_database_errors(exiting=True)
+            sys.exit(status)
     except KeyboardInterrupt:
         print("\nExiting...")
         sys.exit(0)
+    finally:
+        if args.profile_json:
+            timer.dump_json(args.profile_json)
 
 
 if __name__ == "__main__":
@@ -14,7 +14,7 @@ setup(
     url='https://github.com/fukawi2/saltctl',
     license='MIT',
     packages=find_packages(),
-    py_modules=['saltctl', 'database', 'config'],
+    py_modules=['saltctl', 'database', 'config', 'minions', 'timing', 'completion', 'background', 'daemon', 'results', 'writebehind', 'retention', 'stats', 'export', 'blobstore', 'swaplock'],
     python_requires='>=3.6',
     install_requires=[
         # No external dependencies - uses only stdlib
@@ -22,6 +22,7 @@ setup(
     entry_points={
         'console_scripts': [
             'saltctl=saltctl:main',
+            'saltctld=daemon:main',
         ],
     },
     classifiers=[
@@ -0,0 +1,93 @@
+"""Duration histograms behind the 'stats' command"""
+
+import math
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Durations are counted in log-scale buckets: bucket n holds durations up
+# to BUCKET_BASE * BUCKET_GROWTH ** n seconds, so a percentile read from
+# the histogram is within one bucket (about 19%) of the exact value
+BUCKET_BASE = 0.01
+BUCKET_GROWTH = 2 ** 0.25
+
+# What 'stats' can group by -> command_stats column
+GROUP_COLUMNS = {
+    'verb': 'verb',
+    'user': 'username',
+    'hosts': 'selected_hosts',
+}
+
+# Seconds per row of command_stats
+STATS_PERIOD = 3600
+
+
+def duration_bucket(duration: Optional[float]) -> int:
+    """Histogram bucket counting a command duration"""
+    if duration is None or duration <= BUCKET_BASE:
+        return 0
+    # The small margin keeps exact bucket limits in their own bucket
+    return int(math.ceil(math.log(duration / BUCKET_BASE, BUCKET_GROWTH) - 1e-9))
+
+
+def bucket_limit(bucket: int) -> float:
+    """Longest duration counted in a bucket"""
+    return BUCKET_BASE * BUCKET_GROWTH ** bucket
+
+
+class CommandStats(NamedTuple):
+    """Summary of the commands sharing a verb, user or host set"""
+    key: str
+    commands: int
+    p50: float                      # seconds
+    p95: float
+    longest: float
+    failure_rate: Optional[float]   # None when no outcome was recorded (older history)
+
+
+def _percentile(histogram: Dict[int, int], total: int, fraction: float) -> float:
+    rank = max(1, math.ceil(total * fraction))
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_limit(bucket)
+    return bucket_limit(max(histogram))
+
+
+def summarize(rows: Iterable[tuple]) -> List[CommandStats]:
+    """
+    Per-group statistics from histogram rows
+
+    Args:
+        rows: (key, bucket, commands, outcomes, failures, longest) tuples,
+            at most one per key and bucket
+
+    Returns:
+        One summary per key, busiest first
+    """
+    groups: Dict[str, dict] = {}
+    for key, bucket, commands, outcomes, failures, longest in rows:
+        group = groups.setdefault(key, {'histogram': {}, 'outcomes': 0, 'failures': 0, 'longest': 0.0})
+        group['histogram'][bucket] = group['histogram'].get(bucket, 0) + commands
+        group['outcomes'] += outcomes
+        group['failures'] += failures
+        group['longest'] = max(group['longest'], longest)
+
+    summaries = []
+    for key, group in groups.items():
+        histogram = group['histogram']
+        total = sum(histogram.values())
+        if total == 0:
+            continue
+        longest = group['longest']
+        summaries.append(CommandStats(
+            key, total,
+            min(_percentile(histogram, total, 0.5), longest),
+            min(_percentile(histogram, total, 0.95), longest),
+            longest,
+            group['failures'] / group['outcomes'] if group['outcomes'] else None,
+        ))
+    summaries.sort(key=lambda stats: (-stats.commands, stats.key))
+    return summaries
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,107 @@
+"""Lock that keeps transactions out while a compacted database is copied in"""
+
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, TextIO
+
+
+class SwapLock:
+    """
+    flock() on a file beside the database, shared by transactions
+
+    Every transaction holds the lock shared, so whoever holds it
+    exclusively knows that no connection, in this process or another
+    shell, is inside a transaction or can start one until it lets go.
+    SaltCtlDatabase.optimize() holds it exclusively from checking that
+    nobody wrote while its compacted copy was made until the copy has
+    replaced the database.
+
+    flock() locks belong to an open file rather than a thread, so each
+    thread opens the file itself. A thread's nested shared holds are
+    counted and only the outermost one takes and releases the lock.
+    """
+
+    # Seconds between attempts at the exclusive lock
+    RETRY_DELAY = 0.01
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._files: List[TextIO] = []
+        self._lock = threading.Lock()
+
+    def _file(self) -> TextIO:
+        """The calling thread's lock file, opened (and created) on first use"""
+        f = getattr(self._local, 'file', None)
+        if f is None:
+            f = open(self.path, 'a')
+            self._local.file = f
+            self._local.depth = 0
+            with self._lock:
+                self._files.append(f)
+        return f
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        """Hold the lock shared, waiting while someone holds it exclusively"""
+        f = self._file()
+        if self._local.depth == 0:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+        self._local.depth += 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def exclusive(self, timeout: float) -> Iterator[bool]:
+        """
+        Hold the lock exclusively once every shared holder has let go
+
+        Yields:
+            False if shared holders kept it for longer than timeout
+        """
+        f = self._file()
+        deadline = time.monotonic() + timeout
+        acquired = False
+        try:
+            while True:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        break
+                time.sleep(self.RETRY_DELAY)
+            yield acquired
+        finally:
+            # Converting a lock isn't atomic, so a shared hold of this
+            # thread's may have been dropped by the attempt: take it again
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if self._local.depth else fcntl.LOCK_UN)
+
+    def release_thread(self):
+        """Close the calling thread's lock file (for threads that are about to exit)"""
+        f = getattr(self._local, 'file', None)
+        if f is not None:
+            self._local.file = None
+            with self._lock:
+                if f in self._files:
+                    self._files.remove(f)
+            f.close()
+
+    def close(self):
+        """Close every thread's lock file; they reopen on next use"""
+        with self._lock:
+            files = self._files
+            self._files = []
+            self._local = threading.local()
+        for f in files:
+            f.close()
+
+
+# vim: set ts=4 sw=4 et:
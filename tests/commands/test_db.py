@@ -0,0 +1,191 @@
+"""Tests for db command"""
+
+import pytest
+from datetime import date
+from commands.db import DbCommand
+
+
+def test_db_command_name():
+    """Test db command has correct name"""
+    cmd = DbCommand()
+    assert cmd.name == "db"
+
+
+def test_db_not_logged():
+    """Test db command is not logged to history but can run in the background"""
+    cmd = DbCommand()
+    assert cmd.log_in_history == False
+    assert cmd.can_run_in_background == True
+
+
+def test_db_recompress_default_codec(mock_shell, capsys):
+    """Test recompressing with the configured codec"""
+    cmd = DbCommand()
+    mock_shell.config.db_output_codec = 'zlib'
+    mock_shell.db.recompress.return_value = (3, 30000, 3000)
+
+    cmd.execute(mock_shell, 'recompress')
+
+    assert mock_shell.db.recompress.call_args[0] == ('zlib',)
+    assert "Converted 3 outputs" in capsys.readouterr().out
+
+
+def test_db_recompress_named_codec(mock_shell):
+    """Test recompressing with a codec given on the command line"""
+    cmd = DbCommand()
+    mock_shell.db.recompress.return_value = (0, 0, 0)
+
+    cmd.execute(mock_shell, 'recompress lzma')
+
+    assert mock_shell.db.recompress.call_args[0] == ('lzma',)
+
+
+def test_db_recompress_unknown_codec(mock_shell):
+    """Test an unknown codec is rejected"""
+    cmd = DbCommand()
+
+    cmd.execute(mock_shell, 'recompress bzip9')
+
+    mock_shell.db.recompress.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+def test_db_reindex(mock_shell, capsys):
+    """Test rebuilding the output search index"""
+    cmd = DbCommand()
+    mock_shell.db.reindex_outputs.return_value = 42
+
+    cmd.execute(mock_shell, 'reindex')
+
+    mock_shell.db.reindex_outputs.assert_called_once()
+    assert "Indexed 42 outputs" in capsys.readouterr().out
+
+
+def test_db_unknown_subcommand(mock_shell):
+    """Test an unknown subcommand shows usage and fails"""
+    cmd = DbCommand()
+
+    cmd.execute(mock_shell, 'frobnicate')
+
+    mock_shell.mark_failed.assert_called_once()
+
+
+
+def test_db_vacuum(mock_shell, capsys):
+    """Test vacuum reports the file size before and after"""
+    cmd = DbCommand()
+    mock_shell.db.vacuum.return_value = (10 * 1024 * 1024, 4 * 1024 * 1024)
+
+    cmd.execute(mock_shell, 'vacuum')
+
+    mock_shell.db.vacuum.assert_called_once()
+    assert "10.0 MiB -> 4.0 MiB" in capsys.readouterr().out
+
+
+
+def test_db_archive_default_months(mock_shell, capsys):
+    """Test archiving keeps history.archive_months whole months live"""
+    cmd = DbCommand()
+    mock_shell.config.history_archive_months = 12
+    mock_shell.db.archive_old_history.return_value = (40, 30, 2)
+
+    cmd.execute(mock_shell, 'archive')
+
+    cutoff = mock_shell.db.archive_old_history.call_args[0][0]
+    assert cutoff.endswith('-01')
+    assert cutoff < date.today().replace(day=1).isoformat()
+    assert "Moved 40 commands and 30 outputs into 2 monthly archive files." in capsys.readouterr().out
+
+
+def test_db_archive_months_argument(mock_shell):
+    """Test the months to keep can be given on the command line"""
+    cmd = DbCommand()
+    mock_shell.db.archive_old_history.return_value = (0, 0, 0)
+    today = date.today()
+
+    cmd.execute(mock_shell, 'archive 1')
+
+    previous = date(today.year - (today.month == 1), (today.month - 2) % 12 + 1, 1)
+    assert mock_shell.db.archive_old_history.call_args[0][0] == previous.isoformat()
+
+
+def test_db_archive_bad_months(mock_shell):
+    """Test a non-numeric month count is rejected"""
+    cmd = DbCommand()
+
+    cmd.execute(mock_shell, 'archive soon')
+
+    mock_shell.db.archive_old_history.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+
+def test_db_import(mock_shell, capsys):
+    """Test the path is passed as typed and the result reported"""
+    cmd = DbCommand()
+    mock_shell.db.import_history.return_value = (12, 5, 3)
+
+    cmd.execute(mock_shell, 'import /backups/Alice Laptop.db')
+
+    assert mock_shell.db.import_history.call_args[0][0] == '/backups/Alice Laptop.db'
+    assert 'Imported 12 commands and 5 outputs (3 already present).' in capsys.readouterr().out
+
+
+def test_db_import_requires_path(mock_shell):
+    """Test a path is required"""
+    cmd = DbCommand()
+
+    cmd.execute(mock_shell, 'import')
+
+    mock_shell.db.import_history.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+def test_db_import_error(mock_shell, capsys):
+    """Test an unusable database is reported as a failure"""
+    cmd = DbCommand()
+    mock_shell.db.import_history.side_effect = ValueError("No such database: x.db")
+
+    cmd.execute(mock_shell, 'import x.db')
+
+    assert 'No such database: x.db' in capsys.readouterr().out
+    mock_shell.mark_failed.assert_called_once()
+
+
+
+def test_db_optimize(mock_shell, capsys):
+    """Test optimize reports the integrity check and, with --vacuum, the size change"""
+    cmd = DbCommand()
+    mock_shell.db.optimize.return_value = ([], 4 * 1024 * 1024, 1024 * 1024)
+
+    cmd.execute(mock_shell, 'optimize --vacuum')
+
+    assert mock_shell.db.optimize.call_args[1] == {'vacuum': True}
+    out = capsys.readouterr().out
+    assert 'integrity check passed' in out
+    assert '4.0 MiB -> 1.0 MiB' in out
+    mock_shell.mark_failed.assert_not_called()
+
+
+def test_db_optimize_integrity_problems(mock_shell, capsys):
+    """Test integrity problems are listed and the command marked failed"""
+    cmd = DbCommand()
+    mock_shell.db.optimize.return_value = (['row 3 missing from index idx_x'], 4096, 4096)
+
+    cmd.execute(mock_shell, 'optimize')
+
+    assert 'row 3 missing from index idx_x' in capsys.readouterr().out
+    mock_shell.mark_failed.assert_called_once()
+
+
+def test_db_optimize_bad_option(mock_shell):
+    """Test unknown optimize options are rejected"""
+    cmd = DbCommand()
+
+    cmd.execute(mock_shell, 'optimize --full')
+
+    mock_shell.db.optimize.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+# vim: set ts=4 sw=4 et:
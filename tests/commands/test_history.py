@@ -1,5 +1,6 @@
 """Tests for history command"""
 
+import json
 import pytest
 from datetime import datetime, timedelta
 from commands.history import HistoryCommand
@@ -22,7 +23,7 @@ def test_history_show_all(mock_shell):
     cmd = HistoryCommand()
     mock_shell.selected_hosts = []
     mock_shell.db.get_command_history.return_value = [
-        (1, '2024-01-01T10:00:00', 'user1', '["host1"]', 'push test', 1.5)
+        (1, '2024-01-01T10:00:00', 'user1', 'host1', 'push test', 1.5)
     ]
 
     cmd.execute(mock_shell, 'full')
@@ -44,6 +45,29 @@ def test_history_show_filtered(mock_shell):
     )
 
 
+def test_history_host(mock_shell):
+    """Test showing one host's command history"""
+    cmd = HistoryCommand()
+    mock_shell.selected_hosts = ['host1']
+    mock_shell.db.get_command_history.return_value = [
+        (1, '2024-01-01T10:00:00', 'user1', 'web03, web04', 'push test', 1.5)
+    ]
+
+    cmd.execute(mock_shell, 'host web03')
+
+    mock_shell.db.get_command_history.assert_called_once_with(selected_hosts=['web03'], limit=50)
+
+
+def test_history_host_requires_name(mock_shell):
+    """Test 'history host' without a host name fails"""
+    cmd = HistoryCommand()
+
+    cmd.execute(mock_shell, 'host')
+
+    mock_shell.db.get_command_history.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
 def test_history_trim(mock_shell):
     """Test trimming old history"""
     cmd = HistoryCommand()
@@ -67,4 +91,182 @@ def test_history_trim_nothing_to_delete(mock_shell):
     assert result == False
 
 
+
+def test_history_trim_reclaims_space(mock_shell, capsys):
+    """Test trim hands freed pages back when incremental vacuum is enabled"""
+    cmd = HistoryCommand()
+    mock_shell.config.history_trim_days = 90
+    mock_shell.db.trim_old_history.return_value = (10, 5)
+    mock_shell.db.auto_vacuum = 'incremental'
+    mock_shell.db.reclaim_space.return_value = 3 * 1024 * 1024
+
+    cmd.execute(mock_shell, 'trim')
+
+    mock_shell.db.reclaim_space.assert_called_once()
+    assert "Released 3.0 MiB" in capsys.readouterr().out
+
+
+def test_history_trim_suggests_vacuum(mock_shell, capsys):
+    """Test trim points at 'db vacuum' when the file can't shrink incrementally"""
+    cmd = HistoryCommand()
+    mock_shell.config.history_trim_days = 90
+    mock_shell.db.trim_old_history.return_value = (10, 5)
+    mock_shell.db.auto_vacuum = 'none'
+
+    cmd.execute(mock_shell, 'trim')
+
+    mock_shell.db.reclaim_space.assert_not_called()
+    assert "db vacuum" in capsys.readouterr().out
+
+
+def test_history_trim_dry_run(mock_shell, capsys):
+    """Test a dry run reports counts and size without deleting"""
+    cmd = HistoryCommand()
+    mock_shell.config.history_trim_days = 90
+    mock_shell.db.estimate_trim.return_value = (10, 5, 2048)
+
+    result = cmd.execute(mock_shell, 'trim --dry-run')
+
+    assert result == False
+    mock_shell.db.trim_old_history.assert_not_called()
+    out = capsys.readouterr().out
+    assert "Would delete 10 command history entries" in out
+    assert "2.0 KiB" in out
+
+
+def test_history_trim_bad_option(mock_shell):
+    """Test an unknown trim option is rejected"""
+    cmd = HistoryCommand()
+
+    cmd.execute(mock_shell, 'trim --force')
+
+    mock_shell.db.trim_old_history.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+
+def test_history_month(mock_shell):
+    """Test a month of history is requested by epoch range, without a limit"""
+    cmd = HistoryCommand()
+    mock_shell.db.get_command_history.return_value = []
+
+    cmd.execute(mock_shell, 'month 2024-12')
+
+    kwargs = mock_shell.db.get_command_history.call_args[1]
+    assert kwargs['limit'] is None
+    assert kwargs['since'] == int(datetime(2024, 12, 1).timestamp())
+    assert kwargs['until'] == int(datetime(2025, 1, 1).timestamp())
+
+
+def test_history_month_bad_date(mock_shell):
+    """Test an invalid month is rejected"""
+    cmd = HistoryCommand()
+
+    cmd.execute(mock_shell, 'month december')
+
+    mock_shell.db.get_command_history.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+
+def test_history_filters_browse(mock_shell, capsys, monkeypatch):
+    """Test filters stream every matching entry, lazily, through the pager"""
+    monkeypatch.setenv('SALTCTL_PAGER', '')
+    cmd = HistoryCommand()
+    mock_shell.selected_hosts = ['host1']
+    mock_shell.db.iter_command_history.return_value = iter([
+        (7, '2024-05-02T10:00:00', 'bob', 'host1', 'push apply', 2.0),
+        (5, '2024-05-01T10:00:00', 'bob', 'host1', 'push test', None),
+    ])
+
+    cmd.execute(mock_shell, '--user bob --command PUSH --since 2024-05-01 --before 9')
+
+    mock_shell.db.iter_command_history.assert_called_once_with(
+        selected_hosts=['host1'], username='bob', verb='push',
+        since=int(datetime(2024, 5, 1).timestamp()), before=9)
+    out = capsys.readouterr().out
+    assert 'Command history for selected hosts (newest first):' in out
+    assert out.index('[ID: 7]') < out.index('[ID: 5]')
+
+
+def test_history_filters_with_host(mock_shell):
+    """Test filters combine with 'full' and 'host <name>'"""
+    cmd = HistoryCommand()
+    mock_shell.selected_hosts = ['host1']
+    mock_shell.db.iter_command_history.return_value = iter([])
+
+    cmd.execute(mock_shell, 'host web01 --after 3')
+    cmd.execute(mock_shell, 'full --until 2024-06-01T12:30')
+
+    first, second = mock_shell.db.iter_command_history.call_args_list
+    assert first[1] == {'selected_hosts': ['web01'], 'after': 3}
+    assert second[1] == {'selected_hosts': None, 'until': int(datetime(2024, 6, 1, 12, 30).timestamp())}
+
+
+def test_history_filters_unknown_id(mock_shell, capsys):
+    """Test an unknown --before ID is reported as a failure"""
+    cmd = HistoryCommand()
+    mock_shell.db.iter_command_history.side_effect = ValueError("No command with ID 99")
+
+    cmd.execute(mock_shell, '--before 99')
+
+    assert 'No command with ID 99' in capsys.readouterr().out
+    mock_shell.mark_failed.assert_called_once()
+
+
+@pytest.mark.parametrize('args', [
+    '--user', '--since yesterday', '--before abc', '--before 1 --after 2', '--color red', 'host --user x',
+])
+def test_history_filters_bad_option(mock_shell, args):
+    """Test invalid filters are rejected without querying"""
+    cmd = HistoryCommand()
+
+    cmd.execute(mock_shell, args)
+
+    mock_shell.db.iter_command_history.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+
+def test_history_export_to_file(mock_shell, tmp_path, capsys):
+    """Test export options reach the database and the file is written"""
+    cmd = HistoryCommand()
+    path = tmp_path / 'history.csv'
+    mock_shell.db.iter_history_export.return_value = iter([
+        ((1, '2024-05-01T10:00:00', 'bob', 'host1', 'ping', 0.5), None),
+    ])
+
+    cmd.execute(mock_shell, f'export --format CSV --since 2024-05-01 --output {path}')
+
+    mock_shell.db.iter_history_export.assert_called_once_with(
+        since=int(datetime(2024, 5, 1).timestamp()), until=None, with_output=False)
+    assert path.read_text().splitlines()[1] == '1,2024-05-01T10:00:00,bob,host1,ping,0.5'
+    assert f'Exported 1 commands to {path}.' in capsys.readouterr().out
+    mock_shell.mark_failed.assert_not_called()
+
+
+def test_history_export_to_stdout(mock_shell, capsys):
+    """Test export writes JSON Lines to stdout by default"""
+    cmd = HistoryCommand()
+    mock_shell.db.iter_history_export.return_value = iter([
+        ((1, '2024-05-01T10:00:00', 'bob', '[]', 'ping', 0.5), ('test.ping', 0, iter(['True']))),
+    ])
+
+    cmd.execute(mock_shell, 'export --with-output')
+
+    assert mock_shell.db.iter_history_export.call_args[1]['with_output'] is True
+    assert json.loads(capsys.readouterr().out)['output'] == 'True'
+
+
+@pytest.mark.parametrize('args', ['export --format xml', 'export --since', 'export --verbose'])
+def test_history_export_bad_option(mock_shell, args):
+    """Test invalid export options are rejected"""
+    cmd = HistoryCommand()
+
+    cmd.execute(mock_shell, args)
+
+    mock_shell.db.iter_history_export.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
 # vim: set ts=4 sw=4 et:
@@ -114,6 +114,52 @@ def test_display_with_pager_fallback_on_error(capsys):
             assert "test output" in captured.out
 
 
+def test_display_with_pager_streams_chunks(capsys):
+    """Test that chunked content is written to the pager piece by piece"""
+    cmd = OutputCommand()
+    chunks = ['first ', 'second ', 'third']
+
+    with patch.dict('os.environ', {'SALTCTL_PAGER': 'cat'}):
+        with patch('subprocess.Popen') as mock_popen:
+            mock_process = Mock()
+            mock_popen.return_value = mock_process
+
+            cmd._display_with_pager(iter(chunks))
+
+            writes = [call[0][0] for call in mock_process.stdin.write.call_args_list]
+            assert writes == [b'first ', b'second ', b'third']
+            mock_process.stdin.close.assert_called_once()
+            mock_process.wait.assert_called_once()
+
+
+def test_display_with_pager_quit_early():
+    """Test that quitting the pager early stops the stream without an error"""
+    cmd = OutputCommand()
+    closed = []
+
+    def chunks():
+        try:
+            while True:
+                yield 'x' * 65536
+        finally:
+            closed.append(True)
+
+    with patch.dict('os.environ', {'SALTCTL_PAGER': 'head -c 10 >/dev/null'}):
+        cmd._display_with_pager(chunks())
+
+    assert closed == [True]
+
+
+def test_display_chunks_without_pager(capsys):
+    """Test that chunked content is printed when paging is disabled"""
+    cmd = OutputCommand()
+
+    with patch.dict('os.environ', {'SALTCTL_PAGER': ''}):
+        cmd._display_with_pager(iter(['one ', 'two']))
+
+    assert capsys.readouterr().out == 'one two\n'
+
+
 def test_execute_invalid_command_id(mock_shell, capsys):
     """Test executing with invalid (non-numeric) command ID"""
     cmd = OutputCommand()
@@ -153,7 +199,7 @@ def test_execute_no_output_available(mock_shell, capsys):
     """Test executing when command has no stored output"""
     cmd = OutputCommand()
     mock_shell.db.get_most_recent_command.return_value = (1, 'push test', '2025-01-01 12:00:00')
-    mock_shell.db.get_salt_output.return_value = None
+    mock_shell.db.iter_salt_output.return_value = None
 
     result = cmd.execute(mock_shell, '')
 
@@ -166,10 +212,10 @@ def test_execute_displays_output_with_pager(mock_shell):
     """Test executing displays output through pager"""
     cmd = OutputCommand()
     mock_shell.db.get_most_recent_command.return_value = (1, 'push test', '2025-01-01 12:00:00')
-    mock_shell.db.get_salt_output.return_value = (
+    mock_shell.db.iter_salt_output.return_value = (
         'salt --list host1 state.test',
-        'Salt output here\nMultiple lines',
-        0
+        0,
+        iter(['Salt output here\n', 'Multiple lines'])
     )
 
     with patch.object(cmd, '_display_with_pager') as mock_display:
@@ -182,7 +228,7 @@ def test_execute_displays_output_with_pager(mock_shell):
             mock_display.assert_called_once()
 
             # Verify content includes all expected parts
-            content = mock_display.call_args[0][0]
+            content = ''.join(mock_display.call_args[0][0])
             assert 'Command ID: 1' in content
             assert 'Command: push test' in content
             assert 'Timestamp: 2025-01-01 12:00:00' in content
@@ -191,14 +237,129 @@ def test_execute_displays_output_with_pager(mock_shell):
             assert '=' * 80 in content
 
 
+def test_execute_single_host(mock_shell):
+    """Test showing one host's part of a command's output"""
+    cmd = OutputCommand()
+    mock_shell.db.get_command_by_id.return_value = (5, 'push apply', '2025-01-02 14:30:00')
+    mock_shell.db.get_minion_output.return_value = 'Summary for web01'
+
+    with patch.object(cmd, '_display_with_pager') as mock_display:
+        cmd.execute(mock_shell, '5 web01')
+
+    mock_shell.db.get_minion_output.assert_called_once_with(5, 'web01')
+    mock_shell.db.iter_salt_output.assert_not_called()
+    content = mock_display.call_args[0][0]
+    assert 'Host: web01' in content
+    assert 'Summary for web01' in content
+
+
+def test_execute_single_host_not_found(mock_shell, capsys):
+    """Test asking for a host with no stored result"""
+    cmd = OutputCommand()
+    mock_shell.db.get_command_by_id.return_value = (5, 'push apply', '2025-01-02 14:30:00')
+    mock_shell.db.get_minion_output.return_value = None
+
+    cmd.execute(mock_shell, '5 web09')
+
+    assert "No output stored for web09" in capsys.readouterr().out
+    mock_shell.mark_failed.assert_called_once()
+
+
+def test_search(mock_shell):
+    """Test searching stored output lists matches with hosts and snippets"""
+    cmd = OutputCommand()
+    mock_shell.db.unindexed_output_count.return_value = 0
+    mock_shell.db.search_outputs.return_value = [
+        (12, '2025-01-02T14:30:00.123', 'push apply', ['web01', 'web02']),
+    ]
+    mock_shell.db.iter_salt_output.return_value = (
+        'salt --list web01,web02 state.apply', 1,
+        iter(["web01:\n    Result: True\nweb02:\n    ERROR: Dis", "k full on /var\n"]),
+    )
+
+    with patch.object(cmd, '_display_with_pager') as mock_display:
+        cmd.execute(mock_shell, 'search disk full')
+
+    mock_shell.db.search_outputs.assert_called_once_with('disk full', limit=50)
+    mock_shell.db.iter_salt_output.assert_called_once_with(12)
+    content = mock_display.call_args[0][0]
+    assert '[ID: 12] [2025-01-02T14:30:00] push apply' in content
+    assert 'Hosts: web01, web02' in content
+    assert '4: ERROR: Disk full on /var' in content
+
+
+def test_search_long_line_snippet(mock_shell):
+    """Test long matching lines are trimmed around the match"""
+    cmd = OutputCommand()
+    mock_shell.db.unindexed_output_count.return_value = 0
+    mock_shell.db.search_outputs.return_value = [(1, '2025-01-02T14:30:00', 'ping', [])]
+    mock_shell.db.iter_salt_output.return_value = ('salt ping', 0, iter(['x' * 500 + ' needle ' + 'y' * 500]))
+
+    with patch.object(cmd, '_display_with_pager') as mock_display:
+        cmd.execute(mock_shell, 'search needle')
+
+    snippet = mock_display.call_args[0][0].splitlines()[-1]
+    assert 'needle' in snippet
+    assert len(snippet) < 120
+
+
+def test_search_reads_bounded_prefix(mock_shell):
+    """Test only the start of a matching output is read for its snippet, and the stream closed"""
+    cmd = OutputCommand()
+    mock_shell.db.unindexed_output_count.return_value = 0
+    mock_shell.db.search_outputs.return_value = [
+        (3, '2025-01-02T14:30:00', 'push apply', ['web%02d' % n for n in range(15)]),
+    ]
+    read = []
+
+    def chunks():
+        for n in range(1000):
+            read.append(n)
+            yield 'Result: True\n' * 10000
+        yield 'needle\n'
+
+    stream = chunks()
+    mock_shell.db.iter_salt_output.return_value = ('salt state.apply', 0, stream)
+
+    with patch.object(cmd, '_display_with_pager') as mock_display:
+        cmd.execute(mock_shell, 'search needle')
+
+    content = mock_display.call_args[0][0]
+    assert 'needle' not in content.splitlines()[-1]
+    assert 'web09 (+5 more)' in content
+    assert len(read) < 10
+    assert stream.gi_frame is None
+
+
+def test_search_requires_query(mock_shell):
+    """Test 'output search' without a query fails"""
+    cmd = OutputCommand()
+
+    cmd.execute(mock_shell, 'search')
+
+    mock_shell.db.search_outputs.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+def test_search_unavailable(mock_shell, capsys):
+    """Test search reports when SQLite lacks FTS5"""
+    cmd = OutputCommand()
+    mock_shell.db.search_outputs.side_effect = RuntimeError("Output search needs SQLite built with FTS5")
+
+    cmd.execute(mock_shell, 'search error')
+
+    assert "needs SQLite built with FTS5" in capsys.readouterr().out
+    mock_shell.mark_failed.assert_called_once()
+
+
 def test_execute_with_specific_command_id(mock_shell):
     """Test executing with specific command ID"""
     cmd = OutputCommand()
     mock_shell.db.get_command_by_id.return_value = (5, 'push apply', '2025-01-02 14:30:00')
-    mock_shell.db.get_salt_output.return_value = (
+    mock_shell.db.iter_salt_output.return_value = (
         'salt --list host2 state.apply',
-        'Applied successfully',
-        0
+        0,
+        iter(['Applied successfully'])
     )
 
     with patch.object(cmd, '_display_with_pager') as mock_display:
@@ -211,7 +372,7 @@ def test_execute_with_specific_command_id(mock_shell):
             mock_shell.db.get_command_by_id.assert_called_once_with(5)
 
             # Verify it used the right command ID
-            content = mock_display.call_args[0][0]
+            content = ''.join(mock_display.call_args[0][0])
             assert 'Command ID: 5' in content
             assert 'Command: push apply' in content
 
@@ -220,7 +381,7 @@ def test_execute_respects_terminal_width(mock_shell):
     """Test that separator respects terminal width"""
     cmd = OutputCommand()
     mock_shell.db.get_most_recent_command.return_value = (1, 'test', '2025-01-01 12:00:00')
-    mock_shell.db.get_salt_output.return_value = ('cmd', 'output', 0)
+    mock_shell.db.iter_salt_output.return_value = ('cmd', 0, iter(['output']))
 
     with patch.object(cmd, '_display_with_pager') as mock_display:
         with patch('shutil.get_terminal_size') as mock_terminal:
@@ -228,7 +389,7 @@ def test_execute_respects_terminal_width(mock_shell):
 
             cmd.execute(mock_shell, '')
 
-            content = mock_display.call_args[0][0]
+            content = ''.join(mock_display.call_args[0][0])
             # Should have separator of length 100
             assert '=' * 100 in content
 
@@ -101,6 +101,7 @@ def test_push_error_uses_pager(mock_shell, mock_subprocess):
 
             # Verify pager was called
             mock_display.assert_called_once()
+            mock_shell.mark_failed.assert_called_once()
 
             # Verify content includes error information
             content = mock_display.call_args[0][0]
@@ -153,10 +154,32 @@ def test_push_success_no_pager(mock_shell, mock_subprocess, capsys):
 
         # Verify pager was NOT called
         mock_display.assert_not_called()
+        mock_shell.mark_failed.assert_not_called()
 
         # Verify success message was printed
         captured = capsys.readouterr()
         assert "Command completed successfully" in captured.out
 
 
+def test_push_logs_minion_results(mock_shell, mock_subprocess):
+    """Test that push stores per-minion results parsed from the output"""
+    cmd = PushCommand()
+    mock_shell.selected_hosts = ['host1', 'host2']
+    mock_shell.last_command_id = 7
+    mock_subprocess.return_value = Mock(
+        returncode=0,
+        stdout="host1:\nSummary for host1\nSucceeded: 2 (changed=1)\nFailed:    0\n"
+               "host2:\nSummary for host2\nSucceeded: 2\nFailed:    0\n",
+        stderr=""
+    )
+
+    cmd.execute(mock_shell, 'apply')
+
+    command_id, action, output, returncode, results = mock_shell.db.log_salt_output.call_args[0]
+    assert (command_id, action, returncode) == (7, 'apply', 0)
+    assert [(r.minion, r.success, r.changed_count) for r in results] == [
+        ('host1', True, 1), ('host2', True, 0)
+    ]
+
+
 # vim: set ts=4 sw=4 et:
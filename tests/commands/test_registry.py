@@ -0,0 +1,85 @@
+"""Tests for the command registry"""
+
+import importlib
+import inspect
+import os
+import pytest
+from collections import namedtuple
+import commands
+from commands import COMMAND_MANIFEST, CommandRegistry, CommandSpec
+from commands.base import BaseCommand
+
+
+FakeEntryPoint = namedtuple('FakeEntryPoint', ['name', 'value'])
+
+
+def test_manifest_matches_command_classes():
+    """Test that every manifest entry names a real command with matching help"""
+    for name, spec in COMMAND_MANIFEST.items():
+        module = importlib.import_module(spec.module)
+        cmd = getattr(module, spec.class_name)()
+
+        assert cmd.name == name
+        assert cmd.help_text.split('\n')[0] == spec.summary
+        assert tuple(cmd.subcommands) == spec.subcommands
+        assert cmd.completes_minions == spec.completes_minions
+
+
+def test_manifest_covers_all_command_modules():
+    """Test that no command class is missing from the manifest"""
+    commands_dir = os.path.dirname(commands.__file__)
+    registered = {(spec.module, spec.class_name) for spec in COMMAND_MANIFEST.values()}
+
+    for filename in os.listdir(commands_dir):
+        if not filename.endswith('.py') or filename in ('__init__.py', 'base.py'):
+            continue
+        module = importlib.import_module(f'commands.{filename[:-3]}')
+        for class_name, obj in inspect.getmembers(module, inspect.isclass):
+            if issubclass(obj, BaseCommand) and obj is not BaseCommand and obj.__module__ == module.__name__:
+                assert (module.__name__, class_name) in registered
+
+
+def test_registry_loads_lazily():
+    """Test that commands are only instantiated on first lookup"""
+    registry = CommandRegistry(COMMAND_MANIFEST)
+
+    assert 'status' in registry
+    assert registry.summary('status') == "Show currently selected hosts"
+    assert registry._instances == {}
+
+    cmd = registry['status']
+    assert cmd.name == 'status'
+    assert registry['status'] is cmd
+    assert list(registry._instances) == ['status']
+
+
+def test_registry_unknown_module_returns_none(capsys):
+    """Test that a command whose module fails to import is reported, not raised"""
+    registry = CommandRegistry({'broken': CommandSpec('commands.does_not_exist', 'Nope', 'Broken')})
+
+    assert registry.get('broken') is None
+    captured = capsys.readouterr()
+    assert "Failed to load command module" in captured.out
+
+
+def test_registry_entry_points(monkeypatch):
+    """Test that plugin commands are registered from entry points"""
+    monkeypatch.setattr(commands, '_iter_entry_points', lambda group: iter([
+        FakeEntryPoint('stat2', 'commands.status:StatusCommand'),
+        FakeEntryPoint('help', 'someplugin:HelpOverride'),
+    ]))
+
+    registry = CommandRegistry(COMMAND_MANIFEST, 'saltctl.commands')
+
+    # Exact built-in lookups don't read entry points
+    assert 'status' in registry
+    assert 'stat2' not in registry._specs
+
+    assert 'stat2' in registry
+    # Summary is taken from the loaded command when the plugin has no manifest entry
+    assert registry.summary('stat2') == "Show currently selected hosts"
+    # Built-in names can't be overridden
+    assert registry._specs['help'] == COMMAND_MANIFEST['help']
+
+
+# vim: set ts=4 sw=4 et:
@@ -25,6 +25,7 @@ def test_select_single_host(mock_shell):
 
     assert mock_shell.selected_hosts == ['host1']
     mock_shell.update_prompt.assert_called_once()
+    mock_shell.wait_for_minions.assert_called_once()
 
 
 def test_select_partial_match(mock_shell):
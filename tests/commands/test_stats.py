@@ -0,0 +1,67 @@
+"""Tests for stats command"""
+
+import time
+import pytest
+from commands.stats import StatsCommand
+from stats import CommandStats
+
+
+def test_stats_command_name():
+    """Test stats command name"""
+    cmd = StatsCommand()
+    assert cmd.name == "stats"
+    assert cmd.log_in_history == False
+
+
+def test_stats_default(mock_shell, capsys):
+    """Test stats per verb over the default window"""
+    cmd = StatsCommand()
+    mock_shell.db.command_stats.return_value = [
+        CommandStats('push', 12, 4.0, 30.0, 42.5, 0.25),
+        CommandStats('ping', 3, 0.5, 0.8, 0.8, None),
+    ]
+
+    cmd.execute(mock_shell, '')
+
+    group_by = mock_shell.db.command_stats.call_args[0][0]
+    since = mock_shell.db.command_stats.call_args[1]['since']
+    assert group_by == 'verb'
+    assert abs(since - (time.time() - 30 * 86400)) < 5
+    out = capsys.readouterr().out
+    assert 'Commands in the last 30 days by verb:' in out
+    assert 'push' in out and '42.50s' in out and '25.0%' in out
+
+
+def test_stats_hosts_window(mock_shell, capsys):
+    """Test grouping by host set with a window in days"""
+    cmd = StatsCommand()
+    mock_shell.db.command_stats.return_value = [CommandStats('["web01", "web02"]', 1, 1.0, 1.0, 1.0, 0.0)]
+
+    cmd.execute(mock_shell, 'hosts 7')
+
+    assert mock_shell.db.command_stats.call_args[0][0] == 'hosts'
+    assert 'web01, web02' in capsys.readouterr().out
+
+
+def test_stats_empty(mock_shell, capsys):
+    """Test an empty window is reported"""
+    cmd = StatsCommand()
+    mock_shell.db.command_stats.return_value = []
+
+    cmd.execute(mock_shell, 'user')
+
+    assert 'No commands in the last 30 days' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('args', ['week', 'verb 0', 'user 7 8'])
+def test_stats_bad_arguments(mock_shell, args):
+    """Test invalid arguments are rejected"""
+    cmd = StatsCommand()
+
+    cmd.execute(mock_shell, args)
+
+    mock_shell.db.command_stats.assert_not_called()
+    mock_shell.mark_failed.assert_called_once()
+
+
+# vim: set ts=4 sw=4 et:
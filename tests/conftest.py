@@ -18,8 +18,11 @@ def temp_db():
     db = SaltCtlDatabase(db_path)
     yield db
 
-    # Cleanup
-    os.unlink(db_path)
+    # Cleanup (WAL mode leaves -wal and -shm files beside the database)
+    db.close()
+    for path in (db_path, db_path + '-wal', db_path + '-shm', db_path + '.lock'):
+        if os.path.exists(path):
+            os.unlink(path)
 
 
 @pytest.fixture
@@ -60,6 +63,38 @@ def mock_shell():
     return shell
 
 
+@pytest.fixture
+def fake_salt(tmp_path, monkeypatch):
+    """
+    Put fake salt-key and salt executables on PATH and point HOME at a
+    temporary directory, so a real SaltCtlShell can run end to end.
+    The fake salt prints its arguments and fails if they contain 'fail'.
+    """
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    home = tmp_path / 'home'
+    home.mkdir()
+
+    salt_key = bin_dir / 'salt-key'
+    salt_key.write_text(
+        "#!/bin/sh\n"
+        "echo '{\"minions\": [\"web01\", \"web02\", \"db01\"]}'\n"
+    )
+    salt = bin_dir / 'salt'
+    salt.write_text(
+        "#!/bin/sh\n"
+        "echo \"salt $*\"\n"
+        "case \"$*\" in *fail*) exit 1;; esac\n"
+    )
+    salt_key.chmod(0o755)
+    salt.chmod(0o755)
+
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.setenv('SALTCTL_PAGER', '')
+    return tmp_path
+
+
 @pytest.fixture
 def mock_subprocess(monkeypatch):
     """Mock subprocess.run to avoid actual command execution"""
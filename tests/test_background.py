@@ -0,0 +1,83 @@
+"""Tests for background job module"""
+
+import threading
+import pytest
+from background import JobManager, in_background
+
+
+@pytest.fixture
+def manager():
+    """Job manager that is shut down after the test"""
+    manager = JobManager(workers=2)
+    yield manager
+    manager.shutdown()
+
+
+def test_job_output_is_captured(manager):
+    """Test a job's prints go to its own buffer"""
+    def run(job):
+        print("hello from the job")
+        assert in_background()
+        return False
+
+    job = manager.submit('push test', run)
+    assert job.wait(5)
+
+    assert job.state == "Done"
+    assert "hello from the job" in job.output.getvalue()
+    assert not in_background()
+
+
+def test_job_failure_reported(manager):
+    """Test jobs that report failure or raise are marked failed"""
+    failed = manager.submit('push test', lambda job: True)
+    raised = manager.submit('push apply', lambda job: 1 / 0)
+    failed.wait(5)
+    raised.wait(5)
+
+    assert failed.state == "Failed"
+    assert raised.state == "Failed"
+    assert "division by zero" in raised.output.getvalue()
+
+
+def test_jobs_run_concurrently(manager):
+    """Test two jobs can be running at the same time"""
+    both_started = threading.Barrier(2, timeout=5)
+
+    def run(job):
+        both_started.wait()
+        return False
+
+    first = manager.submit('push test', run)
+    second = manager.submit('push apply', run)
+
+    assert first.wait(5) and second.wait(5)
+    assert not first.failed and not second.failed
+
+
+def test_take_finished_announces_once(manager):
+    """Test finished jobs are only announced once, and only to their owner"""
+    owner = object()
+    job = manager.submit('ping', lambda job: False, owner=owner)
+    other = manager.submit('ping', lambda job: False, owner=object())
+    job.wait(5)
+    other.wait(5)
+
+    assert manager.take_finished(owner) == [job]
+    assert manager.take_finished(owner) == []
+
+
+def test_job_ids_and_lookup(manager):
+    """Test jobs get increasing IDs and can be looked up and forgotten"""
+    first = manager.submit('ping', lambda job: False)
+    second = manager.submit('ping', lambda job: False)
+    manager.wait_all()
+
+    assert (first.id, second.id) == (1, 2)
+    assert manager.get(2) is second
+    manager.forget(second)
+    assert manager.get(2) is None
+    assert manager.running() == []
+
+
+# vim: set ts=4 sw=4 et:
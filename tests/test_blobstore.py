@@ -0,0 +1,84 @@
+"""Tests for blobstore module"""
+
+import os
+import pytest
+from blobstore import BlobStore, blob_store_path
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / 'history.blobs'))
+
+
+def test_blob_store_path():
+    """Test the store sits beside the database, named like its archives"""
+    assert blob_store_path('/home/ops/.saltctl.db') == '/home/ops/.saltctl.blobs'
+    assert blob_store_path('/srv/saltctl') == '/srv/saltctl.blobs'
+
+
+def test_put_and_read(store):
+    """Test values are stored under their SHA-256 and read back"""
+    blob_hash = store.put(b'web01: ok')
+
+    assert blob_hash == BlobStore.hash(b'web01: ok')
+    assert blob_hash in store
+    assert store.read(blob_hash) == b'web01: ok'
+    assert os.path.exists(os.path.join(store.root, blob_hash[:2], blob_hash[2:]))
+
+
+def test_identical_values_stored_once(store):
+    """Test storing the same value again reuses the existing file"""
+    first = store.put(b'no changes')
+    mtime = os.stat(store.path(first)).st_mtime_ns
+
+    assert store.put(b'no changes') == first
+    assert os.stat(store.path(first)).st_mtime_ns == mtime
+    assert store.usage() == (1, len(b'no changes'))
+
+
+def test_iter_chunks(store):
+    """Test a value is read back through the memory map in pieces"""
+    data = os.urandom(10000)
+    blob_hash = store.put(data)
+
+    chunks = list(store.iter_chunks(blob_hash, 4096))
+
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+    assert b''.join(chunks) == data
+    assert list(store.iter_chunks(store.put(b''), 4096)) == []
+
+
+def test_missing_values(store):
+    """Test reading a value that isn't stored gives nothing rather than an error"""
+    missing = BlobStore.hash(b'gone')
+
+    assert missing not in store
+    assert store.read(missing) is None
+    assert store.read(None) is None
+    assert list(store.iter_chunks(missing, 4096)) == []
+    assert store.remove(missing) is False
+    assert list(store.hashes()) == []
+
+
+def test_hashes_skip_unfinished_writes(store):
+    """Test hashes() lists stored values but not temporary files"""
+    blob_hash = store.put(b'complete')
+    with open(os.path.join(store.root, blob_hash[:2], '.partial'), 'wb') as f:
+        f.write(b'half')
+
+    assert list(store.hashes()) == [blob_hash]
+    assert store.remove(blob_hash) is True
+    assert list(store.hashes()) == []
+
+
+def test_copy_from(store, tmp_path):
+    """Test values are copied from another store only when missing"""
+    other = BlobStore(str(tmp_path / 'other.blobs'))
+    blob_hash = other.put(b'from another workstation')
+
+    assert store.copy_from(other, blob_hash) is True
+    assert store.read(blob_hash) == b'from another workstation'
+    assert store.copy_from(other, BlobStore.hash(b'never stored')) is False
+
+
+# vim: set ts=4 sw=4 et:
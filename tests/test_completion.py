@@ -0,0 +1,109 @@
+"""Tests for completion module"""
+
+import pytest
+from commands import COMMAND_MANIFEST, CommandRegistry
+from completion import Completer, PrefixIndex
+
+
+@pytest.fixture
+def completer():
+    """Completer over the built-in commands with a few minions"""
+    completer = Completer(CommandRegistry(COMMAND_MANIFEST))
+    completer.minion_index.update(['web01', 'web02', 'db-01.nyc', 'db-02.nyc'])
+    return completer
+
+
+def test_prefix_index_matches():
+    """Test prefix lookups return sorted matches"""
+    index = PrefixIndex(['web2', 'db1', 'web1', 'web10'])
+
+    assert index.matches('web') == ['web1', 'web10', 'web2']
+    assert index.matches('web1') == ['web1', 'web10']
+    assert index.matches('x') == []
+    assert index.matches('') == ['db1', 'web1', 'web10', 'web2']
+
+
+def test_prefix_index_incremental_update():
+    """Test small changes are applied in place and stay sorted"""
+    names = [f'host{i:05d}' for i in range(1000)]
+    index = PrefixIndex(names)
+
+    index.update(names[1:] + ['host99999', 'aaa'])
+
+    assert 'host00000' not in index
+    assert 'host99999' in index
+    assert index.matches('a') == ['aaa']
+    assert len(index) == 1001
+
+
+def test_prefix_index_large_update_rebuilds():
+    """Test a wholesale change of names replaces the index"""
+    index = PrefixIndex(['a', 'b'])
+
+    index.update(['x', 'y', 'z'])
+
+    assert index.matches('') == ['x', 'y', 'z']
+
+
+def test_complete_command_names(completer):
+    """Test the first word completes to command names"""
+    assert completer.candidates('p', 0, 'p') == ['package ', 'ping ', 'push ']
+    assert completer.candidates('', 0, '') == [name + ' ' for name in sorted(COMMAND_MANIFEST)]
+
+
+def test_complete_subcommands(completer):
+    """Test subcommands complete after the command name"""
+    assert completer.candidates('push t', 5, 't') == ['test ']
+    assert completer.candidates('package re', 8, 're') == ['reinstall ', 'remove ']
+    assert completer.candidates('history ', 8, '') == ['export ', 'full ', 'host ', 'month ', 'trim ']
+
+
+def test_complete_subcommands_with_command_prefix(completer):
+    """Test subcommands complete after a unique command prefix"""
+    assert completer.candidates('pu a', 3, 'a') == ['apply ']
+
+
+def test_no_completion_after_subcommand(completer):
+    """Test nothing is offered once the subcommand has been given"""
+    assert completer.candidates('push test ', 10, '') == []
+
+
+def test_complete_minion_names(completer):
+    """Test minion names complete for every argument of select"""
+    assert completer.candidates('select w', 7, 'w') == ['web01', 'web02']
+    assert completer.candidates('select web01 db-0', 13, 'db-0') == ['db-01.nyc', 'db-02.nyc']
+
+
+def test_resolve_command(completer):
+    """Test exact names and unique prefixes resolve to commands"""
+    assert completer.resolve_command('push') == 'push'
+    assert completer.resolve_command('pu') == 'push'
+    assert completer.resolve_command('p') is None
+    assert completer.resolve_command('nope') is None
+
+
+def test_complete_state_protocol(completer):
+    """Test readline-style state iteration"""
+    results = []
+    state = 0
+    while True:
+        match = completer.complete('push ', 5, '', state)
+        if match is None:
+            break
+        results.append(match)
+        state += 1
+
+    assert results == ['test ', 'apply ']
+
+
+def test_minion_completion_scales():
+    """Test lookups stay fast with a large minion list"""
+    completer = Completer(CommandRegistry(COMMAND_MANIFEST))
+    completer.minion_index.update(f'minion{i:06d}.example.com' for i in range(60000))
+
+    assert completer.candidates('select minion04999', 7, 'minion04999') == [
+        f'minion{i:06d}.example.com' for i in range(49990, 50000)
+    ]
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,84 @@
+"""Stress test for many shells sharing one history database"""
+
+import os
+import sys
+import json
+import pytest
+import subprocess
+from database import SaltCtlDatabase
+
+# One shell's work: log commands with output, recording the slowest call
+_SHELL_SCRIPT = """
+import sys, json, time
+from database import SaltCtlDatabase
+db_path, shell, commands, write_behind = sys.argv[1], sys.argv[2], int(sys.argv[3]), sys.argv[4] == '1'
+db = SaltCtlDatabase(db_path, write_behind=write_behind)
+slowest = 0.0
+for i in range(commands):
+    start = time.monotonic()
+    command_id = db.log_command(shell, ['web01', 'web02'], f'push apply {shell}-{i}', 0.0)
+    db.log_salt_output(command_id, 'apply', f'web01:\\\\n    {shell}-{i} ok\\\\n' * 50, 0,
+                       [('web01', True, 1, 0, 0.5, f'{shell}-{i} ok')])
+    db.update_command_duration(command_id, 0.5)
+    slowest = max(slowest, time.monotonic() - start)
+db.close()
+print(json.dumps({'slowest': slowest}))
+"""
+
+SHELLS = 12
+COMMANDS_PER_SHELL = 40
+
+
+@pytest.mark.integration
+def test_concurrent_shells(tmp_path):
+    """
+    Test a dozen processes logging at once lose no rows and don't stall
+
+    Half the shells use write-behind logging and half write directly,
+    as a team with mixed configurations would.
+    """
+    db_path = str(tmp_path / 'shared.db')
+    SaltCtlDatabase(db_path).close()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-c', _SHELL_SCRIPT, db_path, f'user{n}',
+             str(COMMANDS_PER_SHELL), str(n % 2)],
+            cwd=root, env=dict(os.environ, PYTHONPATH=root),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        for n in range(SHELLS)
+    ]
+    results = []
+    for process in processes:
+        stdout, stderr = process.communicate(timeout=120)
+        assert process.returncode == 0, stderr
+        assert 'Warning' not in stderr
+        results.append(json.loads(stdout))
+
+    db = SaltCtlDatabase(db_path)
+    try:
+        with db._get_connection() as conn:
+            assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+            counts = dict(conn.execute('''
+                SELECT username, COUNT(*) FROM command_history GROUP BY username
+            ''').fetchall())
+            outputs = conn.execute('''
+                SELECT COUNT(*) FROM salt_outputs o
+                JOIN command_history c ON c.id = o.command_id
+                WHERE c.duration = 0.5
+            ''').fetchone()[0]
+            results_count = conn.execute('SELECT COUNT(*) FROM minion_results').fetchone()[0]
+        if db.search_available:
+            assert len(db.search_outputs('"user3-7"')) == 1
+    finally:
+        db.close()
+
+    assert counts == {f'user{n}': COMMANDS_PER_SHELL for n in range(SHELLS)}
+    assert outputs == results_count == SHELLS * COMMANDS_PER_SHELL
+    # No shell waited anywhere near busy_timeout for a single command
+    assert max(result['slowest'] for result in results) < 2.0
+
+
+# vim: set ts=4 sw=4 et:
@@ -1,5 +1,6 @@
 """Tests for config module"""
 
+import os
 import pytest
 from config import SaltCtlConfig
 
@@ -10,6 +11,12 @@ def test_config_defaults():
 
     assert config.use_sudo == False  # Default in DEFAULTS
     assert config.history_trim_days == 90
+    assert config.minion_cache_ttl == 300
+    assert config.minion_refresh_timeout == 30
+    assert config.db_journal_mode == 'wal'
+    assert config.db_output_codec == 'zlib'
+    assert config.db_blob_threshold == 1024 * 1024
+    assert config.db_write_behind == True
 
 
 def test_config_file_loading(temp_config_file, monkeypatch):
@@ -48,6 +55,74 @@ def test_config_boolean_parsing():
     assert config.use_sudo == False
 
 
+def test_config_database_choices():
+    """Test that unknown database options fall back to the defaults"""
+    config = SaltCtlConfig()
+
+    config.config.set('database', 'output_codec', 'LZMA')
+    assert config.db_output_codec == 'lzma'
+
+    config.config.set('database', 'output_codec', 'bzip9')
+    assert config.db_output_codec == 'zlib'
+
+    config.config.set('database', 'journal_mode', 'delete')
+    assert config.db_journal_mode == 'delete'
+
+    config.config.set('database', 'journal_mode', 'bogus')
+    assert config.db_journal_mode == 'wal'
+
+
+def test_config_database_path():
+    """Test the database path defaults to the home directory and expands ~"""
+    config = SaltCtlConfig()
+    assert config.db_path == os.path.expanduser('~/.saltctl.db')
+    assert config.db_busy_timeout == 5.0
+
+    config.config.set('database', 'path', '/srv/saltctl/history.db')
+    assert config.db_path == '/srv/saltctl/history.db'
+
+    config.config.set('database', 'busy_timeout', '0.5')
+    assert config.db_busy_timeout == 0.5
+
+    config.config.set('database', 'busy_timeout', 'forever')
+    assert config.db_busy_timeout == 5.0
+
+
+def test_config_retention():
+    """Test retention limits default to off and parse sizes with unit suffixes"""
+    config = SaltCtlConfig()
+    assert config.retention_max_db_size == 0
+    assert config.retention_keep_outputs_per_hosts == 0
+    assert config.retention_keep_outputs_per_command == 0
+    assert config.retention_output_days == 0
+
+    config.config.set('retention', 'max_db_size', '500M')
+    assert config.retention_max_db_size == 500 * 1024 * 1024
+
+    config.config.set('retention', 'max_db_size', '1.5GB')
+    assert config.retention_max_db_size == int(1.5 * 1024 ** 3)
+
+    config.config.set('retention', 'max_db_size', 'lots')
+    assert config.retention_max_db_size == 0
+
+    config.config.set('retention', 'keep_outputs_per_command', '-5')
+    assert config.retention_keep_outputs_per_command == 0
+
+
+def test_config_blob_threshold():
+    """Test the blob threshold takes a size and 0 keeps outputs in the database"""
+    config = SaltCtlConfig()
+
+    config.config.set('database', 'blob_threshold', '4M')
+    assert config.db_blob_threshold == 4 * 1024 * 1024
+
+    config.config.set('database', 'blob_threshold', '0')
+    assert config.db_blob_threshold == 0
+
+    config.config.set('database', 'blob_threshold', 'big')
+    assert config.db_blob_threshold == 1024 * 1024
+
+
 def test_config_int_parsing():
     """Test that integer values are parsed correctly"""
     config = SaltCtlConfig()
@@ -0,0 +1,107 @@
+"""Tests for the saltctld daemon and thin client"""
+
+import os
+import pwd
+import shutil
+import tempfile
+import pytest
+from daemon import DaemonClient, SaltCtlDaemon, run_client
+
+
+@pytest.fixture
+def saltctld(fake_salt):
+    """A running daemon on a temporary socket, backed by the fake salt binaries"""
+    # Unix socket paths are limited to ~100 characters, so avoid pytest's long tmp paths
+    socket_dir = tempfile.mkdtemp(prefix='saltctld')
+    daemon = SaltCtlDaemon(os.path.join(socket_dir, 'saltctld.sock'))
+    daemon.start()
+    yield daemon
+    daemon.stop()
+    shutil.rmtree(socket_dir)
+
+
+def test_client_runs_commands(saltctld, capsys):
+    """Test commands run in the daemon and their output reaches the client"""
+    client = DaemonClient(saltctld.socket_path)
+    assert client.prompt == "saltctl> "
+
+    result = client.run_command('select web')
+    assert result['failed'] == False
+    assert client.prompt == "saltctl [2 host(s)]> "
+
+    result = client.run_command('ping')
+    assert result['failed'] == False
+    client.close()
+
+    out = capsys.readouterr().out
+    assert "Selected 2 host(s)" in out
+    assert "salt --list web01,web02 test.ping" in out
+
+
+def test_sessions_have_separate_selections(saltctld):
+    """Test each client keeps its own host selection"""
+    first = DaemonClient(saltctld.socket_path)
+    second = DaemonClient(saltctld.socket_path)
+
+    first.run_command('select web')
+    second.run_command('select db')
+
+    assert first.prompt == "saltctl [2 host(s)]> "
+    assert second.prompt == "saltctl [1 host(s)]> "
+    first.close()
+    second.close()
+
+
+def test_sessions_share_jobs(saltctld, capsys):
+    """Test a job started by one client is visible to another"""
+    first = DaemonClient(saltctld.socket_path)
+    second = DaemonClient(saltctld.socket_path)
+
+    first.run_command('select web')
+    first.run_command('push test &')
+    first.run_command('wait')
+    capsys.readouterr()
+
+    second.run_command('jobs')
+    out = capsys.readouterr().out
+    assert "push test" in out
+    first.close()
+    second.close()
+
+
+def test_history_records_peer_user(saltctld):
+    """Test history records the user connected to the socket"""
+    client = DaemonClient(saltctld.socket_path)
+    client.run_command('select web')
+    client.run_command('ping')
+    client.close()
+
+    rows = saltctld.shell.db.get_command_history(limit=1)
+    assert rows[0][2] == pwd.getpwuid(os.getuid()).pw_name
+    assert rows[0][4] == 'ping'
+
+
+def test_completion_over_socket(saltctld):
+    """Test tab completion is answered by the daemon"""
+    # The minion list loads in the background when the daemon starts
+    saltctld.shell.wait_for_minions()
+    client = DaemonClient(saltctld.socket_path)
+
+    assert client.complete('push a', 5, 'a') == ['apply ']
+    assert client.complete('select we', 7, 'we') == ['web01', 'web02']
+    client.close()
+
+
+def test_run_client_script_status(saltctld):
+    """Test script mode through the daemon reports failures"""
+    assert run_client(saltctld.socket_path, ['select web', 'ping']) == 0
+    assert run_client(saltctld.socket_path, ['select web', 'push bogus']) == 1
+
+
+def test_run_client_no_daemon(tmp_path, capsys):
+    """Test a clear error when no daemon is listening"""
+    assert run_client(str(tmp_path / 'missing.sock'), ['status']) == 2
+    assert "Cannot connect to saltctld" in capsys.readouterr().out
+
+
+# vim: set ts=4 sw=4 et:
@@ -1,8 +1,16 @@
 """Tests for database module"""
 
+import os
+import sys
 import pytest
+import sqlite3
+import tempfile
+import subprocess
+import threading
+import tracemalloc
 from datetime import datetime, timedelta
-from database import SaltCtlDatabase
+from database import SaltCtlDatabase, SCHEMA_VERSION, encode_output, decode_output, _create_archive_schema
+from results import MinionResult
 
 
 def test_database_initialization(temp_db):
@@ -20,6 +28,312 @@ def test_database_initialization(temp_db):
         assert cursor.fetchone() is not None
 
 
+def test_connection_reused_within_thread(temp_db):
+    """Test that one thread keeps using the same connection"""
+    with temp_db._get_connection() as first:
+        pass
+    with temp_db._get_connection() as second:
+        pass
+
+    assert first is second
+
+
+def test_connection_per_thread(temp_db):
+    """Test that each thread gets its own connection"""
+    with temp_db._get_connection() as main_conn:
+        pass
+    other = []
+
+    def worker():
+        with temp_db._get_connection() as conn:
+            other.append(conn)
+            conn.execute("SELECT 1")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert other[0] is not main_conn
+
+
+def test_wal_mode_enabled(temp_db):
+    """Test that the database uses write-ahead logging"""
+    with temp_db._get_connection() as conn:
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+    assert mode == 'wal'
+
+
+def test_rollback_on_error(temp_db):
+    """Test that a failed operation doesn't leave a half-written transaction"""
+    with pytest.raises(RuntimeError):
+        with temp_db._get_connection() as conn:
+            conn.execute('''
+                INSERT INTO command_history (timestamp, username, selected_hosts, command, duration)
+                VALUES ('2024-01-01T00:00:00', 'user1', '[]', 'lost', 1.0)
+            ''')
+            raise RuntimeError("boom")
+
+    assert temp_db.get_most_recent_command() is None
+
+
+def test_close_and_reopen(temp_db):
+    """Test that the database reconnects after close()"""
+    temp_db.log_command('user1', ['host1'], 'command1', 1.0)
+    temp_db.close()
+
+    assert temp_db.get_most_recent_command()[1] == 'command1'
+
+
+def test_schema_version(temp_db):
+    """Test that a new database is created at the current schema version"""
+    assert temp_db.schema_version == SCHEMA_VERSION
+
+
+def test_indexes_used(temp_db):
+    """Test that history and output lookups don't scan whole tables"""
+    with temp_db._get_connection() as conn:
+        history_plan = conn.execute('''
+            EXPLAIN QUERY PLAN
+            SELECT id FROM command_history WHERE epoch < 0
+        ''').fetchall()
+        output_plan = conn.execute('''
+            EXPLAIN QUERY PLAN
+            SELECT output FROM salt_outputs WHERE command_id = 1
+        ''').fetchall()
+
+    assert 'idx_command_history_epoch' in str(history_plan)
+    assert 'idx_salt_outputs_command_id' in str(output_plan)
+
+
+def test_migrate_legacy_database():
+    """Test that a database from before schema versioning is upgraded in place"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as f:
+        db_path = f.name
+
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE command_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            username TEXT NOT NULL,
+            selected_hosts TEXT,
+            command TEXT NOT NULL,
+            duration REAL
+        );
+        CREATE TABLE salt_outputs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            command_id INTEGER NOT NULL,
+            salt_command TEXT NOT NULL,
+            output TEXT,
+            return_code INTEGER
+        );
+        INSERT INTO command_history (timestamp, username, selected_hosts, command, duration)
+        VALUES ('2024-01-01T12:00:00.123456', 'user1', '[]', 'older', 1.0),
+               ('2024-01-02T12:00:00', 'user1', '["web03", "web04"]', 'newer', 1.0);
+        INSERT INTO salt_outputs (command_id, salt_command, output, return_code)
+        VALUES (1, 'test', 'output', 0);
+    ''')
+    conn.close()
+
+    db = SaltCtlDatabase(db_path)
+    try:
+        assert db.schema_version == SCHEMA_VERSION
+
+        older = datetime(2024, 1, 1, 12, 0, 0)
+        with db._get_connection() as conn:
+            epoch = conn.execute("SELECT epoch FROM command_history WHERE id = 1").fetchone()[0]
+        assert epoch == int(older.timestamp())
+
+        rows = db.get_command_history(selected_hosts=None, limit=50)
+        assert [row[4] for row in rows] == ['newer', 'older']
+        assert db.get_salt_output(1) == ('test', 'output', 0)
+        # Selected hosts are backfilled into the host index
+        assert [row[4] for row in db.get_command_history(selected_hosts=['web03'])] == ['newer']
+        with db._get_connection() as conn:
+            verbs = [row[0] for row in conn.execute("SELECT verb FROM command_history ORDER BY id")]
+        assert verbs == ['older', 'newer']
+        # Existing history is counted in the command statistics
+        assert sorted(row.key for row in db.command_stats()) == ['newer', 'older']
+
+        # Reopening an up-to-date database leaves it alone
+        db.close()
+        assert SaltCtlDatabase(db_path).schema_version == SCHEMA_VERSION
+    finally:
+        db.close()
+        for path in (db_path, db_path + '-wal', db_path + '-shm', db_path + '.lock'):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def test_verb_filled_for_raw_inserts(temp_db):
+    """Test that rows inserted without a verb (by an older saltctl) get one from their command"""
+    logged_id = temp_db.log_command('user1', [], 'Push apply', 1.0)
+    with temp_db._get_connection() as conn:
+        raw_id = conn.execute('''
+            INSERT INTO command_history (timestamp, username, selected_hosts, command, duration)
+            VALUES (?, 'user1', '[]', 'push apply', 1.0)
+        ''', (datetime.now().isoformat(),)).lastrowid
+        verbs = dict(conn.execute("SELECT id, verb FROM command_history").fetchall())
+
+    assert verbs == {logged_id: 'push', raw_id: 'push'}
+
+
+def test_epoch_filled_for_raw_inserts(temp_db):
+    """Test that rows inserted without an epoch get one from their timestamp"""
+    with temp_db._get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO command_history (timestamp, username, selected_hosts, command, duration)
+            VALUES ('2024-06-01T08:30:00', 'user1', '[]', 'raw', 1.0)
+        ''')
+        epoch = conn.execute("SELECT epoch FROM command_history WHERE id = ?",
+                             (cursor.lastrowid,)).fetchone()[0]
+
+    assert epoch == int(datetime(2024, 6, 1, 8, 30, 0).timestamp())
+
+
+@pytest.fixture
+def write_behind_db(temp_db):
+    """A second handle on temp_db's file with write-behind logging"""
+    db = SaltCtlDatabase(temp_db.db_path, write_behind=True)
+    yield db
+    db.close()
+
+
+def test_write_behind_round_trip(write_behind_db):
+    """Test queued writes are visible to reads through the same handle"""
+    db = write_behind_db
+    command_id = db.log_command('user1', ['web01'], 'push apply', 0.0)
+    db.log_salt_output(command_id, 'apply', 'web01:\n    ok', 0)
+    db.update_command_duration(command_id, 2.5)
+
+    assert db.get_most_recent_command()[0] == command_id
+    assert db.get_command_history()[0][5] == 2.5
+    assert db.get_salt_output(command_id) == ('apply', 'web01:\n    ok', 0)
+    assert [row[4] for row in db.get_command_history(selected_hosts=['web01'])] == ['push apply']
+
+
+def test_write_behind_group_commit(write_behind_db):
+    """Test a quick command's insert, output and duration are written as one insert"""
+    db = write_behind_db
+    db._writer.commit_delay = 10
+    batches = []
+    apply = db._writer._apply_batch
+    db._writer._apply_batch = lambda ops: (batches.append(ops), apply(ops))
+
+    command_id = db.log_command('user1', ['web01'], 'ping', 0.0)
+    db.log_salt_output(command_id, 'test.ping', 'web01:\n    True', 0)
+    db.update_command_duration(command_id, 0.25)
+    db.flush()
+
+    assert [[op[0] for op in batch] for batch in batches] == [['command', 'output', 'duration']]
+    assert db.get_command_history()[0][5] == 0.25
+
+
+def test_write_behind_ids_unique_across_handles(temp_db, write_behind_db):
+    """Test reserved ID blocks never collide with other writers"""
+    ids = [write_behind_db.log_command('user1', [], 'first', 0.0)]
+    ids.append(temp_db.log_command('user2', [], 'other shell', 0.0))
+    ids.append(write_behind_db.log_command('user1', [], 'second', 0.0))
+    other = SaltCtlDatabase(temp_db.db_path, write_behind=True)
+    ids.append(other.log_command('user3', [], 'third shell', 0.0))
+    other.close()
+    write_behind_db.flush()
+
+    assert len(set(ids)) == 4
+    assert len(temp_db.get_command_history()) == 4
+
+
+_CRASH_SCRIPT = """
+import os, sys
+from database import SaltCtlDatabase
+db = SaltCtlDatabase(sys.argv[1], write_behind=True)
+db._writer.commit_delay = 10
+for i in range(5):
+    command_id = db.log_command('user1', ['web01'], f'durable {i}', 0.0)
+    db.log_salt_output(command_id, 'apply', 'output', 0)
+db.flush()
+for i in range(5):
+    command_id = db.log_command('user1', ['web01'], f'queued {i}', 0.0)
+    db.log_salt_output(command_id, 'apply', 'output', 0)
+if sys.argv[2] == 'exit':
+    sys.exit(0)
+os._exit(1)
+"""
+
+
+def _run_crash_script(db_path: str, mode: str):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', _CRASH_SCRIPT, db_path, mode],
+                   cwd=root, env=dict(os.environ, PYTHONPATH=root), timeout=60)
+
+
+def test_write_behind_flushed_on_exit(temp_db):
+    """Test everything queued is written when the process exits normally"""
+    _run_crash_script(temp_db.db_path, 'exit')
+
+    assert len(temp_db.get_command_history()) == 10
+
+
+def test_write_behind_crash_safety(temp_db):
+    """
+    Test a killed process keeps everything flushed before it died
+
+    Unflushed entries are lost, but the database stays consistent:
+    no output without its command, and later IDs don't collide.
+    """
+    _run_crash_script(temp_db.db_path, 'crash')
+
+    rows = temp_db.get_command_history()
+    assert sorted(row[4] for row in rows) == [f'durable {i}' for i in range(5)]
+    with temp_db._get_connection() as conn:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        orphans = conn.execute('''
+            SELECT COUNT(*) FROM salt_outputs
+            WHERE command_id NOT IN (SELECT id FROM command_history)
+        ''').fetchone()[0]
+    assert orphans == 0
+
+    next_id = temp_db.log_command('user1', [], 'after crash', 0.0)
+    assert next_id > max(row[0] for row in rows)
+
+
+def _hold_write_lock(db_path: str) -> sqlite3.Connection:
+    """Another connection holding the database's write lock until it commits"""
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    conn.execute('BEGIN IMMEDIATE')
+    return conn
+
+
+def test_write_retries_while_locked(temp_db):
+    """Test a write waits out another shell's transaction instead of failing"""
+    temp_db.busy_timeout = 0.01
+    temp_db.release_thread_connection()
+    temp_db.BUSY_RETRY_DELAY = 0.02
+    locker = _hold_write_lock(temp_db.db_path)
+    threading.Timer(0.2, locker.commit).start()
+
+    command_id = temp_db.log_command('user1', ['web01'], 'push apply', 0.0)
+
+    assert temp_db.get_command_by_id(command_id)[1] == 'push apply'
+    locker.close()
+
+
+def test_write_gives_up_when_lock_never_released(temp_db):
+    """Test the busy error surfaces once retries run out"""
+    temp_db.busy_timeout = 0.01
+    temp_db.release_thread_connection()
+    temp_db.BUSY_RETRIES = 2
+    temp_db.BUSY_RETRY_DELAY = 0.01
+    locker = _hold_write_lock(temp_db.db_path)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            temp_db.log_command('user1', [], 'ping', 0.0)
+    finally:
+        locker.close()
+
+
 def test_log_command(temp_db):
     """Test logging a command to database"""
     command_id = temp_db.log_command(
@@ -76,6 +390,222 @@ def test_log_salt_output(temp_db):
     assert output[2] == 0  # return_code
 
 
+def test_salt_output_compressed(temp_db):
+    """Test that large outputs are stored compressed and read back transparently"""
+    command_id = temp_db.log_command('user1', ['host1'], 'push apply', 1.0)
+    output = "web01:\n    Result: True\n" * 1000
+    temp_db.log_salt_output(command_id, 'apply', output, 0)
+
+    with temp_db._get_connection() as conn:
+        stored, codec = conn.execute("SELECT output, codec FROM salt_outputs").fetchone()
+    assert codec == 'zlib'
+    assert len(stored) < len(output) // 10
+
+    assert temp_db.get_salt_output(command_id) == ('apply', output, 0)
+
+
+def test_short_salt_output_stored_plain(temp_db):
+    """Test that outputs that don't shrink are kept as plain text"""
+    command_id = temp_db.log_command('user1', ['host1'], 'push test', 1.0)
+    temp_db.log_salt_output(command_id, 'test', 'ok', 0)
+
+    with temp_db._get_connection() as conn:
+        assert conn.execute("SELECT output, codec FROM salt_outputs").fetchone() == ('ok', None)
+    assert temp_db.get_salt_output(command_id) == ('test', 'ok', 0)
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_output_codec_round_trip(codec):
+    """Test each codec round-trips text, including non-ASCII"""
+    output = "état: ✓ changed\n" * 200
+    value, stored_codec = encode_output(output, codec)
+    assert stored_codec == codec
+    assert decode_output(value, stored_codec) == output
+
+
+def test_recompress(temp_db):
+    """Test converting stored outputs between codecs in batches"""
+    temp_db.RECOMPRESS_BATCH_SIZE = 2
+    output = "web01:\n    Result: True\n" * 500
+    ids = []
+    # Old, uncompressed rows
+    temp_db.output_codec = 'none'
+    for i in range(5):
+        command_id = temp_db.log_command('user1', ['host1'], f'push apply {i}', 1.0)
+        temp_db.log_salt_output(command_id, 'apply', output, 0)
+        ids.append(command_id)
+
+    progress = []
+    converted, before, after = temp_db.recompress('lzma', progress=lambda done, total: progress.append(done))
+
+    assert converted == 5
+    assert after < before
+    assert progress == [2, 4, 5]
+    with temp_db._get_connection() as conn:
+        codecs = {row[0] for row in conn.execute("SELECT codec FROM salt_outputs")}
+    assert codecs == {'lzma'}
+    for command_id in ids:
+        assert temp_db.get_salt_output(command_id)[1] == output
+
+    # Nothing left to do the second time
+    assert temp_db.recompress('lzma')[0] == 0
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma', 'none'])
+def test_iter_salt_output(temp_db, codec):
+    """Test streaming output in chunks, including characters split across chunks"""
+    temp_db.output_codec = codec
+    temp_db.STREAM_CHUNK_SIZE = 1000
+    command_id = temp_db.log_command('user1', ['web01'], 'push apply', 1.0)
+    output = "état ✓ — web01 changed\n" * 2000
+    temp_db.log_salt_output(command_id, 'apply', output, 2)
+
+    salt_command, return_code, chunks = temp_db.iter_salt_output(command_id)
+    chunks = list(chunks)
+
+    assert (salt_command, return_code) == ('apply', 2)
+    assert len(chunks) > 10
+    assert ''.join(chunks) == output
+
+
+def test_iter_salt_output_missing(temp_db):
+    """Test streaming a command without output"""
+    command_id = temp_db.log_command('user1', ['web01'], 'push apply', 1.0)
+    assert temp_db.iter_salt_output(command_id) is None
+
+    temp_db.log_salt_output(command_id, 'apply', None, 1)
+    assert list(temp_db.iter_salt_output(command_id)[2]) == []
+
+
+def test_iter_salt_output_constant_memory(temp_db):
+    """Test streaming a large output doesn't hold it in memory"""
+    temp_db.STREAM_CHUNK_SIZE = 64 * 1024
+    command_id = temp_db.log_command('user1', ['web01'], 'push apply', 1.0)
+    temp_db.log_salt_output(command_id, 'apply', "".join(
+        f"web{i:05d}:\n    Result: True\n" for i in range(400000)), 0)
+
+    tracemalloc.start()
+    try:
+        total = sum(len(chunk) for chunk in temp_db.iter_salt_output(command_id)[2])
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert total > 10 * 1024 * 1024
+    assert peak < 2 * 1024 * 1024
+
+
+def test_minion_results(temp_db):
+    """Test per-minion results are stored alongside the output"""
+    command_id = temp_db.log_command('user1', ['web01', 'web02'], 'push apply', 1.0)
+    payload = "Summary for web01\n" + "Result: True\n" * 500
+    temp_db.log_salt_output(command_id, 'apply', 'full output', 1, [
+        MinionResult('web01', True, 3, 0, 1.5, payload),
+        MinionResult('web02', False, None, None, None, 'Minion did not return.'),
+    ])
+
+    assert temp_db.get_minion_results(command_id) == [
+        ('web01', True, 3, 0, 1.5),
+        ('web02', False, None, None, None),
+    ]
+    assert temp_db.get_minion_output(command_id, 'web01') == payload
+    assert temp_db.get_minion_output(command_id, 'web03') is None
+    assert temp_db.get_salt_output(command_id) == ('apply', 'full output', 1)
+
+
+def test_trim_removes_minion_results(temp_db):
+    """Test trimming removes per-minion results with their command"""
+    old_id = temp_db.log_command('user1', ['web01'], 'old_command', 1.0)
+    temp_db.log_salt_output(old_id, 'apply', 'output', 0, [MinionResult('web01', True, 0, 0, 1.0, 'ok')])
+    with temp_db._get_connection() as conn:
+        conn.execute("UPDATE command_history SET epoch = epoch - 200 * 86400 WHERE id = ?", (old_id,))
+
+    temp_db.trim_old_history((datetime.now() - timedelta(days=90)).isoformat())
+
+    assert temp_db.get_minion_results(old_id) == []
+
+
+def _fts_integrity_check(db):
+    with db._get_connection() as conn:
+        conn.execute("INSERT INTO output_fts (output_fts) VALUES ('integrity-check')")
+
+
+def test_search_outputs(temp_db):
+    """Test full-text search over stored (compressed) outputs"""
+    first = temp_db.log_command('user1', ['web01'], 'push apply', 1.0)
+    temp_db.log_salt_output(first, 'apply', "web01:\n" + "Result: True\n" * 200 + "ERROR: disk full\n", 1)
+    second = temp_db.log_command('user1', ['web02'], 'push apply', 1.0)
+    temp_db.log_salt_output(second, 'apply', "web02:\n    Permission denied: /etc/shadow\n", 1)
+
+    rows = temp_db.search_outputs('disk')
+    assert [row[0] for row in rows] == [first]
+    assert rows[0][2:] == ('push apply', ['web01'])
+
+    # Not valid FTS syntax, so searched as a phrase
+    assert [row[0] for row in temp_db.search_outputs('denied: /etc')] == [second]
+    assert temp_db.search_outputs('nothing') == []
+
+
+def test_search_outputs_hosts(temp_db):
+    """Test search results list the minions with stored results, or else the command's hosts"""
+    with_results = temp_db.log_command('user1', ['web01', 'web02', 'db01'], 'push apply', 1.0)
+    temp_db.log_salt_output(with_results, 'apply', "db01:\n  kernel updated\nweb02:\n  kernel updated\n", 0,
+                            [('db01', True, 1, 0, 1.0, 'kernel updated'),
+                             ('web02', True, 1, 0, 1.0, 'kernel updated')])
+    without_results = temp_db.log_command('user1', ['web02', 'web01'], 'ping', 1.0)
+    temp_db.log_salt_output(without_results, 'ping', "kernel ping\n", 0)
+
+    rows = temp_db.search_outputs('kernel')
+    assert [row[3] for row in rows] == [['db01', 'web02'], ['web01', 'web02']]
+
+
+def test_search_index_trimmed(temp_db):
+    """Test trimmed outputs leave the search index"""
+    old_id = temp_db.log_command('user1', ['web01'], 'old', 1.0)
+    temp_db.log_salt_output(old_id, 'apply', 'kernel panic', 1)
+    new_id = temp_db.log_command('user1', ['web01'], 'new', 1.0)
+    temp_db.log_salt_output(new_id, 'apply', 'kernel upgraded', 0)
+    with temp_db._get_connection() as conn:
+        conn.execute("UPDATE command_history SET epoch = epoch - 200 * 86400 WHERE id = ?", (old_id,))
+
+    temp_db.trim_old_history((datetime.now() - timedelta(days=90)).isoformat())
+
+    assert [row[0] for row in temp_db.search_outputs('kernel')] == [new_id]
+    _fts_integrity_check(temp_db)
+
+
+def test_reindex_outputs(temp_db):
+    """Test rebuilding the index picks up outputs that were never indexed"""
+    temp_db.RECOMPRESS_BATCH_SIZE = 2
+    command_id = temp_db.log_command('user1', ['web01'], 'push apply', 1.0)
+    temp_db.log_salt_output(command_id, 'apply', 'indexed output', 0)
+    with temp_db._get_connection() as conn:
+        for i in range(3):
+            conn.execute('''
+                INSERT INTO salt_outputs (command_id, salt_command, output, return_code)
+                VALUES (?, 'apply', ?, 0)
+            ''', (command_id, f'legacy output {i}'))
+
+    assert temp_db.unindexed_output_count() == 3
+    assert len(temp_db.search_outputs('legacy')) == 0
+
+    progress = []
+    assert temp_db.reindex_outputs(progress=lambda done, total: progress.append((done, total))) == 4
+    assert progress == [(2, 4), (4, 4)]
+    assert temp_db.unindexed_output_count() == 0
+    assert len(temp_db.search_outputs('legacy')) == 3
+    assert len(temp_db.search_outputs('output')) == 4
+    _fts_integrity_check(temp_db)
+
+
+def test_search_without_fts5(temp_db):
+    """Test a clear error when SQLite lacks FTS5"""
+    temp_db.search_available = False
+    with pytest.raises(RuntimeError):
+        temp_db.search_outputs('anything')
+    assert temp_db.unindexed_output_count() == 0
+
+
 def test_get_command_by_id(temp_db):
     """Test retrieving command by ID"""
     command_id = temp_db.log_command(
@@ -139,6 +669,31 @@ def test_get_command_history_filtered(temp_db):
     assert len(rows) == 2
 
 
+def test_get_command_history_any_selected_host(temp_db):
+    """Test that history matches commands sharing any host with the selection"""
+    temp_db.log_command('user1', ['web01', 'web02'], 'command1', 1.0)
+    temp_db.log_command('user1', ['web03'], 'command2', 1.0)
+    temp_db.log_command('user1', ['db01'], 'command3', 1.0)
+    temp_db.log_command('user1', [], 'command4', 1.0)
+
+    rows = temp_db.get_command_history(selected_hosts=['web02', 'web03'], limit=50)
+    assert [row[4] for row in rows] == ['command2', 'command1']
+
+    rows = temp_db.get_command_history(selected_hosts=['web03'], limit=50)
+    assert [row[4] for row in rows] == ['command2']
+
+    assert temp_db.get_command_history(selected_hosts=['unknown'], limit=50) == []
+
+
+def test_get_command_history_many_hosts(temp_db):
+    """Test filtering by more hosts than SQLite allows bound parameters"""
+    hosts = [f'host{i:04d}' for i in range(2000)]
+    temp_db.log_command('user1', hosts[-1:], 'command1', 1.0)
+
+    rows = temp_db.get_command_history(selected_hosts=hosts, limit=50)
+    assert [row[4] for row in rows] == ['command1']
+
+
 def test_get_command_history_limit(temp_db):
     """Test that limit parameter works"""
     # Log many commands
@@ -206,4 +761,781 @@ def test_trim_old_history_with_outputs(temp_db):
     assert salt_output_count == 1
 
 
+def test_trim_old_history_removes_host_links(temp_db):
+    """Test that trimmed commands no longer appear in per-host history"""
+    old_id = temp_db.log_command('user1', ['web01'], 'old_command', 1.0)
+    with temp_db._get_connection() as conn:
+        conn.execute("UPDATE command_history SET epoch = epoch - 200 * 86400 WHERE id = ?", (old_id,))
+
+    cutoff = (datetime.now() - timedelta(days=90)).isoformat()
+    temp_db.trim_old_history(cutoff)
+
+    with temp_db._get_connection() as conn:
+        links = conn.execute("SELECT COUNT(*) FROM command_hosts").fetchone()[0]
+    assert links == 0
+
+
+
+def _age_commands(db, count: int, days: int = 200, output_size: int = 0):
+    """Log count commands (with incompressible output if output_size) dated days ago"""
+    for i in range(count):
+        command_id = db.log_command('user1', ['web01'], f'old {i}', 1.0)
+        if output_size:
+            db.log_salt_output(command_id, 'apply', os.urandom(output_size).hex(), 0)
+    with db._get_connection() as conn:
+        conn.execute("UPDATE command_history SET epoch = epoch - ? * 86400", (days,))
+
+
+def test_trim_in_batches(temp_db):
+    """Test trim deletes in bounded batches, reporting progress after each"""
+    temp_db.TRIM_BATCH_SIZE = 4
+    temp_db.TRIM_BATCH_PAUSE = 0
+    _age_commands(temp_db, 10, output_size=10)
+    recent_id = temp_db.log_command('user1', ['web01'], 'recent', 1.0)
+
+    calls = []
+    cutoff = (datetime.now() - timedelta(days=90)).isoformat()
+    assert temp_db.trim_old_history(cutoff, progress=lambda done, total: calls.append((done, total))) == (10, 10)
+
+    assert calls == [(4, 10), (8, 10), (10, 10)]
+    assert [row[0] for row in temp_db.get_command_history()] == [recent_id]
+
+
+def test_estimate_trim(temp_db):
+    """Test a dry run counts what trim would delete without deleting it"""
+    _age_commands(temp_db, 3, output_size=1000)
+    temp_db.log_command('user1', ['web01'], 'recent', 1.0)
+
+    cutoff = (datetime.now() - timedelta(days=90)).isoformat()
+    command_count, salt_output_count, size = temp_db.estimate_trim(cutoff)
+
+    assert (command_count, salt_output_count) == (3, 3)
+    assert size > 3 * 1000
+    assert len(temp_db.get_command_history()) == 4
+
+
+def test_new_database_uses_incremental_vacuum(temp_db):
+    """Test new database files are created with incremental auto_vacuum"""
+    assert temp_db.auto_vacuum == 'incremental'
+
+
+def test_reclaim_space_after_trim(temp_db):
+    """Test trimmed pages are returned to the filesystem"""
+    temp_db.TRIM_BATCH_PAUSE = 0
+    _age_commands(temp_db, 50, output_size=20000)
+    with temp_db._get_connection() as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    size_before = os.path.getsize(temp_db.db_path)
+
+    temp_db.trim_old_history((datetime.now() - timedelta(days=90)).isoformat())
+    released = temp_db.reclaim_space()
+    with temp_db._get_connection() as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+    assert released > 50 * 20000
+    assert os.path.getsize(temp_db.db_path) < size_before - 50 * 20000
+
+
+def test_vacuum_enables_incremental_vacuum(temp_db):
+    """Test vacuum() converts a file created without auto_vacuum"""
+    path = temp_db.db_path
+    temp_db.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE placeholder (id INTEGER)')
+    conn.close()
+
+    db = SaltCtlDatabase(path)
+    assert db.auto_vacuum == 'none'
+    assert db.reclaim_space() == 0
+
+    db.vacuum()
+    assert db.auto_vacuum == 'incremental'
+    db.close()
+
+
+
+def _log_at(db, when: datetime, command: str, hosts=('web01',), output=None) -> int:
+    """Log a command (and output) as if it ran at when"""
+    command_id = db.log_command('user1', list(hosts), command, 1.0)
+    if output is not None:
+        db.log_salt_output(command_id, 'apply', output, 0, [(hosts[0], True, 2, 0, 1.0, output)])
+    with db._get_connection() as conn:
+        conn.execute("""
+            UPDATE command_history
+            SET timestamp = ?, epoch = ?,
+                content_hash = saltctl_content_hash(?, username, selected_hosts, command)
+            WHERE id = ?
+        """, (when.isoformat(), int(when.timestamp()), when.isoformat(), command_id))
+    return command_id
+
+
+@pytest.fixture
+def archived_db(temp_db):
+    """temp_db with January and February 2024 moved into archives"""
+    ids = {
+        'jan': _log_at(temp_db, datetime(2024, 1, 15, 9), 'push apply', output='jan output'),
+        'feb': _log_at(temp_db, datetime(2024, 2, 10, 9), 'ping', hosts=('db01',), output='feb output'),
+        'mar': _log_at(temp_db, datetime(2024, 3, 5, 9), 'push test', output='mar output'),
+    }
+    temp_db.archive_old_history('2024-03-20T00:00:00')
+    yield temp_db, ids
+    for month, path, *_ in temp_db.list_archives():
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def test_archive_moves_whole_months(archived_db):
+    """Test months before the cutoff move to their own files and the rest stays live"""
+    db, ids = archived_db
+    archives = db.list_archives()
+
+    assert [(month, commands) for month, _path, commands, *_ in archives] == [('2024-01', 1), ('2024-02', 1)]
+    assert all(os.path.exists(path) for _month, path, *_ in archives)
+    assert archives[0][1] == db.db_path[:-3] + '.2024-01.db'
+    assert [row[0] for row in db.get_command_history()] == [ids['mar']]
+    with db._get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM salt_outputs').fetchone()[0] == 1
+
+
+def test_archived_output_by_id(archived_db):
+    """Test archived commands' output is found transparently by ID"""
+    db, ids = archived_db
+
+    assert db.get_command_by_id(ids['jan'])[1] == 'push apply'
+    assert db.get_salt_output(ids['jan']) == ('apply', 'jan output', 0)
+    assert db.get_minion_results(ids['feb']) == [('db01', True, 2, 0, 1.0)]
+    assert db.get_minion_output(ids['feb'], 'db01') == 'feb output'
+    salt_command, return_code, chunks = db.iter_salt_output(ids['feb'])
+    assert ''.join(chunks) == 'feb output'
+
+    # Archives are detached again after each lookup
+    with db._get_connection() as conn:
+        assert 'archive' not in [row[1] for row in conn.execute('PRAGMA database_list')]
+    assert db.get_salt_output(999) is None
+
+
+def test_archived_history_by_date(archived_db):
+    """Test a date range reaching into archived months reads their files"""
+    db, ids = archived_db
+    since = int(datetime(2024, 1, 1).timestamp())
+
+    rows = db.get_command_history(limit=None, since=since)
+    assert [row[0] for row in rows] == [ids['mar'], ids['feb'], ids['jan']]
+
+    feb = db.get_command_history(since=int(datetime(2024, 2, 1).timestamp()),
+                                 until=int(datetime(2024, 3, 1).timestamp()))
+    assert [row[4] for row in feb] == ['ping']
+
+    by_host = db.get_command_history(selected_hosts=['db01'], since=since)
+    assert [row[0] for row in by_host] == [ids['feb']]
+
+
+def test_archive_resumes_after_interruption(temp_db):
+    """Test commands copied to an archive but not yet removed are archived once"""
+    command_id = _log_at(temp_db, datetime(2024, 1, 15, 9), 'push apply', output='jan output')
+    path = temp_db._archive_path(temp_db._archive_name('2024-01'))
+    try:
+        # A run that died between the copy and the delete
+        with temp_db._attached_archive(path):
+            with temp_db._transaction(write=True) as conn:
+                _create_archive_schema(conn.cursor())
+            start = int(datetime(2024, 1, 1).timestamp())
+            temp_db._copy_to_archive(start, int(datetime(2024, 2, 1).timestamp()))
+        assert temp_db.get_salt_output(command_id) == ('apply', 'jan output', 0)
+
+        assert temp_db.archive_old_history('2024-02-01')[:2] == (1, 1)
+        assert temp_db.list_archives()[0][2] == 1
+        assert temp_db.get_salt_output(command_id) == ('apply', 'jan output', 0)
+        check = sqlite3.connect(path)
+        assert check.execute('SELECT COUNT(*) FROM salt_outputs').fetchone()[0] == 1
+        check.close()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+
+def test_iter_history_pages_with_keyset(temp_db, monkeypatch):
+    """Test browsing reads page after page, newest first, across equal timestamps"""
+    monkeypatch.setattr(SaltCtlDatabase, 'HISTORY_PAGE_SIZE', 3)
+    when = datetime(2024, 5, 1, 9)
+    ids = [_log_at(temp_db, when + timedelta(minutes=i // 2), f'ping {i}') for i in range(10)]
+
+    rows = list(temp_db.iter_command_history())
+
+    assert [row[0] for row in rows] == ids[::-1]
+    assert len(rows[0]) == 6
+
+
+def test_iter_history_filters(temp_db):
+    """Test user, command, host and date filters combine"""
+    base = datetime(2024, 5, 1, 9)
+    _log_at(temp_db, base, 'push apply', hosts=('web01',))
+    wanted = _log_at(temp_db, base + timedelta(days=2), 'push test', hosts=('web01',))
+    _log_at(temp_db, base + timedelta(days=2), 'ping', hosts=('web01',))
+    _log_at(temp_db, base + timedelta(days=3), 'push apply', hosts=('db01',))
+    with temp_db._get_connection() as conn:
+        conn.execute("UPDATE command_history SET username = 'bob' WHERE id = ?", (wanted,))
+
+    def ids(**filters):
+        return [row[0] for row in temp_db.iter_command_history(**filters)]
+
+    since = int((base + timedelta(days=1)).timestamp())
+    assert ids(selected_hosts=['web01'], verb='push', since=since) == [wanted]
+    assert ids(username='bob') == [wanted]
+    assert ids(username='bob', until=since) == []
+
+
+def test_iter_history_before_and_after(temp_db):
+    """Test --before pages back from a command and --after forward from it"""
+    when = datetime(2024, 5, 1, 9)
+    ids = [_log_at(temp_db, when + timedelta(hours=i), f'ping {i}') for i in range(5)]
+
+    assert [row[0] for row in temp_db.iter_command_history(before=ids[2])] == [ids[1], ids[0]]
+    assert [row[0] for row in temp_db.iter_command_history(after=ids[2])] == [ids[3], ids[4]]
+    with pytest.raises(ValueError, match='No command with ID 999'):
+        next(temp_db.iter_command_history(before=999))
+
+
+def test_iter_history_page_query_uses_index(temp_db):
+    """Test a keyset page is read in index order, without sorting the history"""
+    with temp_db._get_connection() as conn:
+        plan = ' '.join(row[-1] for row in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT id, command FROM main.command_history '
+            'WHERE username = ? AND epoch <= ? AND (epoch < ? OR id < ?) '
+            'ORDER BY epoch DESC, id DESC LIMIT 200', ('bob', 0, 0, 0)))
+
+    assert 'idx_command_history_username' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_iter_history_into_archives(archived_db, monkeypatch):
+    """Test browsing pages on from the live history into archived months"""
+    monkeypatch.setattr(SaltCtlDatabase, 'HISTORY_PAGE_SIZE', 1)
+    db, ids = archived_db
+    since = int(datetime(2024, 1, 1).timestamp())
+
+    assert [row[0] for row in db.iter_command_history(since=since)] == [ids['mar'], ids['feb'], ids['jan']]
+    assert [row[0] for row in db.iter_command_history(after=ids['jan'])] == [ids['feb'], ids['mar']]
+    assert [row[0] for row in db.iter_command_history(before=ids['feb'])] == [ids['jan']]
+    assert [row[0] for row in db.iter_command_history(verb='push', since=since)] == [ids['mar'], ids['jan']]
+    with db._get_connection() as conn:
+        assert 'archive' not in [row[1] for row in conn.execute('PRAGMA database_list')]
+
+
+
+def test_history_rows_list_host_names(archived_db):
+    """Test history rows carry host names from the host tables, live and archived"""
+    db, ids = archived_db
+    several = db.log_command('user1', ['web01', 'web02'], 'ping', 0.0)
+    nowhere = db.log_command('user1', [], 'status', 0.0)
+
+    hosts = {row[0]: row[3] for row in db.get_command_history(limit=None, since=0)}
+
+    assert hosts == {ids['jan']: 'web01', ids['feb']: 'db01', ids['mar']: 'web01',
+                     several: 'web01, web02', nowhere: None}
+
+
+def test_iter_history_merges_live_entries_into_archives(archived_db, monkeypatch):
+    """Test live entries older than archived months (e.g. imported ones) are listed in time order"""
+    monkeypatch.setattr(SaltCtlDatabase, 'HISTORY_PAGE_SIZE', 1)
+    db, ids = archived_db
+    imported = _log_at(db, datetime(2024, 1, 20, 9), 'status', output='imported output')
+    since = int(datetime(2024, 1, 1).timestamp())
+
+    assert [row[0] for row in db.iter_command_history(since=since)] == \
+        [ids['mar'], ids['feb'], imported, ids['jan']]
+    assert [row[0] for row in db.iter_command_history(after=ids['jan'])] == [imported, ids['feb'], ids['mar']]
+    assert [row[0] for row in db.iter_command_history(before=ids['feb'])] == [imported, ids['jan']]
+    exported = [(row[0], ''.join(output[2])) for row, output in db.iter_history_export(with_output=True)]
+    assert exported == [(ids['jan'], 'jan output'), (imported, 'imported output'),
+                        (ids['feb'], 'feb output'), (ids['mar'], 'mar output')]
+    # Stopping part way detaches the archive too
+    rows = db.iter_command_history(since=since)
+    next(rows)
+    rows.close()
+    with db._get_connection() as conn:
+        assert 'archive' not in [row[1] for row in conn.execute('PRAGMA database_list')]
+
+
+
+def test_command_stats_counted_as_commands_finish(temp_db):
+    """Test finished commands are added to the stats histograms with their outcome"""
+    for duration, success in ((1.0, True), (2.0, True), (10.0, False), (3.0, None)):
+        command_id = temp_db.log_command('user1', ['web01'], 'push apply', 0.0)
+        temp_db.update_command_duration(command_id, duration, success=success)
+    temp_db.log_command('user2', ['db01'], 'ping', 0.0)  # still running
+
+    (push,) = temp_db.command_stats('verb')
+    assert push.key == 'push'
+    assert push.commands == 4
+    assert push.longest == 10.0
+    assert 2.0 <= push.p50 <= 2.0 * 1.2
+    assert push.p95 == 10.0
+    assert push.failure_rate == pytest.approx(1 / 3)
+    assert [row.key for row in temp_db.command_stats('hosts')] == ['["web01"]']
+    assert [row.key for row in temp_db.command_stats('user')] == ['user1']
+    with temp_db._get_connection() as conn:
+        assert conn.execute('SELECT success FROM command_history ORDER BY id').fetchall() == \
+            [(1,), (1,), (0,), (None,), (None,)]
+
+
+def test_command_stats_window(temp_db):
+    """Test stats only cover the requested window"""
+    old = _log_at(temp_db, datetime.now() - timedelta(days=10), 'ping')
+    temp_db.update_command_duration(old, 1.0, success=True)
+    recent = temp_db.log_command('user1', ['web01'], 'push test', 0.0)
+    temp_db.update_command_duration(recent, 1.0, success=True)
+
+    since = int((datetime.now() - timedelta(days=7)).timestamp())
+    assert [row.key for row in temp_db.command_stats('verb', since=since)] == ['push']
+    assert len(temp_db.command_stats('verb')) == 2
+
+
+def test_command_stats_write_behind(tmp_path):
+    """Test write-behind logging counts each command once, whether or not it was inserted complete"""
+    db = SaltCtlDatabase(str(tmp_path / 'wb.db'), write_behind=True)
+    try:
+        quick = db.log_command('user1', ['web01'], 'ping', 0.0)
+        db.update_command_duration(quick, 0.5, success=True)
+        db.flush()
+        slow = db.log_command('user1', ['web01'], 'ping', 0.0)
+        db.flush()
+        db.update_command_duration(slow, 5.0, success=False)
+        db.flush()
+
+        (ping,) = db.command_stats()
+        assert ping.commands == 2
+        assert ping.failure_rate == 0.5
+        assert ping.longest == 5.0
+    finally:
+        db.close()
+
+
+
+def test_history_export_streams_live_and_archived(archived_db, monkeypatch):
+    """Test export reads oldest first through the archives, with each output from its own file"""
+    monkeypatch.setattr(SaltCtlDatabase, 'HISTORY_PAGE_SIZE', 1)
+    db, ids = archived_db
+    extra = db.log_command('user1', ['web01'], 'status', 0.0)
+
+    exported = []
+    for row, output in db.iter_history_export(with_output=True):
+        text = ''.join(output[2]) if output else None
+        exported.append((row[0], text))
+
+    assert exported == [(ids['jan'], 'jan output'), (ids['feb'], 'feb output'),
+                        (ids['mar'], 'mar output'), (extra, None)]
+    since = int(datetime(2024, 2, 1).timestamp())
+    until = int(datetime(2024, 3, 1).timestamp())
+    assert [row[0] for row, _ in db.iter_history_export(since=since, until=until)] == [ids['feb']]
+    with db._get_connection() as conn:
+        assert 'archive' not in [row[1] for row in conn.execute('PRAGMA database_list')]
+
+
+
+@pytest.fixture
+def source_db(tmp_path):
+    """Another workstation's database, with IDs overlapping temp_db's"""
+    db = SaltCtlDatabase(str(tmp_path / 'other.db'))
+    yield db
+    db.close()
+
+
+def _log_finished(db, username, hosts, command, output=None, success=True):
+    command_id = db.log_command(username, hosts, command, 0.0)
+    if output is not None:
+        db.log_salt_output(command_id, 'apply', output, 0, [(hosts[0], success, 1, 0, 0.5, output)])
+    db.update_command_duration(command_id, 2.0, success=success)
+    return command_id
+
+
+def test_import_history_remaps_ids(temp_db, source_db):
+    """Test imported commands get new IDs with their output, results, hosts and stats"""
+    local = _log_finished(temp_db, 'alice', ['web01'], 'ping')
+    _log_finished(source_db, 'bob', ['db01'], 'push apply', output='bob applied zebrafish')
+    _log_finished(source_db, 'bob', ['db01', 'web01'], 'ping', success=False)
+
+    imported, outputs, skipped = temp_db.import_history(source_db.db_path)
+
+    assert (imported, outputs, skipped) == (2, 1, 0)
+    rows = temp_db.get_command_history()
+    assert [row[4] for row in rows] == ['ping', 'push apply', 'ping']
+    new_push = rows[1][0]
+    assert new_push > local
+    assert temp_db.get_salt_output(new_push) == ('apply', 'bob applied zebrafish', 0)
+    assert [row[0] for row in temp_db.get_minion_results(new_push)] == ['db01']
+    assert [row[4] for row in temp_db.get_command_history(selected_hosts=['db01'])] == ['ping', 'push apply']
+    assert [row[0] for row in temp_db.search_outputs('zebrafish')] == [new_push]
+    stats = {row.key: row for row in temp_db.command_stats('user')}
+    assert stats['bob'].commands == 2 and stats['bob'].failure_rate == 0.5
+
+
+def test_import_history_skips_duplicates(temp_db, source_db, monkeypatch):
+    """Test importing twice, in small batches, adds nothing the second time"""
+    monkeypatch.setattr(SaltCtlDatabase, 'IMPORT_BATCH_SIZE', 2)
+    for i in range(5):
+        _log_finished(source_db, 'bob', ['db01'], f'ping {i}', output=f'out {i}')
+    calls = []
+
+    assert temp_db.import_history(source_db.db_path, progress=lambda done, total: calls.append((done, total))) \
+        == (5, 5, 0)
+    assert calls == [(2, 5), (4, 5), (5, 5)]
+    assert temp_db.import_history(source_db.db_path) == (0, 0, 5)
+    with temp_db._get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM command_history').fetchone()[0] == 5
+        assert 'source' not in [row[1] for row in conn.execute('PRAGMA database_list')]
+
+
+@pytest.mark.parametrize('legacy_archive', [False, True])
+def test_import_history_skips_archived_entries(tmp_path, legacy_archive):
+    """Test entries moved to an archive (with or without stored hashes) aren't imported again"""
+    db = SaltCtlDatabase(str(tmp_path / 'history.db'))
+    for day in (1, 2, 3):
+        _log_at(db, datetime(2020, 1, day, 9), 'push apply', output=f'day {day}')
+    copy = str(tmp_path / 'copy.db')
+    with sqlite3.connect(db.db_path) as source, sqlite3.connect(copy) as target:
+        source.backup(target)
+    db.archive_old_history('2024-01-01T00:00:00')
+    if legacy_archive:
+        with sqlite3.connect(db.list_archives()[0][1]) as archive:
+            archive.execute('ALTER TABLE command_history DROP COLUMN content_hash')
+    stats = db.command_stats(since=0)
+
+    assert db.import_history(copy) == (0, 0, 3)
+    assert len(db.get_command_history(limit=None, since=0)) == 3
+    assert db.command_stats(since=0) == stats
+    db.close()
+
+
+def test_import_history_recognises_own_entries(temp_db, tmp_path):
+    """Test a copy of this database imports as all duplicates"""
+    _log_finished(temp_db, 'alice', ['web01'], 'ping')
+    temp_db.close()
+    copy = str(tmp_path / 'copy.db')
+    with sqlite3.connect(temp_db.db_path) as src, sqlite3.connect(copy) as dst:
+        src.backup(dst)
+
+    assert temp_db.import_history(copy) == (0, 0, 1)
+
+
+def test_import_history_upgrades_legacy_source(temp_db, tmp_path):
+    """Test a database from before schema versioning can be imported"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE command_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, username TEXT NOT NULL,
+            selected_hosts TEXT, command TEXT NOT NULL, duration REAL
+        );
+        CREATE TABLE salt_outputs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, command_id INTEGER NOT NULL,
+            salt_command TEXT NOT NULL, output TEXT, return_code INTEGER
+        );
+        INSERT INTO command_history (timestamp, username, selected_hosts, command, duration)
+        VALUES ('2024-01-01T12:00:00', 'carol', '["web02"]', 'push test', 3.0);
+        INSERT INTO salt_outputs (command_id, salt_command, output, return_code) VALUES (1, 'test', 'old', 0);
+    ''')
+    conn.commit()
+    conn.close()
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    assert temp_db.import_history(path) == (1, 1, 0)
+    (row,) = temp_db.get_command_history(selected_hosts=['web02'])
+    assert temp_db.get_salt_output(row[0]) == ('test', 'old', 0)
+    # The upgrade is made on a copy
+    with open(path, 'rb') as f:
+        assert f.read() == before
+    assert os.listdir(str(tmp_path)) == ['legacy.db']
+
+
+def test_import_history_only_reads_source(temp_db, tmp_path):
+    """Test importing leaves the other database's file alone, creating nothing beside it"""
+    directory = tmp_path / 'other'
+    directory.mkdir()
+    path = str(directory / 'history.db')
+    source = SaltCtlDatabase(path)
+    _log_finished(source, 'bob', ['db01'], 'push apply', output='bob applied')
+    source.close()
+    os.remove(path + '.lock')
+    files = sorted(os.listdir(str(directory)))
+    with open(path, 'rb') as f:
+        before = f.read()
+
+    assert temp_db.import_history(path) == (1, 1, 0)
+    assert sorted(os.listdir(str(directory))) == files
+    with open(path, 'rb') as f:
+        assert f.read() == before
+
+
+def test_import_history_rejects_bad_sources(temp_db, tmp_path):
+    """Test the database itself, missing files and other files can't be imported"""
+    not_db = tmp_path / 'notes.txt'
+    not_db.write_text('not a database at all, just some text ' * 100)
+
+    for path in (temp_db.db_path, str(tmp_path / 'missing.db'), str(not_db)):
+        with pytest.raises(ValueError):
+            temp_db.import_history(path)
+
+
+
+def test_database_stats(temp_db):
+    """Test database_stats() reports rows per table and the largest stored outputs"""
+    small = _log_finished(temp_db, 'alice', ['web01'], 'ping', output='pong')
+    large = _log_finished(temp_db, 'bob', ['web01'], 'push apply', output=os.urandom(4000).hex())
+
+    stats = temp_db.database_stats(largest=1)
+
+    tables = {name: rows for name, rows, _size in stats.tables}
+    assert tables['command_history'] == 2
+    assert tables['salt_outputs'] == 2
+    assert not any(name.startswith('output_fts') for name in tables)
+    assert stats.schema_version == SCHEMA_VERSION
+    assert stats.freelist_count <= stats.page_count
+    assert [entry[:2] for entry in stats.largest_outputs] == [(large, 'push apply')]
+    assert small != large
+    assert 'idx_command_history_username' in [entry[0] for entry in stats.indexes]
+
+
+def test_optimize_analyzes_and_checks(temp_db):
+    """Test optimize() gathers planner statistics and reports a clean integrity check"""
+    _log_finished(temp_db, 'alice', ['web01'], 'ping')
+    assert all(entry[3] is None for entry in temp_db.database_stats().indexes)
+
+    problems, before, after = temp_db.optimize()
+
+    assert problems == []
+    assert before == after
+    analyzed = {name: per_key for name, _table, _size, per_key in temp_db.database_stats().indexes}
+    assert analyzed['idx_command_history_username'] == 1
+
+
+def test_optimize_vacuum_is_online(temp_db):
+    """Test optimize(vacuum=True) shrinks the file while another connection stays usable"""
+    for i in range(200):
+        _log_finished(temp_db, 'alice', ['web01'], f'push {i}', output=os.urandom(2000).hex())
+    other = SaltCtlDatabase(temp_db.db_path)
+    assert len(other.get_command_history(limit=None)) == 200
+    temp_db.trim_old_history((datetime.now() + timedelta(seconds=2)).isoformat())
+
+    problems, before, after = temp_db.optimize(vacuum=True)
+
+    assert problems == []
+    assert after < before
+    assert os.path.getsize(temp_db.db_path) == after
+    assert not os.path.exists(temp_db.db_path + '.optimize')
+    _log_finished(other, 'bob', ['web01'], 'ping')
+    assert [row[4] for row in temp_db.get_command_history(limit=None)] == ['ping']
+    other.close()
+
+
+def test_optimize_vacuum_holds_off_writers_during_copy(temp_db, monkeypatch):
+    """Test another shell's commit waits for the compacted copy instead of being overwritten"""
+    for i in range(20):
+        _log_finished(temp_db, 'alice', ['web01'], f'push {i}')
+    other = SaltCtlDatabase(temp_db.db_path)
+    writer = threading.Thread(target=_log_finished, args=(other, 'bob', ['web01'], 'ping'))
+    connect = sqlite3.connect
+
+    class Compacted:
+        """The compacted copy, starting the other shell's write just before it is copied"""
+        def __init__(self, path):
+            self.conn = connect(path)
+
+        @staticmethod
+        def open(path, *args, **kwargs):
+            if path.endswith('.optimize'):
+                return Compacted(path)
+            return connect(path, *args, **kwargs)
+
+        def backup(self, target):
+            writer.start()
+            writer.join(timeout=0.2)
+            assert writer.is_alive()
+            self.conn.backup(target)
+
+        def close(self):
+            self.conn.close()
+
+    monkeypatch.setattr(sqlite3, 'connect', Compacted.open)
+    problems, _before, _after = temp_db.optimize(vacuum=True)
+    monkeypatch.undo()
+    writer.join(timeout=5)
+
+    assert problems == []
+    assert [row[4] for row in temp_db.get_command_history(limit=1)] == ['ping']
+    other.close()
+
+
+def test_optimize_vacuum_waits_for_open_transactions(temp_db):
+    """Test the copy isn't swapped in while another connection is inside a transaction"""
+    _log_finished(temp_db, 'alice', ['web01'], 'ping')
+    other = SaltCtlDatabase(temp_db.db_path)
+    temp_db.busy_timeout = 0.05
+
+    with other._get_connection():
+        assert temp_db._vacuum_into(temp_db.db_path + '.optimize') == False
+    assert temp_db._vacuum_into(temp_db.db_path + '.optimize') == True
+    os.remove(temp_db.db_path + '.optimize')
+    other.close()
+
+
+def test_optimize_vacuum_gives_up_on_busy_database(temp_db, monkeypatch):
+    """Test the compacted copy is discarded while other writers keep changing the file"""
+    _log_finished(temp_db, 'alice', ['web01'], 'ping')
+    monkeypatch.setattr(temp_db, '_vacuum_into', lambda path: False)
+
+    with pytest.raises(RuntimeError):
+        temp_db.optimize(vacuum=True)
+
+
+
+@pytest.fixture
+def blob_db(tmp_path):
+    """A database keeping outputs over 1 KiB (compressed) in its blob store"""
+    db = SaltCtlDatabase(str(tmp_path / 'history.db'), blob_threshold=1024)
+    yield db
+    db.close()
+
+
+def _blob_rows(db):
+    with db._get_connection() as conn:
+        return conn.execute('''
+            SELECT command_id, output IS NULL, blob_hash, blob_size FROM salt_outputs ORDER BY command_id
+        ''').fetchall()
+
+
+def test_large_outputs_go_to_blob_store(blob_db):
+    """Test large outputs are kept as files, once per distinct output, and read back transparently"""
+    large = 'zebrafish ' + os.urandom(4000).hex()
+    first = _log_finished(blob_db, 'alice', ['web01'], 'push apply', output=large)
+    second = _log_finished(blob_db, 'alice', ['web01'], 'push apply', output=large)
+    small = _log_finished(blob_db, 'alice', ['web01'], 'ping', output='pong')
+
+    rows = _blob_rows(blob_db)
+    assert [row[:2] for row in rows] == [(first, 1), (second, 1), (small, 0)]
+    assert rows[0][2] == rows[1][2] is not None
+    assert rows[0][3] == os.path.getsize(blob_db.blobs.path(rows[0][2]))
+    assert list(blob_db.blobs.hashes()) == [rows[0][2]]
+
+    assert blob_db.get_salt_output(second) == ('apply', large, 0)
+    salt_command, return_code, chunks = blob_db.iter_salt_output(first)
+    assert ''.join(chunks) == large
+    assert blob_db.get_salt_output(small) == ('apply', 'pong', 0)
+    if blob_db.search_available:
+        assert [row[0] for row in blob_db.search_outputs('zebrafish')] == [first, second]
+
+
+def test_blob_rewritten_when_collected_before_insert(blob_db):
+    """Test an output's blob is written again if another shell removed it before the row was inserted"""
+    command_id = blob_db.log_command('alice', ['web01'], 'push apply', 0.0)
+    large = os.urandom(4000).hex()
+    prepared = blob_db._prepare_output(command_id, 'apply', large, 0, ())
+    blob_db.blobs.remove(prepared[-1])
+
+    with blob_db._get_connection(write=True) as conn:
+        blob_db._insert_output(conn.cursor(), *prepared)
+
+    assert blob_db.get_salt_output(command_id) == ('apply', large, 0)
+
+
+def test_trim_collects_unreferenced_blobs(blob_db):
+    """Test trim removes blob files only once no remaining output refers to them"""
+    shared, dropped = os.urandom(4000).hex(), os.urandom(4000).hex()
+    _log_at(blob_db, datetime(2024, 1, 15, 9), 'push apply', output=shared)
+    _log_at(blob_db, datetime(2024, 1, 16, 9), 'push apply', output=dropped)
+    kept = _log_at(blob_db, datetime.now(), 'push apply', output=shared)
+    orphan = blob_db.blobs.put(b'left by a crashed shell')
+
+    blob_db.trim_old_history('2024-06-01T00:00:00')
+
+    assert [row[0] for row in _blob_rows(blob_db)] == [kept]
+    assert list(blob_db.blobs.hashes()) == [_blob_rows(blob_db)[0][2]]
+    assert orphan not in blob_db.blobs
+    assert blob_db.get_salt_output(kept) == ('apply', shared, 0)
+
+
+def test_archive_inlines_blobs(blob_db):
+    """Test archived outputs are copied into the archive file and their blobs collected"""
+    large = os.urandom(4000).hex()
+    command_id = _log_at(blob_db, datetime(2024, 1, 15, 9), 'push apply', output=large)
+
+    blob_db.archive_old_history('2024-03-01T00:00:00')
+
+    assert list(blob_db.blobs.hashes()) == []
+    assert blob_db.get_salt_output(command_id) == ('apply', large, 0)
+    salt_command, return_code, chunks = blob_db.iter_salt_output(command_id)
+    assert ''.join(chunks) == large
+
+
+def test_import_history_copies_blobs(blob_db, tmp_path):
+    """Test imported outputs bring their blobs from the other database's store"""
+    source = SaltCtlDatabase(str(tmp_path / 'other.db'), blob_threshold=1024)
+    large = os.urandom(4000).hex()
+    _log_finished(source, 'bob', ['db01'], 'push apply', output=large)
+    source.close()
+
+    blob_db.import_history(str(tmp_path / 'other.db'))
+
+    command_id = blob_db.get_most_recent_command()[0]
+    assert blob_db.get_salt_output(command_id) == ('apply', large, 0)
+    assert len(list(blob_db.blobs.hashes())) == 1
+
+
+
+def _log_payloads(db, when: datetime, output: str, payloads: dict) -> int:
+    """Log a command with one result (and payload) per minion, as if it ran at when"""
+    command_id = _log_at(db, when, 'push apply')
+    db.log_salt_output(command_id, 'apply', output, 0,
+                       [(minion, True, 1, 0, 0.5, payload) for minion, payload in payloads.items()])
+    return command_id
+
+
+def test_large_payloads_go_to_blob_store(blob_db):
+    """Test per-minion payloads over the threshold are kept as files and collected with their command"""
+    large = os.urandom(4000).hex()
+    old = _log_payloads(blob_db, datetime(2024, 1, 15, 9), 'summary', {'web01': large, 'web02': 'ok'})
+    kept = _log_payloads(blob_db, datetime.now(), 'summary', {'web01': 'ok'})
+
+    with blob_db._get_connection() as conn:
+        rows = conn.execute('''
+            SELECT minion, payload IS NULL, blob_hash, blob_size FROM minion_results
+            WHERE command_id = ? ORDER BY minion
+        ''', (old,)).fetchall()
+    assert [row[:2] for row in rows] == [('web01', 1), ('web02', 0)]
+    assert list(blob_db.blobs.hashes()) == [rows[0][2]]
+    assert rows[0][3] == os.path.getsize(blob_db.blobs.path(rows[0][2]))
+    assert blob_db.get_minion_output(old, 'web01') == large
+    assert blob_db.get_minion_output(old, 'web02') == 'ok'
+
+    blob_db.trim_old_history('2024-06-01T00:00:00')
+
+    assert list(blob_db.blobs.hashes()) == []
+    assert blob_db.get_minion_output(kept, 'web01') == 'ok'
+
+
+def test_archive_and_import_carry_payload_blobs(blob_db, tmp_path):
+    """Test archived payloads are inlined into the archive file and imported ones bring their blobs"""
+    source = SaltCtlDatabase(str(tmp_path / 'other.db'), blob_threshold=1024)
+    imported = os.urandom(4000).hex()
+    _log_payloads(source, datetime.now(), 'summary', {'db01': imported})
+    source.close()
+    archived = os.urandom(4000).hex()
+    command_id = _log_payloads(blob_db, datetime(2024, 1, 15, 9), 'summary', {'web01': archived})
+
+    blob_db.archive_old_history('2024-03-01T00:00:00')
+    assert list(blob_db.blobs.hashes()) == []
+    assert blob_db.get_minion_output(command_id, 'web01') == archived
+
+    blob_db.import_history(str(tmp_path / 'other.db'))
+    new_id = blob_db.get_most_recent_command()[0]
+    assert blob_db.get_minion_output(new_id, 'db01') == imported
+    assert len(list(blob_db.blobs.hashes())) == 1
+
+
 # vim: set ts=4 sw=4 et:
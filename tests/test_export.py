@@ -0,0 +1,92 @@
+"""Tests for export module"""
+
+import io
+import csv
+import gzip
+import json
+import pytest
+from export import csv_chunks, export_history, jsonl_chunks, open_export
+
+ROWS = [
+    (1, '2024-01-01T10:00:00', 'user1', 'web01, web02', 'push apply', 1.5),
+    (2, '2024-01-01T11:00:00', 'user2', None, 'ping', None),
+]
+OUTPUT = 'web01:\n    "quoted", with, commas\n    ünïcode\n'
+
+
+def _records(with_output=False):
+    """(row, output) pairs; the first command has output in several chunks"""
+    for index, row in enumerate(ROWS):
+        output = None
+        if with_output and index == 0:
+            output = ('apply', 0, iter([OUTPUT[:10], OUTPUT[10:]]))
+        yield row, output
+
+
+def test_jsonl_export():
+    """Test one JSON object per command"""
+    out = io.StringIO()
+
+    assert export_history(_records(), out, 'jsonl') == 2
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert lines[0] == {'id': 1, 'timestamp': '2024-01-01T10:00:00', 'username': 'user1',
+                        'hosts': ['web01', 'web02'], 'command': 'push apply', 'duration': 1.5}
+    assert lines[1]['hosts'] == []
+
+
+def test_jsonl_export_streams_output():
+    """Test output written chunk by chunk still makes valid JSON"""
+    chunks = list(jsonl_chunks(_records(with_output=True), with_output=True))
+
+    lines = [json.loads(line) for line in ''.join(chunks).splitlines()]
+    assert lines[0]['output'] == OUTPUT
+    assert lines[0]['salt_command'] == 'apply' and lines[0]['return_code'] == 0
+    assert lines[1]['output'] is None
+    # The output wasn't joined into one piece
+    assert len(chunks) > 4
+
+
+def test_csv_export():
+    """Test CSV with a header row and comma separated hosts"""
+    out = io.StringIO()
+
+    export_history(_records(), out, 'csv')
+
+    rows = list(csv.reader(io.StringIO(out.getvalue())))
+    assert rows[0] == ['id', 'timestamp', 'username', 'hosts', 'command', 'duration']
+    assert rows[1] == ['1', '2024-01-01T10:00:00', 'user1', 'web01,web02', 'push apply', '1.5']
+    assert rows[2][3] == ''
+
+
+def test_csv_export_streams_output():
+    """Test output written chunk by chunk is one properly quoted field"""
+    text = ''.join(csv_chunks(_records(with_output=True), with_output=True))
+
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0][-3:] == ['salt_command', 'return_code', 'output']
+    assert rows[1][-3:] == ['apply', '0', OUTPUT]
+    assert rows[2][-3:] == ['', '', '']
+
+
+def test_export_to_gzip_file(tmp_path):
+    """Test an export can be compressed into a file as it is written"""
+    path = str(tmp_path / 'history.jsonl.gz')
+
+    with open_export(path, compress=True) as out:
+        export_history(_records(), out, 'jsonl')
+
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        assert [json.loads(line)['id'] for line in f] == [1, 2]
+
+
+def test_export_gzip_needs_binary_stdout(monkeypatch):
+    """Test compressed output is refused when stdout only takes text"""
+    monkeypatch.setattr('sys.stdout', io.StringIO())
+
+    with pytest.raises(ValueError):
+        with open_export(None, compress=True):
+            pass
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,135 @@
+"""Tests for minion cache module"""
+
+import json
+import subprocess
+import time
+import pytest
+from unittest.mock import Mock
+from minions import MinionCache, MinionListError, fetch_minions
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    """Path for a temporary minion cache file"""
+    return str(tmp_path / 'minions.json')
+
+
+def test_load_missing_cache(cache_path):
+    """Test that a missing cache file is reported as not loaded"""
+    cache = MinionCache(cache_path, 300, Mock())
+
+    assert cache.load() == False
+    assert cache.minions == []
+    assert cache.is_stale == True
+
+
+def test_save_and_load_roundtrip(cache_path):
+    """Test that a refreshed list is persisted and reloaded"""
+    cache = MinionCache(cache_path, 300, Mock(return_value=['web1', 'web2']))
+    assert cache.refresh() == True
+
+    reloaded = MinionCache(cache_path, 300, Mock())
+    assert reloaded.load() == True
+    assert reloaded.minions == ['web1', 'web2']
+    assert reloaded.is_stale == False
+
+
+def test_load_ignores_other_versions(cache_path):
+    """Test that cache files with a different version stamp are ignored"""
+    with open(cache_path, 'w') as f:
+        json.dump({'version': 999, 'timestamp': time.time(), 'minions': ['web1']}, f)
+
+    cache = MinionCache(cache_path, 300, Mock())
+
+    assert cache.load() == False
+    assert cache.minions == []
+
+
+def test_stale_cache_detected(cache_path):
+    """Test that an expired cache is loaded but marked stale"""
+    with open(cache_path, 'w') as f:
+        json.dump({'version': MinionCache.CACHE_VERSION,
+                   'timestamp': time.time() - 600,
+                   'minions': ['web1']}, f)
+
+    cache = MinionCache(cache_path, 300, Mock())
+
+    assert cache.load() == True
+    assert cache.minions == ['web1']
+    assert cache.is_stale == True
+
+
+def test_failed_refresh_keeps_stale_list(cache_path):
+    """Test that a failing salt-key leaves the stale list in place"""
+    cache = MinionCache(cache_path, 300, Mock(side_effect=MinionListError("boom")))
+    cache.minions = ['web1']
+
+    assert cache.refresh() == False
+    assert cache.minions == ['web1']
+    assert cache.last_error == "boom"
+
+
+def test_background_refresh(cache_path):
+    """Test that a background refresh updates the list and notifies listeners"""
+    listener = Mock()
+    cache = MinionCache(cache_path, 300, Mock(return_value=['db1']))
+    cache.add_listener(listener)
+
+    cache.refresh_in_background()
+
+    assert cache.wait(5) == True
+    assert cache.minions == ['db1']
+    listener.assert_called_once_with(['db1'])
+
+
+def test_wait_returns_after_list_is_stored(cache_path):
+    """Test wait() doesn't return while the refreshed list is still being stored"""
+    cache = MinionCache(cache_path, 300, Mock(return_value=['db1']))
+    store = cache._set_minions
+
+    def slow_store(minions, timestamp):
+        time.sleep(0.2)
+        store(minions, timestamp)
+
+    cache._set_minions = slow_store
+    cache.refresh_in_background()
+
+    assert cache.wait(5) == True
+    assert cache.minions == ['db1']
+
+
+def test_wait_returns_after_failed_refresh(cache_path):
+    """Test a failed background refresh still releases wait() with the error recorded"""
+    cache = MinionCache(cache_path, 300, Mock(side_effect=MinionListError("boom")))
+
+    cache.refresh_in_background()
+
+    assert cache.wait(5) == True
+    assert cache.last_error == "boom"
+    assert cache.refreshing == False
+
+
+def test_fetch_minions_parses_output(mock_subprocess):
+    """Test parsing of salt-key JSON output"""
+    mock_subprocess.return_value.stdout = '{"minions": ["web1", "web2"]}'
+
+    assert fetch_minions(['salt-key']) == ['web1', 'web2']
+
+
+def test_fetch_minions_missing_key(mock_subprocess):
+    """Test that output without a 'minions' key raises MinionListError"""
+    mock_subprocess.return_value.stdout = '{"minions_pre": []}'
+
+    with pytest.raises(MinionListError):
+        fetch_minions(['salt-key'])
+
+
+def test_fetch_minions_timeout(mock_subprocess):
+    """Test that a slow salt-key raises MinionListError"""
+    mock_subprocess.side_effect = subprocess.TimeoutExpired('salt-key', 30)
+
+    with pytest.raises(MinionListError):
+        fetch_minions(['salt-key'], timeout=30)
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,120 @@
+"""Tests for results module"""
+
+import pytest
+from results import MinionResult, parse_salt_output, split_minion_sections
+
+
+HIGHSTATE = """web01:
+----------
+          ID: nginx
+    Function: pkg.installed
+      Result: True
+     Comment: The following packages were installed/updated: nginx
+     Started: 10:00:00.000000
+    Duration: 1500.0 ms
+     Changes:
+              ----------
+              nginx:
+                  ----------
+                  new:
+                      1.24
+                  old:
+
+Summary for web01
+------------
+Succeeded: 4 (changed=1)
+Failed:    0
+------------
+Total states run:     4
+Total run time:   1.750 s
+web02:
+----------
+          ID: nginx
+    Function: service.running
+      Result: False
+     Comment: Service nginx failed to start
+
+Summary for web02
+------------
+Succeeded: 3 (changed=2)
+Failed:    1
+------------
+Total states run:     4
+Total run time: 820.500 ms
+web03:
+    Minion did not return. [No response]
+"""
+
+
+def test_split_minion_sections():
+    """Test output is split at each targeted minion's header"""
+    sections = split_minion_sections("web01:\n    True\nweb02:\n    False\n", ['web01', 'web02'])
+    assert sections == [('web01', 'True'), ('web02', 'False')]
+
+
+def test_split_ignores_untargeted_headers():
+    """Test unindented lines that aren't targeted minions stay in the section"""
+    output = "web01:\n----------\n    Changes:\nSummary for web01\n"
+    sections = split_minion_sections(output, ['web01'])
+    assert len(sections) == 1
+    assert 'Summary for web01' in sections[0][1]
+
+
+def test_parse_highstate():
+    """Test highstate summaries are parsed per minion"""
+    results = parse_salt_output(HIGHSTATE, ['web01', 'web02', 'web03'], 'state.apply', 1)
+
+    assert [r.minion for r in results] == ['web01', 'web02', 'web03']
+    web01, web02, web03 = results
+    assert (web01.success, web01.changed_count, web01.failed_count) == (True, 1, 0)
+    assert web01.duration == pytest.approx(1.75)
+    assert (web02.success, web02.changed_count, web02.failed_count) == (False, 2, 1)
+    assert web02.duration == pytest.approx(0.8205)
+    assert web03.success == False
+    assert web03.changed_count is None
+    assert 'Minion did not return' in web03.payload
+
+
+def test_parse_ping():
+    """Test test.ping returns"""
+    results = parse_salt_output("web01:\n    True\nweb02:\n    False\n", ['web01', 'web02'], 'test.ping', 1)
+    assert [r.success for r in results] == [True, False]
+
+
+def test_parse_pkg_changes():
+    """Test changed packages are counted for pkg functions"""
+    output = """web01:
+    ----------
+    curl:
+        ----------
+        new:
+            8.1
+        old:
+            8.0
+    nginx:
+        ----------
+        new:
+            1.24
+        old:
+            1.22
+"""
+    results = parse_salt_output(output, ['web01'], 'pkg.upgrade', 0)
+    assert results == [MinionResult('web01', True, 2, None, None, results[0].payload)]
+
+
+def test_parse_unknown_success_on_failure():
+    """Test success is unknown when salt failed and the output doesn't say which minion"""
+    output = "web01:\n    ok\nweb02:\n    Failed to restart foo.service\n"
+    results = parse_salt_output(output, ['web01', 'web02'], 'cmd.run', 1)
+    assert [r.success for r in results] == [None, None]
+
+    results = parse_salt_output(output, ['web01', 'web02'], 'cmd.run', 0)
+    assert [r.success for r in results] == [True, True]
+
+
+def test_parse_no_minions():
+    """Test output without minion sections (e.g. a salt error) gives no results"""
+    assert parse_salt_output("Salt request timed out.\n", ['web01'], 'state.apply', 1) == []
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,215 @@
+"""Tests for retention module"""
+
+import os
+import sqlite3
+import pytest
+import database
+from datetime import datetime
+from database import SaltCtlDatabase
+from retention import RetentionPolicy, blob_size, live_size, _oldest_outputs
+
+
+def _log(db, command, hosts, output='output'):
+    command_id = db.log_command('user1', hosts, command, 0.0)
+    db.log_salt_output(command_id, 'apply', output, 0, [('web01', True, 0, 0, 1.0, output)])
+    db.update_command_duration(command_id, 1.0)
+    return command_id
+
+
+def _stored_outputs(db):
+    with db._get_connection() as conn:
+        return [row[0] for row in conn.execute('SELECT command_id FROM salt_outputs ORDER BY command_id')]
+
+
+def test_policy_enabled():
+    """Test a policy is only enabled when some limit is set"""
+    assert not RetentionPolicy().enabled
+    assert RetentionPolicy(keep_per_command=5).enabled
+
+
+def test_disabled_by_default(temp_db):
+    """Test nothing is dropped without a retention policy"""
+    ids = [_log(temp_db, 'push apply', ['web01']) for _ in range(5)]
+
+    assert temp_db.enforce_retention(ids) == 0
+    assert _stored_outputs(temp_db) == ids
+
+
+def test_keep_per_hosts(temp_db):
+    """Test only the newest outputs per host set are kept"""
+    temp_db.retention = RetentionPolicy(keep_per_hosts=2)
+    web = [_log(temp_db, 'push apply', ['web01', 'web02']) for _ in range(4)]
+    db = [_log(temp_db, 'push apply', ['db01']) for _ in range(2)]
+
+    assert _stored_outputs(temp_db) == web[2:] + db
+    # The command entries themselves stay
+    assert len(temp_db.get_command_history()) == 6
+
+
+def test_keep_per_command(temp_db):
+    """Test only the newest outputs per command are kept"""
+    temp_db.retention = RetentionPolicy(keep_per_command=1)
+    pushes = [_log(temp_db, f'push apply', [f'web0{i}']) for i in range(3)]
+    ping = _log(temp_db, 'ping', ['web01'])
+
+    assert _stored_outputs(temp_db) == [pushes[-1], ping]
+
+
+def test_output_days(temp_db):
+    """Test outputs past the age limit are dropped but their history and summaries kept"""
+    temp_db.RETENTION_STEP_SIZE = 2
+    old = [_log(temp_db, 'push apply', ['web01']) for _ in range(3)]
+    with temp_db._get_connection() as conn:
+        conn.execute("UPDATE command_history SET epoch = epoch - 40 * 86400")
+    temp_db.retention = RetentionPolicy(output_days=30)
+
+    # Dropped a bounded step at a time
+    recent = _log(temp_db, 'push apply', ['web01'])
+    assert _stored_outputs(temp_db) == [old[2], recent]
+    temp_db.enforce_retention()
+    assert _stored_outputs(temp_db) == [recent]
+
+    assert [row[0] for row in temp_db.get_command_history()] == [recent] + old[::-1]
+    assert temp_db.get_minion_results(old[0])[0][:2] == ('web01', True)
+    assert temp_db.get_minion_output(old[0], 'web01') is None
+    assert temp_db.get_minion_output(recent, 'web01') == 'output'
+
+
+def test_output_days_drops_imported_outputs(temp_db, tmp_path):
+    """Test old outputs imported after newer local ones (so with higher IDs) are still dropped"""
+    local = _log(temp_db, 'push apply', ['web01'])
+    other = SaltCtlDatabase(str(tmp_path / 'other.db'))
+    _log(other, 'push apply', ['db01'])
+    with other._get_connection() as conn:
+        conn.execute("UPDATE command_history SET epoch = epoch - 40 * 86400")
+    other.close()
+    temp_db.import_history(str(tmp_path / 'other.db'))
+    assert len(_stored_outputs(temp_db)) == 2
+
+    temp_db.retention = RetentionPolicy(output_days=30)
+    assert temp_db.enforce_retention() == 1
+    assert _stored_outputs(temp_db) == [local]
+
+
+def test_oldest_outputs_walk_epoch_index(temp_db):
+    """Test the age and size steps read outputs in command time order from an index, unsorted"""
+    _log(temp_db, 'push apply', ['web01'])
+    with temp_db._get_connection() as conn:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        _oldest_outputs(conn.cursor(), 20, before=0)
+        conn.set_trace_callback(None)
+        plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statements[-1]))
+
+    assert 'USING COVERING INDEX idx_salt_outputs_command_epoch' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_max_db_size(temp_db):
+    """Test the oldest outputs are dropped while the database is over its size limit"""
+    ids = [_log(temp_db, 'push apply', ['web01'], os.urandom(20000).hex()) for _ in range(20)]
+    with temp_db._get_connection() as conn:
+        size = live_size(conn.cursor())
+    temp_db.retention = RetentionPolicy(max_db_size=size // 2)
+    temp_db.RETENTION_STEP_SIZE = 3
+
+    for _ in range(10):
+        temp_db.enforce_retention()
+
+    with temp_db._get_connection() as conn:
+        assert live_size(conn.cursor()) <= size // 2
+    stored = _stored_outputs(temp_db)
+    assert 0 < len(stored) < 20
+    assert stored == ids[-len(stored):]
+
+
+def test_max_db_size_counts_blobs(tmp_path):
+    """Test blob store files count towards the size limit, once per file"""
+    db = SaltCtlDatabase(str(tmp_path / 'history.db'), blob_threshold=1024)
+    try:
+        shared = os.urandom(20000).hex()
+        ids = []
+        for payload in [os.urandom(20000).hex() for _ in range(10)] + [shared, shared]:
+            command_id = db.log_command('user1', ['web01'], 'push apply', 0.0)
+            db.log_salt_output(command_id, 'apply', 'summary', 0, [('web01', True, 0, 0, 1.0, payload)])
+            db.update_command_duration(command_id, 1.0)
+            ids.append(command_id)
+        with db._get_connection() as conn:
+            pages = live_size(conn.cursor())
+            blobs = blob_size(conn.cursor())
+        assert blobs == db.blobs.usage()[1]
+        db.retention = RetentionPolicy(max_db_size=pages + blobs // 2)
+        db.RETENTION_STEP_SIZE = 2
+
+        for _ in range(10):
+            db.enforce_retention()
+
+        with db._get_connection() as conn:
+            assert live_size(conn.cursor()) + blob_size(conn.cursor()) <= pages + blobs // 2
+        stored = _stored_outputs(db)
+        assert 0 < len(stored) < 12
+        assert stored == ids[-len(stored):]
+    finally:
+        db.close()
+
+
+def test_dropped_outputs_leave_search_index(temp_db):
+    """Test dropped outputs can't be found by search and the index stays consistent"""
+    if not temp_db.search_available:
+        pytest.skip("SQLite built without FTS5")
+    temp_db.retention = RetentionPolicy(keep_per_command=1)
+    _log(temp_db, 'push apply', ['web01'], 'nginx failed to start')
+    newest = _log(temp_db, 'push apply', ['web01'], 'nginx started')
+
+    assert [row[0] for row in temp_db.search_outputs('nginx')] == [newest]
+    with temp_db._get_connection() as conn:
+        conn.execute("INSERT INTO output_fts (output_fts) VALUES ('integrity-check')")
+
+
+def test_write_behind_enforces_retention(temp_db):
+    """Test the writer thread takes a retention step after each batch"""
+    from database import SaltCtlDatabase
+    db = SaltCtlDatabase(temp_db.db_path, write_behind=True,
+                         retention=RetentionPolicy(keep_per_command=2))
+    try:
+        ids = [_log(db, 'push apply', ['web01']) for _ in range(5)]
+        db.flush()
+        assert _stored_outputs(db) == ids[-2:]
+    finally:
+        db.close()
+
+
+
+def test_dropped_outputs_release_blobs(tmp_path):
+    """Test outputs (and per-minion payloads) dropped from the blob store have their files removed"""
+    db = SaltCtlDatabase(str(tmp_path / 'history.db'), blob_threshold=1024,
+                         retention=RetentionPolicy(keep_per_command=1))
+    try:
+        ids = []
+        for _ in range(3):
+            command_id = db.log_command('user1', ['web01'], 'push apply', 0.0)
+            db.log_salt_output(command_id, 'apply', os.urandom(4000).hex(), 0,
+                               [('web01', True, 0, 0, 1.0, os.urandom(4000).hex())])
+            db.update_command_duration(command_id, 1.0)
+            ids.append(command_id)
+
+        assert _stored_outputs(db) == ids[-1:]
+        assert len(list(db.blobs.hashes())) == 2
+    finally:
+        db.close()
+
+
+def test_failed_step_kept_for_the_shell(temp_db, monkeypatch, capsys):
+    """Test a failed step is recorded for the shell to report rather than printed"""
+    temp_db.retention = RetentionPolicy(keep_per_command=1)
+
+    def fail(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database, 'select_outputs', fail)
+    assert temp_db.enforce_retention() == 0
+    assert str(temp_db.retention_error) == "disk I/O error"
+    assert capsys.readouterr() == ('', '')
+
+
+# vim: set ts=4 sw=4 et:
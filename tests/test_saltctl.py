@@ -2,7 +2,7 @@
 
 import pytest
 from unittest.mock import Mock
-from saltctl import SaltCtlShell
+from saltctl import SaltCtlShell, split_script
 
 
 def test_build_salt_cmd_with_sudo():
@@ -77,4 +77,145 @@ def test_update_prompt_without_hosts():
     assert shell.prompt == "saltctl> "
 
 
+def test_split_script():
+    """Test splitting script text into command lines"""
+    text = """
+# deploy web
+select web; push test
+  push apply  ;
+
+status
+"""
+    assert split_script(text) == ['select web', 'push test', 'push apply', 'status']
+
+
+def _script_shell(failing=()):
+    """Mock shell whose run_command fails for the given command lines"""
+    shell = Mock(spec=SaltCtlShell)
+    shell.prompt = "saltctl> "
+    ran = []
+
+    def run_command(cmdLine):
+        ran.append(cmdLine)
+        shell.last_command_failed = cmdLine in failing
+        return cmdLine == 'exit'
+
+    shell.run_command = run_command
+    shell.wait_for_jobs.return_value = False
+    return shell, ran
+
+
+def test_run_script_success():
+    """Test a script where every command succeeds exits 0"""
+    shell, ran = _script_shell()
+
+    status = SaltCtlShell.run_script(shell, ['select web', 'push test'])
+
+    assert status == 0
+    assert ran == ['select web', 'push test']
+
+
+def test_run_script_stops_on_failure():
+    """Test a failing command stops the script with a non-zero status"""
+    shell, ran = _script_shell(failing=('push test',))
+
+    status = SaltCtlShell.run_script(shell, ['select web', 'push test', 'push apply'])
+
+    assert status == 1
+    assert ran == ['select web', 'push test']
+
+
+def test_run_script_keep_going():
+    """Test keep_going runs every command but still reports failure"""
+    shell, ran = _script_shell(failing=('push test',))
+
+    status = SaltCtlShell.run_script(shell, ['push test', 'status'], keep_going=True)
+
+    assert status == 1
+    assert ran == ['push test', 'status']
+
+
+def test_run_script_failed_background_job():
+    """Test a failed background job makes the script fail"""
+    shell, ran = _script_shell()
+    shell.wait_for_jobs.return_value = True
+
+    status = SaltCtlShell.run_script(shell, ['push apply &'])
+
+    assert status == 1
+
+
+def test_run_script_exit():
+    """Test 'exit' ends the script early"""
+    shell, ran = _script_shell()
+
+    status = SaltCtlShell.run_script(shell, ['status', 'exit', 'push apply'])
+
+    assert status == 0
+    assert ran == ['status', 'exit']
+
+
+def test_background_job_uses_its_own_context(fake_salt):
+    """Test a background job keeps its host selection and history ID"""
+    shell = SaltCtlShell(interactive=False)
+    shell.wait_for_minions()
+
+    shell.run_command('select web')
+    shell.run_command('push test &')
+    shell.run_command('select db')
+    shell.run_command('ping')
+    foreground_id = shell.last_command_id
+    assert shell.wait_for_jobs() == False
+
+    job = shell.jobs.list()[0]
+    assert job.command_id is not None
+    assert job.command_id != foreground_id
+    assert "--list web01,web02" in job.output.getvalue()
+    salt_command, output, return_code = shell.db.get_salt_output(job.command_id)
+    assert "web01,web02" in output
+    assert shell.last_command_id == foreground_id
+
+
+def test_background_only_for_logged_commands(fake_salt, capsys):
+    """Test shell-only commands can't be started as jobs"""
+    shell = SaltCtlShell(interactive=False)
+
+    shell.run_command('status &')
+
+    assert shell.last_command_failed == True
+    assert "can't run in the background" in capsys.readouterr().out
+
+
+
+def test_commands_record_outcome(fake_salt):
+    """Test each logged command's success is recorded for 'stats'"""
+    shell = SaltCtlShell(interactive=False)
+    shell.wait_for_minions()
+
+    shell.run_command('select web')
+    shell.run_command('ping')
+    shell.run_command('systemctl restart failing')
+
+    stats = {row.key: row for row in shell.db.command_stats('verb')}
+    assert stats['ping'].failure_rate == 0.0
+    assert stats['systemctl'].failure_rate == 1.0
+
+
+def test_report_database_errors(capsys):
+    """Test failed history writes and retention steps are reported once, at the next prompt"""
+    shell = Mock(spec=SaltCtlShell)
+    shell.db = Mock()
+    shell.db.write_error = RuntimeError("database is locked")
+    shell.db.retention_error = RuntimeError("disk I/O error")
+
+    SaltCtlShell.report_database_errors(shell)
+
+    out = capsys.readouterr().out
+    assert "Failed to write command history: database is locked" in out
+    assert "written with the next command" in out
+    assert "Failed to apply the retention policy: disk I/O error" in out
+    shell.db.clear_write_error.assert_called_once_with()
+    assert shell.db.retention_error is None
+
+
 # vim: set ts=4 sw=4 et:
@@ -0,0 +1,47 @@
+"""Tests for stats module"""
+
+import pytest
+from stats import BUCKET_GROWTH, bucket_limit, duration_bucket, summarize
+
+
+def test_duration_buckets():
+    """Test durations fall in the bucket whose limit is the next one up"""
+    assert duration_bucket(None) == 0
+    assert duration_bucket(0.0) == 0
+    assert duration_bucket(0.01) == 0
+    assert duration_bucket(0.02) == 4
+    for duration in (0.015, 0.3, 1.0, 12.5, 3600.0):
+        bucket = duration_bucket(duration)
+        assert bucket_limit(bucket - 1) < duration <= bucket_limit(bucket)
+
+
+def test_summarize_percentiles():
+    """Test percentiles are read from the histogram and capped at the longest run"""
+    rows = [
+        ('push', duration_bucket(1.0), 90, 90, 9, 1.0),
+        ('push', duration_bucket(60.0), 10, 10, 1, 55.0),
+        ('ping', duration_bucket(0.2), 5, 0, 0, 0.2),
+    ]
+
+    push, ping = summarize(rows)
+
+    assert push.key == 'push' and push.commands == 100
+    assert 1.0 <= push.p50 < 1.0 * BUCKET_GROWTH
+    assert push.p95 == 55.0
+    assert push.longest == 55.0
+    assert push.failure_rate == 0.1
+    assert ping.failure_rate is None
+
+
+def test_summarize_merges_duplicate_buckets():
+    """Test rows for the same key and bucket are added up"""
+    bucket = duration_bucket(2.0)
+
+    (stats,) = summarize([('ping', bucket, 2, 2, 0, 1.5), ('ping', bucket, 3, 1, 1, 2.0)])
+
+    assert stats.commands == 5
+    assert stats.failure_rate == 1 / 3
+    assert stats.longest == 2.0
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,87 @@
+"""Tests for swaplock module"""
+
+import threading
+import pytest
+from swaplock import SwapLock
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / 'history.db.lock')
+
+
+def test_shared_holders_exclude_exclusive(lock_path):
+    """Test the exclusive lock waits for every shared holder, then times out"""
+    shell = SwapLock(lock_path)
+    other = SwapLock(lock_path)
+
+    with shell.shared(), other.shared():
+        with SwapLock(lock_path).exclusive(timeout=0.05) as locked:
+            assert locked == False
+
+    with SwapLock(lock_path).exclusive(timeout=0.05) as locked:
+        assert locked == True
+    shell.close()
+    other.close()
+
+
+def test_exclusive_holds_off_shared(lock_path):
+    """Test a transaction waits while the lock is held exclusively"""
+    swap = SwapLock(lock_path)
+    shell = SwapLock(lock_path)
+    entered = threading.Event()
+
+    def transaction():
+        with shell.shared():
+            entered.set()
+
+    with swap.exclusive(timeout=1) as locked:
+        assert locked == True
+        thread = threading.Thread(target=transaction)
+        thread.start()
+        assert not entered.wait(0.1)
+    thread.join(timeout=5)
+    assert entered.is_set()
+    swap.close()
+    shell.close()
+
+
+def test_threads_hold_the_lock_separately(lock_path):
+    """Test one thread letting go doesn't release another thread's shared hold"""
+    lock = SwapLock(lock_path)
+    release = threading.Event()
+    holding = threading.Event()
+
+    def transaction():
+        with lock.shared():
+            holding.set()
+            release.wait(5)
+        lock.release_thread()
+
+    thread = threading.Thread(target=transaction)
+    thread.start()
+    holding.wait(5)
+    # Nested holds are counted; only the outermost one releases
+    with lock.shared():
+        with lock.shared():
+            pass
+    with SwapLock(lock_path).exclusive(timeout=0.05) as locked:
+        assert locked == False
+    release.set()
+    thread.join(timeout=5)
+    lock.close()
+
+
+def test_exclusive_keeps_own_shared_hold(lock_path):
+    """Test a thread inside a transaction gets its shared hold back afterwards"""
+    lock = SwapLock(lock_path)
+
+    with lock.shared():
+        with lock.exclusive(timeout=0.05) as locked:
+            assert locked == True
+        with SwapLock(lock_path).exclusive(timeout=0.05) as locked:
+            assert locked == False
+    lock.close()
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,68 @@
+"""Tests for timing module"""
+
+import json
+import pytest
+from timing import PhaseTimer
+
+
+def test_disabled_timer_records_nothing():
+    """Test that phases are no-ops while the timer is disabled"""
+    timer = PhaseTimer()
+
+    assert timer.begin('startup') is None
+    with timer.phase('database init'):
+        pass
+
+    assert timer.sections == []
+
+
+def test_phases_recorded_in_order_with_nesting():
+    """Test that nested phases are recorded after their parent with depth"""
+    timer = PhaseTimer()
+    timer.enabled = True
+
+    section = timer.begin('push test')
+    with timer.phase('execute'):
+        with timer.phase('subprocess wait'):
+            pass
+    with timer.phase('db writes'):
+        pass
+
+    names = [(p['phase'], p['depth']) for p in section.phases]
+    assert names == [('execute', 0), ('subprocess wait', 1), ('db writes', 0)]
+    assert all(p['seconds'] >= 0 for p in section.phases)
+    assert 'Timings for push test:' in section.format()
+
+
+def test_phase_recorded_when_block_raises():
+    """Test that a phase is still timed when its block raises"""
+    timer = PhaseTimer()
+    timer.enabled = True
+    section = timer.begin('startup')
+
+    with pytest.raises(RuntimeError):
+        with timer.phase('config files'):
+            raise RuntimeError("boom")
+
+    assert section.phases[0]['phase'] == 'config files'
+
+
+def test_dump_json(tmp_path):
+    """Test dumping recorded sections as JSON"""
+    timer = PhaseTimer()
+    timer.enabled = True
+    section = timer.begin('startup')
+    with timer.phase('load commands'):
+        pass
+    timer.record(section, 'salt-key (background)', 1.5)
+
+    path = tmp_path / 'timings.json'
+    timer.dump_json(str(path))
+
+    data = json.loads(path.read_text())
+    assert data['sections'][0]['label'] == 'startup'
+    phases = [p['phase'] for p in data['sections'][0]['phases']]
+    assert phases == ['load commands', 'salt-key (background)']
+
+
+# vim: set ts=4 sw=4 et:
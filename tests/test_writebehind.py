@@ -0,0 +1,155 @@
+"""Tests for writebehind module"""
+
+import threading
+import time
+import pytest
+from writebehind import WriteBehindQueue
+
+
+def test_batches_applied_in_order():
+    """Test queued operations are applied in order, grouped into batches"""
+    batches = []
+    writer = WriteBehindQueue(batches.append, commit_delay=0.2)
+
+    for i in range(5):
+        writer.put(('op', i))
+    writer.flush()
+
+    assert [op for batch in batches for op in batch] == [('op', i) for i in range(5)]
+    assert len(batches) == 1
+    writer.close()
+
+
+def test_flush_cuts_commit_delay_short():
+    """Test flush doesn't wait out the group commit delay"""
+    writer = WriteBehindQueue(lambda batch: None, commit_delay=10)
+    writer.put(('op', 1))
+
+    start = time.monotonic()
+    assert writer.flush(timeout=5) == True
+    assert time.monotonic() - start < 1
+    assert writer.pending == 0
+    writer.close()
+
+
+def test_max_batch():
+    """Test batches are capped at max_batch operations"""
+    batches = []
+    writer = WriteBehindQueue(batches.append, commit_delay=0.2, max_batch=3)
+
+    for i in range(7):
+        writer.put(('op', i))
+    writer.flush()
+
+    assert all(len(batch) <= 3 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 7
+    writer.close()
+
+
+class FlakyWriter:
+    """apply_batch stand-in that fails while broken is set"""
+
+    def __init__(self):
+        self.broken = True
+        self.batches = []
+
+    def __call__(self, batch):
+        if self.broken:
+            raise RuntimeError("disk full")
+        self.batches.append(list(batch))
+
+    @property
+    def applied(self):
+        return [op for batch in self.batches for op in batch]
+
+
+def test_failed_batch_is_kept():
+    """Test a failed batch is kept for a retry, and the error recorded"""
+    apply = FlakyWriter()
+    writer = WriteBehindQueue(apply, commit_delay=0)
+    writer.put(('op', 1))
+
+    assert writer.flush() == False
+    assert writer.pending == 0
+    assert writer.failed == 1
+    assert str(writer.last_error) == "disk full"
+    assert apply.applied == []
+
+    # flush() retries it in the calling thread
+    apply.broken = False
+    assert writer.flush() == True
+    assert writer.failed == 0
+    assert writer.last_error is None
+    assert apply.applied == [('op', 1)]
+    writer.close()
+
+
+def test_failed_batch_written_ahead_of_next():
+    """Test the writer thread retries a failed batch before later operations"""
+    apply = FlakyWriter()
+    writer = WriteBehindQueue(apply, commit_delay=0)
+    writer.put(('op', 1))
+    writer.flush()
+
+    apply.broken = False
+    writer.put(('op', 2))
+    writer.flush()
+
+    assert apply.batches == [[('op', 1), ('op', 2)]]
+    assert writer.last_error is None
+    writer.close()
+
+
+def test_close_retries_failed_batch():
+    """Test close makes a last attempt at failed batches, keeping them if it fails"""
+    apply = FlakyWriter()
+    writer = WriteBehindQueue(apply, commit_delay=0)
+    writer.put(('op', 1))
+    writer.close()
+
+    assert writer.failed == 1
+    assert writer.last_error is not None
+
+    apply.broken = False
+    writer.close()
+    assert writer.failed == 0
+    assert apply.applied == [('op', 1)]
+
+
+def test_close_flushes_and_restarts():
+    """Test close writes everything queued, and the writer restarts on the next put"""
+    applied = []
+    writer = WriteBehindQueue(applied.extend, commit_delay=10)
+    writer.put(('op', 1))
+    writer.close()
+    assert applied == [('op', 1)]
+
+    writer.put(('op', 2))
+    writer.flush()
+    assert applied == [('op', 1), ('op', 2)]
+    writer.close()
+
+
+def test_concurrent_producers():
+    """Test operations from many threads are all applied"""
+    applied = []
+    writer = WriteBehindQueue(applied.extend, commit_delay=0.01)
+
+    def produce(n):
+        for i in range(100):
+            writer.put((n, i))
+
+    threads = [threading.Thread(target=produce, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.flush()
+
+    assert len(applied) == 400
+    for n in range(4):
+        assert [op for op in applied if op[0] == n] == [(n, i) for i in range(100)]
+    writer.close()
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,100 @@
+"""Startup and per-command timing instrumentation for SaltCtl"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class TimingSection:
+    """Timings recorded for one startup or one command run"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.time()
+        self.phases: List[Dict] = []
+
+    def add(self, name: str, duration: float, depth: int = 0):
+        self.phases.append({'phase': name, 'seconds': duration, 'depth': depth})
+
+    def format(self) -> str:
+        """Format the section as an indented table of phase durations"""
+        lines = [f"Timings for {self.label}:"]
+        for phase in self.phases:
+            name = '  ' * phase['depth'] + phase['phase']
+            lines.append(f"  {name:<30} {phase['seconds'] * 1000:10.2f} ms")
+        return '\n'.join(lines)
+
+    def to_dict(self) -> Dict:
+        return {'label': self.label, 'started': self.started, 'phases': self.phases}
+
+
+class PhaseTimer:
+    """
+    Record monotonic durations of named phases
+
+    Does nothing until enabled, so phases can be wrapped unconditionally.
+    Each thread records into the section it last began.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sections: List[TimingSection] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin(self, label: str) -> Optional[TimingSection]:
+        """Start a new section for the current thread"""
+        if not self.enabled:
+            return None
+        section = TimingSection(label)
+        with self._lock:
+            self.sections.append(section)
+        self._local.section = section
+        self._local.depth = 0
+        return section
+
+    @property
+    def current(self) -> Optional[TimingSection]:
+        """The section the current thread is recording into"""
+        return getattr(self._local, 'section', None)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as a phase of the current section"""
+        section = self.current if self.enabled else None
+        if section is None:
+            yield
+            return
+
+        depth = self._local.depth
+        # Reserve the slot now so nested phases are listed after their parent
+        index = len(section.phases)
+        section.add(name, 0.0, depth)
+        self._local.depth = depth + 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            section.phases[index]['seconds'] = time.monotonic() - start
+            self._local.depth = depth
+
+    def record(self, section: Optional[TimingSection], name: str, duration: float):
+        """Record a phase measured elsewhere (e.g. on a background thread)"""
+        if self.enabled and section is not None:
+            section.add(name, duration)
+
+    def dump_json(self, path: str):
+        """Write all recorded sections to a JSON file"""
+        with self._lock:
+            data = [section.to_dict() for section in self.sections]
+        with open(path, 'w') as f:
+            json.dump({'sections': data}, f, indent=2)
+
+
+# Process-wide timer shared by the shell, database and commands
+timer = PhaseTimer()
+
+
+# vim: set ts=4 sw=4 et:
@@ -0,0 +1,167 @@
+"""Write-behind queue for the SaltCtl history database"""
+
+import queue
+import threading
+from typing import Callable, List, Optional
+
+# Queue markers (never counted as pending writes)
+_FLUSH = object()
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Apply queued writes on a dedicated thread, committing them in groups
+
+    Callers put() operations and carry on. The writer thread takes the
+    first queued operation, keeps collecting for up to commit_delay
+    seconds (or until a flush is requested), then hands the whole batch
+    to apply_batch, which writes it in a single transaction.
+
+    A batch that fails is kept, not dropped: it is retried ahead of the
+    next batch, and synchronously by flush() and close(). last_error
+    holds the failure until a write succeeds, for the caller to report.
+    """
+
+    def __init__(self, apply_batch: Callable[[List[tuple]], None],
+                 commit_delay: float = 0.05, max_batch: int = 500,
+                 name: str = 'saltctl-db-writer'):
+        self._apply_batch = apply_batch
+        self.commit_delay = commit_delay
+        self.max_batch = max_batch
+        self._name = name
+        self._queue: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._done = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        # Operations from failed batches, oldest first (guarded by _done).
+        # _write_lock keeps them ahead of anything queued after them
+        self._failed: List[tuple] = []
+        self._write_lock = threading.RLock()
+        self.last_error: Optional[Exception] = None
+
+    @property
+    def pending(self) -> int:
+        """Operations queued or being written"""
+        with self._done:
+            return self._pending
+
+    @property
+    def failed(self) -> int:
+        """Operations from failed batches, waiting to be retried"""
+        with self._done:
+            return len(self._failed)
+
+    def in_writer_thread(self) -> bool:
+        return getattr(self._local, 'writer', False)
+
+    def put(self, op: tuple):
+        """Queue an operation for the writer thread"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+        with self._done:
+            self._pending += 1
+        self._queue.put(op)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until everything queued so far is committed
+
+        Operations from failed batches are retried in the calling thread.
+
+        Returns:
+            False if the timeout expired first, or a retry failed again
+        """
+        if self.in_writer_thread():
+            return True
+        with self._done:
+            idle = self._pending == 0
+        if not idle:
+            # Cut the current batch's commit delay short
+            self._queue.put(_FLUSH)
+            with self._done:
+                if not self._done.wait_for(lambda: self._pending == 0, timeout):
+                    return False
+        return self._write([])
+
+    def close(self):
+        """
+        Flush and stop the writer thread (it restarts on the next put)
+
+        Failed batches get a last try; if that fails too they stay
+        queued, and last_error says why.
+        """
+        with self._start_lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+        self._write([])
+
+    def _next_batch(self) -> tuple:
+        """Block for the next operation, then collect a batch; returns (batch, stop)"""
+        batch = []
+        op = self._queue.get()
+        while op is _FLUSH:
+            op = self._queue.get()
+        if op is _STOP:
+            return batch, True
+        batch.append(op)
+
+        stop = False
+        timeout = self.commit_delay
+        while len(batch) < self.max_batch:
+            try:
+                op = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is _STOP:
+                # Everything queued before the stop marker is already in the batch
+                stop = True
+                break
+            if op is _FLUSH:
+                timeout = 0
+                continue
+            batch.append(op)
+        return batch, stop
+
+    def _write(self, batch: List[tuple]) -> bool:
+        """Apply earlier failed operations and then batch; keep them all if that fails"""
+        with self._write_lock:
+            with self._done:
+                ops = self._failed + batch
+                self._failed = []
+            if not ops:
+                return True
+            try:
+                self._apply_batch(ops)
+            except Exception as e:
+                # A failed write mustn't take the shell down with it
+                with self._done:
+                    self._failed = ops
+                self.last_error = e
+                return False
+            self.last_error = None
+            return True
+
+    def _run(self):
+        self._local.writer = True
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            finally:
+                with self._done:
+                    self._pending -= len(batch)
+                    self._done.notify_all()
+
+
+# vim: set ts=4 sw=4 et: